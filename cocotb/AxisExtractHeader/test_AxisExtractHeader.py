@@ -35,35 +35,59 @@ either expressed or implied, of The Regents of the University of California.
 import itertools
 import logging
 import os
+import sys
 import binascii
 import cocotb_test.simulator
+import pytest
 
 import cocotb
 from cocotb.clock import Clock
-from cocotb.triggers import RisingEdge
+from cocotb.result import SimTimeoutError
+from cocotb.triggers import RisingEdge, with_timeout
 from cocotb.regression import TestFactory
 
 from cocotbext.axi import AxiStreamBus, AxiStreamFrame, AxiStreamSource, AxiStreamSink
 
+# shared testbench helpers in ../common
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.pipeline import FrameLengthDriver
+from common.header import HEADER_WIDTHS, HeaderScoreboard
+from common import matrix
+from common import buildcache
+from common.monitor import StreamMonitor
+from common.log import log_level
+from common.pause import cycle_pause, parse
+
 
 class TB(object):
     def __init__(self, dut):
         self.dut = dut
 
         self.log = logging.getLogger("cocotb.tb")
-        self.log.setLevel(logging.DEBUG)
+        # TB_LOG_LEVEL=DEBUG logs every frame, see common/log.py
+        self.log.setLevel(log_level())
 
         cocotb.fork(Clock(dut.clk, 4, units="ns").start())
 
         # connect TB source to DUT sink, and vice versa
-        # byte_lanes = 16 is workaround for https://github.com/alexforencich/cocotbext-axi/issues/46
-        self.source = AxiStreamSource(AxiStreamBus.from_prefix(dut, "sink"),     dut.clk, dut.reset, byte_lanes = 16)
-        self.sink =   AxiStreamSink  (AxiStreamBus.from_prefix(dut, "source"  ), dut.clk, dut.reset, byte_lanes = 16)
+        # byte_lanes is workaround for https://github.com/alexforencich/cocotbext-axi/issues/46
+        byte_lanes = len(dut.sink_tdata) // 8
+        self.source = AxiStreamSource(AxiStreamBus.from_prefix(dut, "sink"),     dut.clk, dut.reset, byte_lanes = byte_lanes)
+        self.sink =   AxiStreamSink  (AxiStreamBus.from_prefix(dut, "source"  ), dut.clk, dut.reset, byte_lanes = byte_lanes)
+        self.monitor = StreamMonitor(self.source, self.sink)
+        self.length = FrameLengthDriver(self.source, dut.sink_length)
+        # checks payload, header and source_length of every frame as it arrives
+        self.header_bytes = len(dut.header) // 8
+        self.scoreboard = HeaderScoreboard(dut, self.sink, self.header_bytes, log=self.log)
 
     def set_idle_generator(self, generator=None):
         if generator:
             self.source.set_pause_generator(generator())
 
+    def set_backpressure_generator(self, generator=None):
+        if generator:
+            self.sink.set_pause_generator(generator())
+
     async def reset(self):
         self.dut.reset.setimmediatevalue(0)
         await RisingEdge(self.dut.clk)
@@ -76,68 +100,49 @@ class TB(object):
         await RisingEdge(self.dut.clk)
 
 
-async def run_test(dut, payload_lengths=None, payload_data=None, header_lengths=None, idle_inserter=None):
+async def run_test(dut, payload_lengths=None, payload_data=None, idle_inserter=None, backpressure_inserter=None):
 
     tb = TB(dut)
 
     await tb.reset()
 
     tb.set_idle_generator(idle_inserter)
-
-    test_pkts = []
-    test_frames = []
-
-
-#    for payload in [payload_data(x) for x in payload_lengths()]:
-#        #payload[6] = b'\00'
-#        test_pkt = bytearray(payload)
-
-    for pkt_len in payload_lengths():
-        payload = payload_data(pkt_len)
-        #payload[6] = b'\00'
-        test_pkt = bytearray(payload)
-
-        tb.log.info(type('payload'))
-        tb.log.info("Sending packet: %s" % bytes(test_pkt))
-
-        test_pkts.append(test_pkt)
-        test_frame = AxiStreamFrame(test_pkt)
-        test_frames.append(test_frame)
-
-        tb.dut.sink_length = pkt_len
-
-        await tb.source.send(test_frame)
-
-    for test_pkt, test_frame in zip(test_pkts, test_frames):
-        tb.log.info("Waiting to receive packet on our sink.")
-        rx_frame = await tb.sink.recv()
-        rx_pkt = bytes(rx_frame)
-        tb.log.info("RX packet: %s", repr(rx_pkt))
-        # padded to 60 if the packet size is less than 60
-        padded_pkt = test_pkt.ljust(60, b'\x00')
-        #assert rx_frame.tdata == padded_pkt
-
-
-        await RisingEdge(dut.clk)
-        await RisingEdge(dut.clk)
-        await RisingEdge(dut.clk)
-        await RisingEdge(dut.clk)
-        await RisingEdge(dut.clk)
-        await RisingEdge(dut.clk)
-        await RisingEdge(dut.clk)
-        await RisingEdge(dut.clk)
-        await RisingEdge(dut.clk)
-
+    tb.set_backpressure_generator(backpressure_inserter)
+    tb.monitor.start()
+    tb.scoreboard.start()
+
+    # send back-to-back, each frame a distinct header followed by the payload
+    lengths = payload_lengths()
+    for i, pkt_len in enumerate(lengths):
+        header = bytes((i + k) & 0xff for k in range(tb.header_bytes))
+        payload = bytes(payload_data(pkt_len))
+        tb.scoreboard.expect(header, payload)
+        tb.length.push(tb.header_bytes + pkt_len)
+        await tb.source.send(AxiStreamFrame(header + payload))
+
+    try:
+        await with_timeout(tb.scoreboard.wait(len(lengths)), 100, 'us')
+    except SimTimeoutError:
+        tb.log.error("%d of %d frames received", tb.scoreboard.frames, len(lengths))
+    tb.length.stop()
+    tb.scoreboard.stop()
+    tb.log.info("%d frames sent, %d received, %d mismatches", len(lengths), tb.scoreboard.frames,
+        tb.scoreboard.mismatches)
+    assert tb.scoreboard.frames == len(lengths)
+    assert tb.scoreboard.mismatches == 0
+
+    tb.monitor.stop()
+    stats = tb.monitor.write("%s_%s_%s" % (dut._name, idle_inserter.__name__ if idle_inserter else "no_idle",
+        backpressure_inserter.__name__ if backpressure_inserter else "no_backpressure"))
+    tb.log.info("latency p50/p99/max %s/%s/%s cycles, %.3f beats per cycle", stats['latency_cycles']['p50'],
+        stats['latency_cycles']['p99'], stats['latency_cycles']['max'], stats['egress']['beats_per_cycle'] or 0)
+    tb.log.info("offered load %s", stats['offered_load'])
 
     assert tb.sink.empty()
 
     await RisingEdge(dut.clk)
     await RisingEdge(dut.clk)
 
-def cycle_pause():
-    return itertools.cycle([1, 1, 1, 0])
-
-
 def size_list():
     return list(range(1, 129))
 
@@ -146,7 +151,8 @@ def payload_size_list():
     return list(range(20, 21))
 
 def header_size_list():
-    return list(range(1, 4))
+    # header widths with generated RTL, see src/main/scala/corundum/AxisHeaderWidths.scala
+    return HEADER_WIDTHS
 
 
 def incrementing_payload(length):
@@ -156,10 +162,17 @@ def incrementing_payload(length):
 
 if cocotb.SIM_NAME:
 
+    # the matrix runner selects the payload lengths and idle inserter per job
+    payload_lengths = os.environ.get("TB_PAYLOAD_LENGTHS", "payload_size_list")
+    # TB_IDLE and TB_BACKPRESSURE also take a pause generator spec, see common/pause.py
+    idle = os.environ.get("TB_IDLE")
+    backpressure = os.environ.get("TB_BACKPRESSURE")
+
     factory = TestFactory(run_test)
-    factory.add_option("payload_lengths", [payload_size_list])
+    factory.add_option("payload_lengths", [globals()[payload_lengths]])
     factory.add_option("payload_data", [incrementing_payload])
-    factory.add_option("idle_inserter", [None, cycle_pause])
+    factory.add_option("idle_inserter", [None, cycle_pause] if idle is None else [globals().get(idle) or parse(idle)])
+    factory.add_option("backpressure_inserter", [None, cycle_pause] if backpressure is None else [parse(backpressure)])
     factory.generate_tests()
 
     #factory = TestFactory(run_test_pad)
@@ -180,32 +193,53 @@ rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', '..'))
 #pcie_rtl_dir = os.path.abspath(os.path.join(lib_dir, 'pcie', 'rtl'))
 
 
-def test_AxisExtractHeader(request):
-    dut = "AxisExtractHeader"
-    module = os.path.splitext(os.path.basename(__file__))[0]
-    toplevel = dut
+def sim_kwargs(dut="AxisExtractHeader", rtl_dir=rtl_dir):
+    return dict(
+        python_search=[tests_dir],
+        verilog_sources=[os.path.join(rtl_dir, f"{dut}.v")],
+        toplevel=dut,
+        module=os.path.splitext(os.path.basename(__file__))[0],
+    )
 
-    verilog_sources = [
-        os.path.join(rtl_dir, f"{dut}.v"),
-    ]
 
+def test_AxisExtractHeader(request):
     parameters = {}
 
     parameters['DATA_WIDTH'] = 16 * 8 #512
-    # divide by 8?
-    parameters['KEEP_WIDTH'] = parameters['DATA_WIDTH'] / 8
+    parameters['KEEP_WIDTH'] = parameters['DATA_WIDTH'] // 8
 
     extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
 
     sim_build = os.path.join(tests_dir, "sim_build",
         request.node.name.replace('[', '-').replace(']', ''))
 
-    cocotb_test.simulator.run(
-        python_search=[tests_dir],
-        verilog_sources=verilog_sources,
-        toplevel=toplevel,
-        module=module,
+    # compiled once per RTL source, parameters and simulator version, see common/buildcache.py
+    buildcache.run(
         parameters=parameters,
         sim_build=sim_build,
         extra_env=extra_env,
+        **sim_kwargs()
+    )
+
+
+@pytest.mark.parametrize("header_bytes", header_size_list())
+def test_AxisExtractHeader_width(request, header_bytes):
+    # build/rtl/AxisExtractHeader_<header_bytes>.v from 'sbt "runMain corundum.AxisHeaderWidthsVerilog"'
+    sim_build = os.path.join(tests_dir, "sim_build",
+        request.node.name.replace('[', '-').replace(']', ''))
+
+    buildcache.run(
+        sim_build=sim_build,
+        extra_env=dict(TB_PAYLOAD_LENGTHS="size_list"),
+        **sim_kwargs(f"AxisExtractHeader_{header_bytes}", os.path.join(rtl_dir, "build", "rtl"))
     )
+
+
+# parameter matrix, run all jobs concurrently with:
+# python test_AxisExtractHeader.py [-j WORKERS] [--shard I/N] [--list]
+# the SpinalHDL output has no Verilog parameters, its data width is fixed at generation
+MATRIX = matrix.expand("AxisExtractHeader",
+    env=dict(TB_PAYLOAD_LENGTHS=["payload_size_list", "size_list"], TB_IDLE=["None", "cycle_pause", "bernoulli:0.5", "markov:16:16"]))
+
+if __name__ == "__main__":
+    sys.exit(matrix.main(MATRIX, sim_kwargs(), os.path.join(tests_dir, "sim_build", "matrix")))
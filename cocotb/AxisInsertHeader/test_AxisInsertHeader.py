@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+
+Header and payload through AxisInsertHeader, scored against the reference
+model in common/header.py.
+
+The DUT is one of the AxisInsertHeader_<n> generated by
+corundum.AxisHeaderWidthsVerilog, one per header width of n bytes; the test
+takes the header width and data width from the ports. The header input is
+used on the first output beat of every frame, so it is switched to the next
+frame after the last beat out, while sink_length follows the frames in.
+
+"""
+
+import itertools
+import logging
+import os
+import sys
+
+import pytest
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.result import SimTimeoutError
+from cocotb.triggers import RisingEdge, with_timeout
+from cocotb.regression import TestFactory
+
+from cocotbext.axi import AxiStreamBus, AxiStreamFrame, AxiStreamSource, AxiStreamSink
+
+# shared testbench helpers in ../common
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.pipeline import FrameLengthDriver
+from common.header import HEADER_WIDTHS, HeaderScoreboard, header_value
+from common.monitor import StreamMonitor
+from common.log import log_level
+from common.pause import cycle_pause, parse
+from common import buildcache
+
+
+class TB(object):
+    def __init__(self, dut):
+        self.dut = dut
+
+        self.log = logging.getLogger("cocotb.tb")
+        # TB_LOG_LEVEL=DEBUG for more detail, see common/log.py
+        self.log.setLevel(log_level())
+
+        cocotb.start_soon(Clock(dut.clk, 4, units="ns").start())
+
+        byte_lanes = len(dut.sink_tdata) // 8
+        self.source = AxiStreamSource(AxiStreamBus.from_prefix(dut, "sink"), dut.clk, dut.reset, byte_lanes=byte_lanes)
+        self.sink = AxiStreamSink(AxiStreamBus.from_prefix(dut, "source"), dut.clk, dut.reset, byte_lanes=byte_lanes)
+        self.monitor = StreamMonitor(self.source, self.sink)
+        self.length = FrameLengthDriver(self.source, dut.sink_length)
+        # the header is sampled on the first beat out, so it follows the DUT output
+        self.header = FrameLengthDriver(self.sink, dut.header)
+        self.header_bytes = len(dut.header) // 8
+        self.scoreboard = HeaderScoreboard(dut, self.sink, self.header_bytes, insert=True, log=self.log)
+
+    def set_idle_generator(self, generator=None):
+        if generator:
+            self.source.set_pause_generator(generator())
+
+    def set_backpressure_generator(self, generator=None):
+        if generator:
+            self.sink.set_pause_generator(generator())
+
+    async def reset(self):
+        self.dut.sink_length.setimmediatevalue(0)
+        self.dut.header.setimmediatevalue(0)
+        self.dut.reset.setimmediatevalue(0)
+        await RisingEdge(self.dut.clk)
+        await RisingEdge(self.dut.clk)
+        self.dut.reset.value = 1
+        await RisingEdge(self.dut.clk)
+        await RisingEdge(self.dut.clk)
+        self.dut.reset.value = 0
+        await RisingEdge(self.dut.clk)
+        await RisingEdge(self.dut.clk)
+
+
+async def run_test(dut, payload_lengths=None, payload_data=None, idle_inserter=None, backpressure_inserter=None):
+
+    tb = TB(dut)
+
+    await tb.reset()
+
+    tb.set_idle_generator(idle_inserter)
+    tb.set_backpressure_generator(backpressure_inserter)
+    tb.monitor.start()
+    tb.scoreboard.start()
+
+    # send back-to-back, each payload with a distinct header
+    lengths = payload_lengths()
+    for i, pkt_len in enumerate(lengths):
+        header = bytes((i + k) & 0xff for k in range(tb.header_bytes))
+        payload = bytes(payload_data(pkt_len))
+        tb.scoreboard.expect(header, payload)
+        tb.header.push(header_value(header))
+        tb.length.push(pkt_len)
+        await tb.source.send(AxiStreamFrame(payload))
+
+    try:
+        await with_timeout(tb.scoreboard.wait(len(lengths)), 100, 'us')
+    except SimTimeoutError:
+        tb.log.error("%d of %d frames received", tb.scoreboard.frames, len(lengths))
+    tb.length.stop()
+    tb.header.stop()
+    tb.scoreboard.stop()
+    tb.monitor.stop()
+    tb.log.info("%d frames sent, %d received, %d mismatches", len(lengths), tb.scoreboard.frames,
+        tb.scoreboard.mismatches)
+    tb.monitor.write("%s_%s_%s" % (dut._name, idle_inserter.__name__ if idle_inserter else "no_idle",
+        backpressure_inserter.__name__ if backpressure_inserter else "no_backpressure"))
+    assert tb.scoreboard.frames == len(lengths)
+    assert tb.scoreboard.mismatches == 0
+    assert tb.sink.empty()
+
+
+def size_list():
+    # every payload length over the first beats, so every split of the header over two beats
+    return list(range(1, 129))
+
+
+def incrementing_payload(length):
+    return bytearray(itertools.islice(itertools.cycle(range(1, 256)), length))
+
+
+if cocotb.SIM_NAME:
+
+    factory = TestFactory(run_test)
+    factory.add_option("payload_lengths", [size_list])
+    factory.add_option("payload_data", [incrementing_payload])
+    # TB_IDLE and TB_BACKPRESSURE select one pause generator each, see common/pause.py
+    idle = os.environ.get("TB_IDLE")
+    backpressure = os.environ.get("TB_BACKPRESSURE")
+    factory.add_option("idle_inserter", [None, cycle_pause] if idle is None else [parse(idle)])
+    factory.add_option("backpressure_inserter", [None, cycle_pause] if backpressure is None else [parse(backpressure)])
+    factory.generate_tests()
+
+
+# cocotb-test
+
+tests_dir = os.path.dirname(__file__)
+rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', '..', 'build', 'rtl'))
+
+
+@pytest.mark.parametrize("header_bytes", HEADER_WIDTHS)
+def test_AxisInsertHeader(request, header_bytes):
+    dut = f"AxisInsertHeader_{header_bytes}"
+    sim_build = os.path.join(tests_dir, "sim_build",
+        request.node.name.replace('[', '-').replace(']', ''))
+
+    # compiled once per RTL source, parameters and simulator version, see common/buildcache.py
+    buildcache.run(
+        python_search=[tests_dir],
+        verilog_sources=[os.path.join(rtl_dir, f"{dut}.v")],
+        toplevel=dut,
+        module=os.path.splitext(os.path.basename(__file__))[0],
+        sim_build=sim_build,
+    )
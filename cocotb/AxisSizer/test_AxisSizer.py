@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+
+Random length frames through AxisUpSizer or AxisDownSizer, scored against the
+reference model in common/sizer.py.
+
+The DUT is either sizer as generated by corundum.AxisUpSizer (128 to 512 bits)
+or corundum.AxisDownSizer (512 to 128 bits); the test takes both widths from
+the ports. Frames are 1 up to TB_MAX_LENGTH bytes, beyond the 12-bit
+sink_length for jumbo frames, which the sizers only use modulo 4096.
+
+"""
+
+import logging
+import os
+import sys
+
+import numpy as np
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import ClockCycles, RisingEdge
+from cocotb.regression import TestFactory
+
+from cocotbext.axi import AxiStreamBus, AxiStreamFrame, AxiStreamSource
+
+# shared testbench helpers in ../common
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.pipeline import FrameLengthDriver
+from common.sizer import SizerScoreboard
+from common.log import log_level
+from common.pause import cycle_pause, parse
+from common import buildcache
+
+
+class TB(object):
+    def __init__(self, dut):
+        self.dut = dut
+
+        self.log = logging.getLogger("cocotb.tb")
+        # TB_LOG_LEVEL=DEBUG for more detail, see common/log.py
+        self.log.setLevel(log_level())
+
+        cocotb.start_soon(Clock(dut.clk, 4, units="ns").start())
+
+        self.source = AxiStreamSource(AxiStreamBus.from_prefix(dut, "sink"), dut.clk, dut.reset)
+        self.length = FrameLengthDriver(self.source, dut.sink_length)
+        # the scoreboard is the sink, it drives source_tready
+        self.scoreboard = SizerScoreboard(dut, len(dut.sink_tdata), log=self.log)
+
+    def set_idle_generator(self, generator=None):
+        if generator:
+            self.source.set_pause_generator(generator())
+
+    def set_backpressure_generator(self, generator=None):
+        if generator:
+            self.scoreboard.set_pause_generator(generator())
+
+    async def reset(self):
+        self.dut.sink_length.setimmediatevalue(0)
+        if hasattr(self.dut, "sink_drop"):
+            self.dut.sink_drop.setimmediatevalue(0)
+        self.dut.reset.setimmediatevalue(0)
+        await RisingEdge(self.dut.clk)
+        await RisingEdge(self.dut.clk)
+        self.dut.reset.value = 1
+        await RisingEdge(self.dut.clk)
+        await RisingEdge(self.dut.clk)
+        self.dut.reset.value = 0
+        await RisingEdge(self.dut.clk)
+        await RisingEdge(self.dut.clk)
+
+
+async def run_test(dut, payload_lengths=None, idle_inserter=None, backpressure_inserter=None):
+
+    tb = TB(dut)
+
+    await tb.reset()
+
+    tb.set_idle_generator(idle_inserter)
+    tb.set_backpressure_generator(backpressure_inserter)
+    tb.scoreboard.start()
+
+    rng = np.random.default_rng(int(os.environ.get("TB_SEED", "1")))
+    lengths = payload_lengths(rng)
+    for length in lengths.tolist():
+        frame = rng.integers(0, 256, length, dtype=np.uint8).tobytes()
+        tb.scoreboard.expect(frame)
+        tb.length.push(length)
+        await tb.source.send(AxiStreamFrame(frame))
+
+    # wait until all frames are out, or none came out for a while
+    received = -1
+    while tb.scoreboard.received < len(lengths) and tb.scoreboard.received != received:
+        received = tb.scoreboard.received
+        await ClockCycles(dut.clk, 10000)
+    tb.length.stop()
+    tb.scoreboard.stop()
+
+    mismatches = tb.scoreboard.check()
+    tb.log.info("%d frames sent, %d received in %d beats, %d mismatches", len(lengths),
+                tb.scoreboard.frames, tb.scoreboard.beats, mismatches)
+    for generator in (tb.source._pause_generator, tb.scoreboard._pause):
+        if generator is not None:
+            tb.log.info("offered load %s", generator.summary())
+    assert tb.scoreboard.frames == len(lengths)
+    assert mismatches == 0
+
+
+def random_lengths(rng):
+    return rng.integers(1, int(os.environ.get("TB_MAX_LENGTH", "9000")) + 1, int(os.environ.get("TB_FRAMES", "1000")))
+
+
+def size_list(rng):
+    # every partial last beat on both sides, for the widest bus
+    return np.arange(1, 257)
+
+
+if cocotb.SIM_NAME:
+
+    factory = TestFactory(run_test)
+    factory.add_option("payload_lengths", [size_list, random_lengths])
+    # TB_IDLE and TB_BACKPRESSURE select one pause generator each, see common/pause.py
+    idle = os.environ.get("TB_IDLE")
+    backpressure = os.environ.get("TB_BACKPRESSURE")
+    factory.add_option("idle_inserter", [None, cycle_pause] if idle is None else [parse(idle)])
+    factory.add_option("backpressure_inserter", [None, cycle_pause] if backpressure is None else [parse(backpressure)])
+    factory.generate_tests()
+
+
+# cocotb-test
+
+tests_dir = os.path.dirname(__file__)
+rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', '..', 'build', 'rtl'))
+
+
+def run_sizer(request, dut):
+    sim_build = os.path.join(tests_dir, "sim_build",
+        request.node.name.replace('[', '-').replace(']', ''))
+
+    # compiled once per RTL source, parameters and simulator version, see common/buildcache.py
+    buildcache.run(
+        python_search=[tests_dir],
+        verilog_sources=[os.path.join(rtl_dir, f"{dut}.v")],
+        toplevel=dut,
+        module=os.path.splitext(os.path.basename(__file__))[0],
+        sim_build=sim_build,
+    )
+
+
+def test_AxisUpSizer(request):
+    run_sizer(request, "AxisUpSizer")
+
+
+def test_AxisDownSizer(request):
+    run_sizer(request, "AxisDownSizer")
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+"""
+
+Type 4 frames through AxisWireguardKeyLookup with an external key LUT, the
+KeyTable of common/keytable.py, checked for the key on every frame out.
+
+The DUT is AxisWireguardKeyLookupExternal, generated by
+corundum.AxisWireguardKeyLookup with has_internal_test_lut = false.
+KeyLookupDriver drives key_in from the table two cycles after receiver, and
+key_out must be the key of the receiver index of the frame, byte reversed,
+along with its first beat out. Receivers outnumber the table slots, so slots
+are shared and hold the key loaded last. The DUT expects the key LUT to keep
+up with its output, so there is no backpressure, only idle cycles on the input.
+
+"""
+
+import collections
+import logging
+import os
+import sys
+
+import numpy as np
+import pytest
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import ClockCycles, RisingEdge
+from cocotb.regression import TestFactory
+
+from cocotbext.axi import AxiStreamBus, AxiStreamFrame, AxiStreamSource, AxiStreamSink
+
+# shared testbench helpers in ../common
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.keytable import KEY_BYTES, KeyLookupDriver, KeyTable, receiver_index
+from common.pipeline import FrameLengthDriver
+from common.log import log_level
+from common.pause import cycle_pause, parse
+from common import buildcache
+
+# WireGuard Type 4 header and tag, around the padded packet
+TYPE4_OVERHEAD = 32
+
+
+class TB(object):
+    def __init__(self, dut, table):
+        self.dut = dut
+
+        self.log = logging.getLogger("cocotb.tb")
+        # TB_LOG_LEVEL=DEBUG for more detail, see common/log.py
+        self.log.setLevel(log_level())
+
+        cocotb.start_soon(Clock(dut.clk, 4, units="ns").start())
+
+        byte_lanes = len(dut.sink_tdata) // 8
+        self.source = AxiStreamSource(AxiStreamBus.from_prefix(dut, "sink"), dut.clk, dut.reset, byte_lanes=byte_lanes)
+        self.sink = AxiStreamSink(AxiStreamBus.from_prefix(dut, "source"), dut.clk, dut.reset, byte_lanes=byte_lanes)
+        self.length = FrameLengthDriver(self.source, dut.sink_length)
+        self.table = table
+        self.lookup = KeyLookupDriver(dut, table)
+
+        # (receiver index, key_out) of the frames sent, in order
+        self.expected = collections.deque()
+        self.frames = 0
+        self.mismatches = 0
+        self._checker = None
+
+    def set_idle_generator(self, generator=None):
+        if generator:
+            self.source.set_pause_generator(generator())
+
+    async def reset(self):
+        self.dut.sink_length.setimmediatevalue(0)
+        self.dut.key_in.setimmediatevalue(0)
+        self.dut.reset.setimmediatevalue(0)
+        await RisingEdge(self.dut.clk)
+        await RisingEdge(self.dut.clk)
+        self.dut.reset.value = 1
+        await RisingEdge(self.dut.clk)
+        await RisingEdge(self.dut.clk)
+        self.dut.reset.value = 0
+        await RisingEdge(self.dut.clk)
+        await RisingEdge(self.dut.clk)
+
+    def start(self):
+        self.lookup.start()
+        if self._checker is None:
+            self._checker = cocotb.start_soon(self._check())
+
+    def stop(self):
+        self.lookup.stop()
+        if self._checker is not None:
+            self._checker.kill()
+            self._checker = None
+
+    async def _check(self):
+        # key_out is valid along with the first beat out of every frame
+        dut = self.dut
+        first = True
+        while True:
+            await RisingEdge(dut.clk)
+            if not (dut.source_tvalid.value and dut.source_tready.value):
+                continue
+            if first:
+                receiver, expected = self.expected.popleft()
+                key_out = dut.key_out.value.integer
+                if key_out != expected:
+                    self.mismatches += 1
+                    self.log.error("frame %d receiver 0x%08x: key_out %064x, expected %064x",
+                                   self.frames, receiver, key_out, expected)
+                self.frames += 1
+            first = bool(dut.source_tlast.value)
+
+
+def type4(receiver, counter, length, rng):
+    # type 4, reserved, receiver and counter little endian, then encrypted packet and tag
+    return (bytes([4, 0, 0, 0]) + receiver.to_bytes(4, 'little') + counter.to_bytes(8, 'little') +
+            rng.integers(0, 256, length - 16, dtype=np.uint8).tobytes())
+
+
+async def run_test(dut, payload_lengths=None, idle_inserter=None):
+
+    rng = np.random.default_rng(int(os.environ.get("TB_SEED", "1")))
+    # four receivers per slot, the last one loaded owns the slot
+    table = KeyTable(256)
+    receivers = rng.integers(0, 1 << 32, 4 * table.slots, dtype=np.uint64)
+    table.load(receivers, rng.integers(0, 256, (len(receivers), KEY_BYTES), dtype=np.uint8))
+
+    tb = TB(dut, table)
+
+    await tb.reset()
+
+    tb.set_idle_generator(idle_inserter)
+    tb.start()
+
+    lengths = payload_lengths(rng)
+    for counter, (length, receiver) in enumerate(zip(lengths.tolist(), rng.choice(receivers, len(lengths)).tolist())):
+        tb.expected.append((receiver, table.key_out(receiver)))
+        tb.length.push(length)
+        await tb.source.send(AxiStreamFrame(type4(receiver, counter, length, rng)))
+
+    # wait until all frames are out, or none came out for a while
+    frames = -1
+    while tb.frames < len(lengths) and tb.frames != frames:
+        frames = tb.frames
+        await ClockCycles(dut.clk, 1000)
+    tb.length.stop()
+    tb.stop()
+
+    tb.log.info("%d frames sent, %d received, %d key mismatches", len(lengths), tb.frames, tb.mismatches)
+    assert tb.frames == len(lengths)
+    assert tb.mismatches == 0
+
+
+def random_lengths(rng):
+    return rng.integers(TYPE4_OVERHEAD, int(os.environ.get("TB_MAX_LENGTH", "1500")) + 1,
+                        int(os.environ.get("TB_FRAMES", "1000")))
+
+
+def size_list(rng):
+    # shortest frames back-to-back, every length of the first beats
+    return np.arange(TYPE4_OVERHEAD, TYPE4_OVERHEAD + 64)
+
+
+if cocotb.SIM_NAME:
+
+    factory = TestFactory(run_test)
+    factory.add_option("payload_lengths", [size_list, random_lengths])
+    # TB_IDLE selects one pause generator, see common/pause.py
+    idle = os.environ.get("TB_IDLE")
+    factory.add_option("idle_inserter", [None, cycle_pause] if idle is None else [parse(idle)])
+    factory.generate_tests()
+
+
+# KeyTable, without simulator
+
+def test_receiver_index():
+    # the DUT outputs the little endian header bytes 4 to 7 most significant first
+    for receiver in (0, 1, 0x01020304, 0xfffffffe):
+        assert receiver_index(int.from_bytes(receiver.to_bytes(4, 'little'), 'big')) == receiver
+    assert receiver_index(0x01020304) == 0x04030201
+
+
+def test_load_last_write_wins():
+    table = KeyTable(16)
+    keys = np.arange(4 * KEY_BYTES, dtype=np.uint8).reshape(4, KEY_BYTES)
+    table.load([3, 19, 35, 4], keys)
+    assert bytes(table[3]) == keys[2].tobytes()
+    assert bytes(table[51]) == keys[2].tobytes()
+    assert bytes(table[4]) == keys[3].tobytes()
+    assert table.key_in(4) == int.from_bytes(keys[3].tobytes(), 'little')
+    assert table.key_out(4) == int.from_bytes(keys[3].tobytes(), 'big')
+    assert np.flatnonzero(table.dirty).tolist() == [3, 4]
+
+
+@pytest.mark.parametrize("base", [0, 0x20, 0xfe0])
+def test_bursts(base):
+    rng = np.random.default_rng(1)
+    table = KeyTable(1024)
+    receivers = np.concatenate((np.arange(100, 300), rng.integers(0, table.slots, 200)))
+    table.load(receivers, rng.integers(0, 256, (len(receivers), KEY_BYTES), dtype=np.uint8))
+
+    written = np.zeros(table.slots, dtype=bool)
+    for address, data in table.bursts(base):
+        # whole keys, at most 256 beats of 32 bits, within a 4 KiB page
+        assert len(data) % KEY_BYTES == 0 and 0 < len(data) <= 256 * 4
+        assert address // 4096 == (address + len(data) - 1) // 4096
+        first = (address - base) // KEY_BYTES
+        slots = np.arange(first, first + len(data) // KEY_BYTES)
+        assert not written[slots].any()
+        written[slots] = True
+        assert bytes(data) == table.keys[slots].tobytes()
+    assert (written == table.dirty).all()
+
+    with pytest.raises(ValueError):
+        list(table.bursts(base + 4))
+
+
+# cocotb-test
+
+tests_dir = os.path.dirname(__file__)
+rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', '..', 'build', 'rtl'))
+
+
+def test_AxisWireguardKeyLookup(request):
+    dut = "AxisWireguardKeyLookupExternal"
+    sim_build = os.path.join(tests_dir, "sim_build",
+        request.node.name.replace('[', '-').replace(']', ''))
+
+    # compiled once per RTL source, parameters and simulator version, see common/buildcache.py
+    buildcache.run(
+        python_search=[tests_dir],
+        verilog_sources=[os.path.join(rtl_dir, f"{dut}.v")],
+        toplevel=dut,
+        module=os.path.splitext(os.path.basename(__file__))[0],
+        sim_build=sim_build,
+    )
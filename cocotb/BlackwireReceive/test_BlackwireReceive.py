@@ -36,15 +36,10 @@ either expressed or implied, of The Regents of the University of California.
 import itertools
 import logging
 import os
+import sys
 import binascii
 import cocotb_test.simulator
 
-# create_tap
-import os
-import subprocess
-import getpass
-import fcntl
-import struct
 import time
 
 import cocotb
@@ -57,60 +52,23 @@ from cocotb.decorators import external
 from cocotbext.axi import AxiStreamBus, AxiStreamFrame, AxiStreamSource, AxiStreamSink
 from cocotbext.uart import UartSource, UartSink
 
-# based on an old example in CocoTB (which was removed upstream as it was unmaintained)
-# and an slightly updated fix mentioned in a CocoTB issue 
-def close_tap(name="tap0"):
-	cmd1='sudo tunctl -d %s' % name
-	print(cmd1)
-	subprocess.run(cmd1, shell=True)
-
-# Linux host interface TAP IP is hardcoded as 192.168.255.1 further
-# Linux apps <-> 192.168.255.1 <-> 192.168.255.2 <-> CocoTB <-> DUT
-def create_tap(name="tap0", ip="192.168.255.2"):
-	cocotb.log.info("Attempting to create interface %s (%s)" % (name, ip))
-	TUNSETIFF = 0x400454ca
-	TUNSETOWNER = TUNSETIFF + 2
-	#IFF_TUN = 0x0001
-	IFF_TAP= 0x0002
-	IFF_NO_PI = 0x1000
-	tun = open('/dev/net/tun', 'r+b', buffering=0)
-	tun_num = int(name.split('tap')[-1])
-	cmd1='sudo tunctl -u %s -t %s'% (getpass.getuser(), name)
-	print(cmd1)
-	subprocess.check_call(cmd1, shell=True)
-	subprocess.check_call('sudo ip link set %s up' % (name), shell=True)
-	subprocess.check_call('sudo ip addr add 192.168.255.1 peer %s dev %s' % (ip, name), shell=True)
-
-	while True:
-		try:
-			name = 'tap{}'.format(tun_num)
-			ifr = struct.pack('16sH', name.encode('utf-8'), IFF_TAP | IFF_NO_PI)
-			print('ifr', ifr.hex())
-			cocotb.log.info(name)
-			fcntl.ioctl(tun, TUNSETIFF, ifr)
-			break
-		except IOError as e:
-			# Errno 16 if tun device already exists, otherwise this
-			# failed for different reason.
-			if e.errno != 16:
-				raise e
-
-		tun_num += 1
-	subprocess.check_call('sudo ip link set address aa:bb:cc:22:22:22 dev %s' % name, shell=True)
-    # Prevent ICMP as first packets, forcibly set ARP cache
-	subprocess.check_call('sudo arp -s %s aa:bb:cc:11:11:11' % ip, shell=True)
-
-	fcntl.ioctl(tun, TUNSETOWNER, os.getuid())
-	name = 'tap{}'.format(tun_num)
-	cocotb.log.info("Created interface %s (%s)" % (name, ip))
-	return tun,name
+# shared testbench helpers in ../common
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.tap import create_tap, close_tap, TapBridge
+from common.monitor import StreamMonitor
+from common.log import log_level
+from common.replay import PcapReplay
+from common.bench import SCENARIOS, Results, compare, load, results_path, run_scenario
+from common.traffic import TYPE4_KEY
+from common import buildcache
 
 class TB(object):
     def __init__(self, dut):
         self.dut = dut
 
         self.log = logging.getLogger("cocotb.tb")
-        self.log.setLevel(logging.DEBUG)
+        # TB_LOG_LEVEL=DEBUG logs every frame, see common/log.py
+        self.log.setLevel(log_level())
 
         # simulate 322 MHz clock on clk
         cocotb.fork(Clock(dut.clk, 3, units="ns").start())
@@ -121,16 +79,22 @@ class TB(object):
         # in case no TKEEP[] signals are used
         self.source = AxiStreamSource(AxiStreamBus.from_prefix(dut, "sink"  ), dut.clk, dut.reset)
         self.sink =   AxiStreamSink  (AxiStreamBus.from_prefix(dut, "source"), dut.clk, dut.reset)
+        self.monitor = StreamMonitor(self.source, self.sink)
 
         # TB source driving DUT UART rx pin
         #self.uart_source = UartSource(dut.uart_rxd, baud=115200)
         #self.uart_sink = UartSink(dut.uart_txd, baud=115200)
 
-        # Create a TAP device
-        tap, tapname = create_tap()
-        self.tap = tap
-        self.tapname = tapname
-        self.tapfd = tap.fileno()
+        # TB_REPLAY=capture.pcap(ng) replays a capture into the DUT, TB_TAP=1 bridges
+        # a TAP interface (needs root) until the simulation is stopped, otherwise
+        # the benchmark scenarios of common/bench.py run
+        self.replay_path = os.environ.get("TB_REPLAY")
+        self.tap_mode = self.replay_path is None and os.environ.get("TB_TAP", "0") != "0"
+        if self.tap_mode:
+            tap, tapname = create_tap()
+            self.tap = tap
+            self.tapname = tapname
+            self.tapfd = tap.fileno()
 
     def set_idle_generator(self, generator=None):
         if generator:
@@ -148,46 +112,51 @@ class TB(object):
         await RisingEdge(self.dut.clk)
         self.log.info("Out of reset")
         
-    async def tapit(self):
-        pkts_sent = 0
-        pkts_rcvd = 0
-        while True:
-            # assume Ethernet frame on TB sink
-            frame_tb2tap = True
-            try:
-                # poll on TB sink
-                rx_frame = self.sink.recv_nowait()
-            except:
-                # No Ethernet frame on TB sink
-                frame_tb2tap = False
-                await RisingEdge(self.dut.clk)
-            if (frame_tb2tap == True):
-                # forward Ethernet frame from TB to TAP
-                rx_pkt = bytes(rx_frame)
-                self.log.info("tapit() passing Ethernet frame from TB to TAP: %s" % bytes(rx_pkt).hex())
-                os.set_blocking(self.tapfd, True)
-                packet = os.write(self.tapfd, rx_pkt)
-                pkts_sent += 1
-
-            # assume Ethernet frame on TAP interface
-            frame_tap2tb = True
-            try:
-                # poll on TAP interface 
-                os.set_blocking(self.tapfd, False)
-                packet = os.read(self.tapfd, 16 * 1024)
-            except:
-                frame_tap2tb = False
-                await RisingEdge(self.dut.clk)
-            if (frame_tap2tb == True):
-                # forward Ethernet frame from TAP to TB
-                tx_pkt = bytearray(packet)
-                self.log.info("--- Passing packet received on TAP to TB: %s" % bytes(tx_pkt).hex())
-                tx_frame = AxiStreamFrame(tx_pkt)
-                self.dut.sink_length.value = len(tx_pkt)
-                await self.source.send(tx_frame)
-                pkts_rcvd += 1
-            if (pkts_rcvd + pkts_sent > 4):
-                break
+    async def replay(self):
+        # DUT output goes to $TB_REPLAY_OUT, by default next to the replayed capture
+        capture = os.environ.get("TB_REPLAY_OUT", os.path.splitext(self.replay_path)[0] + "_%s.pcap" % self.dut._name)
+        replay = PcapReplay(self.replay_path, self.source, self.sink, capture=capture, log=self.log)
+        self.monitor.start()
+        try:
+            await replay.run()
+        finally:
+            self.monitor.stop()
+            self.monitor.write("%s_replay" % self.dut._name)
+
+    async def tapit(self, frames=None):
+        # bridge frames between TAP and DUT until 'frames' frames passed, or forever if None
+        bridge = TapBridge(self.tapfd, self.source, self.sink, log=self.log)
+        bridge.start()
+        self.monitor.start()
+        try:
+            await bridge.wait(frames)
+        finally:
+            bridge.stop()
+            self.monitor.stop()
+            self.monitor.write("%s_tap" % self.dut._name)
+
+    async def bench(self, scenario):
+        # TB_BENCH_FRAMES frames of the scenario, results merged into bench/<dut>_<commit>.json
+        frames = int(os.environ.get("TB_BENCH_FRAMES", "10000"))
+        seed = int(os.environ.get("TB_SEED", "1"))
+        # frames out pair with frames in by the Type 4 receiver index and counter at this byte offset
+        offset = int(os.environ.get("TB_BENCH_KEY_OFFSET", TYPE4_KEY.start))
+        metrics = await run_scenario(scenario, self.monitor, frames, seed=seed, offset=offset, log=self.log)
+        self.monitor.write("%s_%s" % (self.dut._name, scenario))
+        self.log.info("%s: %s", scenario, metrics)
+
+        dut = self.dut._name
+        results = Results(results_path(dut), dut)
+        results.update(scenario, metrics)
+
+        # BENCH_BASELINE=bench/baseline.json fails on metrics worse by more than BENCH_THRESHOLD
+        baseline = os.environ.get("BENCH_BASELINE")
+        if baseline:
+            threshold = float(os.environ.get("BENCH_THRESHOLD", "0.05"))
+            regressions = compare(results.data, load(baseline), threshold, scenarios=[scenario])
+            for _, metric, then, now in regressions:
+                self.log.error("%s %s regressed from %s to %s", scenario, metric, then, now)
+            assert not regressions
 
     async def uart_exercise(self, payload_lengths=None, payload_data=None):
 
@@ -219,7 +188,7 @@ class TB(object):
 
             self.log.info("Read data: %s", rx_data)
 
-async def run_test(dut, payload_lengths=None, payload_data=None, header_lengths=None, idle_inserter=None):
+async def run_test(dut, payload_lengths=None, payload_data=None, header_lengths=None, idle_inserter=None, scenario=None):
 
     tb = TB(dut)
 
@@ -237,62 +206,22 @@ async def run_test(dut, payload_lengths=None, payload_data=None, header_lengths=
     #tb.log.info("started uart_thread")
     #await uart_thread
 
-    #t1 = cocotb.start_soon(tb.tapit())
-    #tb.log.info("started t1")
-    #await t1
-
-    while False:
-        await RisingEdge(dut.clk)
-
-
-    while True:
-        tb.log.info("Waiting for packets on TAP")
-        packet = os.read(tb.tapfd, 2048)
-        test_pkt = bytearray(packet)
-
-        #tb.log.info(type('payload'))
-        tb.log.info("Passing packet received on TAP to DUT: %s" % bytes(test_pkt).hex())
-
-        #test_pkts.append(test_pkt)
-        test_frame = AxiStreamFrame(test_pkt)
-        #test_frames.append(test_frame)
-
-        #tb.dut.sink_length.value = len(test_pkt) #pkt_len
-
-        await tb.source.send(test_frame)
-
-    #for test_pkt, test_frame in zip(test_pkts, test_frames):
-        tb.log.info("Waiting to receive packet on our DUT sink.")
-        rx_frame = await tb.sink.recv()
-        rx_pkt = bytes(rx_frame)
-        #tb.log.info("RX packet: %s", repr(rx_pkt))
-        tb.log.info("RX packet: %s", rx_pkt.hex())
-        # padded to 60 if the packet size is less than 60
-        padded_pkt = test_pkt.ljust(60, b'\x00')
-        #assert rx_frame.tdata == padded_pkt
-        os.write(tb.tapfd, padded_pkt)
-
-
-        await RisingEdge(dut.clk)
-        await RisingEdge(dut.clk)
-        await RisingEdge(dut.clk)
-        await RisingEdge(dut.clk)
-        await RisingEdge(dut.clk)
-        await RisingEdge(dut.clk)
-        await RisingEdge(dut.clk)
-        await RisingEdge(dut.clk)
-        await RisingEdge(dut.clk)
-
+    # replay $TB_REPLAY, bridge Linux traffic through the DUT until the simulation is stopped,
+    # or run a benchmark scenario
+    if tb.replay_path:
+        t1 = cocotb.start_soon(tb.replay())
+    elif tb.tap_mode:
+        t1 = cocotb.start_soon(tb.tapit())
+    else:
+        t1 = cocotb.start_soon(tb.bench(scenario))
+    tb.log.info("started t1")
+    await t1
 
     assert tb.sink.empty()
 
     await RisingEdge(dut.clk)
     await RisingEdge(dut.clk)
 
-def cycle_pause():
-    return itertools.cycle([1, 1, 1, 0])
-
-
 def size_list():
     return list(range(1, 129))
 
@@ -315,6 +244,13 @@ if cocotb.SIM_NAME:
     factory.add_option("payload_lengths", [payload_size_list])
     factory.add_option("payload_data", [incrementing_payload])
     factory.add_option("idle_inserter", [None]) #, cycle_pause
+    # one test per benchmark scenario, TB_BENCH=imix,mtu_flood selects some;
+    # replay and TAP bridging run once
+    if os.environ.get("TB_REPLAY") or os.environ.get("TB_TAP", "0") != "0":
+        scenarios = [None]
+    else:
+        scenarios = os.environ.get("TB_BENCH", ",".join(SCENARIOS)).split(",")
+    factory.add_option("scenario", scenarios)
     factory.generate_tests()
 
     #factory = TestFactory(run_test_pad)
@@ -350,12 +286,13 @@ def test_Finka(request):
     # divide by 8?
     #parameters['KEEP_WIDTH'] = parameters['DATA_WIDTH'] / 8
 
-    #extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
+    extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
 
     sim_build = os.path.join(tests_dir, "sim_build",
         request.node.name.replace('[', '-').replace(']', ''))
 
-    cocotb_test.simulator.run(
+    # compiled once per RTL source, parameters and simulator version, see common/buildcache.py
+    buildcache.run(
         python_search=[tests_dir],
         verilog_sources=verilog_sources,
         toplevel=toplevel,
@@ -35,79 +35,40 @@ either expressed or implied, of The Regents of the University of California.
 import itertools
 import logging
 import os
+import sys
 import binascii
 import cocotb_test.simulator
 
-# create_tap
-import os
-import subprocess
-import getpass
-import fcntl
-import struct
 import time
 
+import numpy as np
+
 import cocotb
 from cocotb.clock import Clock
-from cocotb.triggers import RisingEdge
+from cocotb.triggers import ClockCycles, RisingEdge
 from cocotb.regression import TestFactory
 from cocotb.decorators import external
 
 from cocotbext.axi import AxiStreamBus, AxiStreamFrame, AxiStreamSource, AxiStreamSink
 
-# based on an old example in CocoTB (which was removed upstream as it was unmaintained)
-# and an slightly updated fix mentioned in a CocoTB issue 
-def close_tap(name="tap0"):
-	cmd1='sudo tunctl -d %s' % name
-	print(cmd1)
-	subprocess.run(cmd1, shell=True)
-
-# Linux host interface TAP IP is hardcoded as 192.168.255.1 further
-# Linux apps <-> 192.168.255.1 <-> 192.168.255.2 <-> CocoTB <-> DUT
-def create_tap(name="tap0", ip="192.168.255.2"):
-	cocotb.log.info("Attempting to create interface %s (%s)" % (name, ip))
-	TUNSETIFF = 0x400454ca
-	TUNSETOWNER = TUNSETIFF + 2
-	#IFF_TUN = 0x0001
-	IFF_TAP= 0x0002
-	IFF_NO_PI = 0x1000
-	tun = open('/dev/net/tun', 'r+b', buffering=0)
-	tun_num = int(name.split('tap')[-1])
-	cmd1='sudo tunctl -u %s -t %s'% (getpass.getuser(), name)
-	print(cmd1)
-	subprocess.check_call(cmd1, shell=True)
-	subprocess.check_call('sudo ip link set %s up' % (name), shell=True)
-	subprocess.check_call('sudo ip addr add 192.168.255.1 peer %s dev %s' % (ip, name), shell=True)
-
-	while True:
-		try:
-			name = 'tap{}'.format(tun_num)
-			ifr = struct.pack('16sH', name.encode('utf-8'), IFF_TAP | IFF_NO_PI)
-			print('ifr', ifr.hex())
-			cocotb.log.info(name)
-			fcntl.ioctl(tun, TUNSETIFF, ifr)
-			break
-		except IOError as e:
-			# Errno 16 if tun device already exists, otherwise this
-			# failed for different reason.
-			if e.errno != 16:
-				raise e
-
-		tun_num += 1
-	subprocess.check_call('sudo ip link set address aa:bb:cc:22:22:22 dev %s' % name, shell=True)
-    # Prevent ICMP as first packets, forcibly set ARP cache
-	subprocess.check_call('sudo arp -s %s aa:bb:cc:11:11:11' % ip, shell=True)
-
-	fcntl.ioctl(tun, TUNSETOWNER, os.getuid())
-	name = 'tap{}'.format(tun_num)
-	cocotb.log.info("Created interface %s (%s)" % (name, ip))
-	return tun,name
+# shared testbench helpers in ../common
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.tap import create_tap, close_tap, TapBridge
+from common.monitor import StreamMonitor
+from common.log import log_level
+from common.replay import PcapReplay
+from common.classify import CLASSES, ClassifierScoreboard
+from common.pipeline import FrameLengthDriver
+from common.traffic import TYPES, TrafficGenerator
+from common import buildcache
 
 class TB(object):
     def __init__(self, dut):
         self.dut = dut
 
         self.log = logging.getLogger("cocotb.tb")
-        self.log.setLevel(logging.DEBUG)
+        # TB_LOG_LEVEL=DEBUG logs every frame, see common/log.py
+        self.log.setLevel(log_level())
 
         cocotb.fork(Clock(dut.clk, 4, units="ns").start())
 
@@ -116,11 +77,20 @@ class TB(object):
         # in case no TKEEP[] signals are used
         self.source = AxiStreamSource(AxiStreamBus.from_prefix(dut, "sink"),     dut.clk, dut.reset) #, byte_lanes = 16)
         self.sink =   AxiStreamSink  (AxiStreamBus.from_prefix(dut, "source"  ), dut.clk, dut.reset) #, byte_lanes = 16)
-
-        tap,tapname = create_tap()
-        self.tap = tap
-        self.tapname = tapname
-        self.tapfd = tap.fileno()
+        self.monitor = StreamMonitor(self.source, self.sink)
+        # checks the is_* outputs of every frame against the reference classifier
+        self.scoreboard = ClassifierScoreboard(dut, log=self.log)
+
+        # TB_REPLAY=capture.pcap(ng) replays a capture into the DUT instead of
+        # bridging a TAP interface, which needs neither root nor a network interface
+        self.replay_path = os.environ.get("TB_REPLAY")
+        # TB_TRAFFIC=N sends N generated frames instead, see common/traffic.py
+        self.traffic = int(os.environ.get("TB_TRAFFIC", "0"))
+        if self.replay_path is None and not self.traffic:
+            tap, tapname = create_tap()
+            self.tap = tap
+            self.tapname = tapname
+            self.tapfd = tap.fileno()
 
     def set_idle_generator(self, generator=None):
         if generator:
@@ -137,97 +107,63 @@ class TB(object):
         await RisingEdge(self.dut.clk)
         await RisingEdge(self.dut.clk)
 
-    # https://docs.python.org/3/library/asyncio-task.html
-#    async def tap():
-#        task1 = asyncio.create_task(
-#            tap2tb())
-#
-#        task2 = asyncio.create_task(
-#            tb2tap())
-#
-#        print(f"started at {time.strftime('%X')}")
-#
-#        await task1
-#        await task2
-#        print(f"stopped at {time.strftime('%X')}")
-
-    async def tapit(self):
-        pkts_sent = 0
-        pkts_rcvd = 0
-        while True:
-            # assume Ethernet frame on TB sink
-            frame_tb2tap = True
-            try:
-                # poll on TB sink
-                rx_frame = self.sink.recv_nowait()
-            except:
-                # No Ethernet frame on TB sink
-                frame_tb2tap = False
-                await RisingEdge(self.dut.clk)
-            if (frame_tb2tap == True):
-                # forward Ethernet frame from TB to TAP
-                rx_pkt = bytes(rx_frame)
-                self.log.info("tapit() passing Ethernet frame from TB to TAP: %s" % bytes(rx_pkt).hex())
-                os.set_blocking(self.tapfd, True)
-                packet = os.write(self.tapfd, rx_pkt)
-                pkts_sent += 1
-
-            # assume Ethernet frame on TAP interface
-            frame_tap2tb = True
-            try:
-                # poll on TAP interface 
-                os.set_blocking(self.tapfd, False)
-                packet = os.read(self.tapfd, 16 * 1024)
-            except:
-                frame_tap2tb = False
-                await RisingEdge(self.dut.clk)
-            if (frame_tap2tb == True):
-                # forward Ethernet frame from TAP to TB
-                tx_pkt = bytearray(packet)
-                self.log.info("--- Passing packet received on TAP to TB: %s" % bytes(tx_pkt).hex())
-                tx_frame = AxiStreamFrame(tx_pkt)
-                self.dut.sink_length.value = len(tx_pkt)
-                await self.source.send(tx_frame)
-                pkts_rcvd += 1
-            if (pkts_rcvd + pkts_sent > 4):
-                break
-
-
-    @cocotb.function
-    async def tap2tb(self):
-        print("TAP2TB One")
-        await time.sleep(5)
-        print("TAP2TB Two")
-        while False:
-            self.log.info("Waiting for packets on TAP")
-            packet = os.read(self.tapfd, 2048)
-            test_pkt = bytearray(packet)
-            self.log.info("Passing packet received on TAP to DUT: %s" % bytes(test_pkt))
-            test_frame = AxiStreamFrame(test_pkt)
-            self.dut.sink_length.value = len(test_pkt) #pkt_len
-            await self.source.send(test_frame)
-
-    @cocotb.function
-    async def tb2tap(self):
-        print("TB2TAP One")
-        await time.sleep(1)
-        print("TB2TAP Two")
-        while False:
-            err = False
-            self.log.info("Waiting to receive packet on TB sink.")
-            rx_frame = await self.sink.recv()
-            print(rx_frame)
-            rx_pkt = bytes(rx_frame)
-            self.log.info("Passing packet received on TB to TAP: %s" % rx_pkt)
-            packet = os.write(self.tapfd, rx_pkt, len(rx_pkt))
-
-    @cocotb.external
-    def call_tap2tb(self):
-        return self.tap2tb()
-
-    @cocotb.external
-    def call_tb2tap(self):
-        return self.tb2tap()
+    async def replay(self):
+        # DUT output goes to $TB_REPLAY_OUT, by default next to the replayed capture
+        capture = os.environ.get("TB_REPLAY_OUT", os.path.splitext(self.replay_path)[0] + "_%s.pcap" % self.dut._name)
+        replay = PcapReplay(self.replay_path, self.source, self.sink, capture=capture, length=self.dut.sink_length, log=self.log)
+        self.monitor.start()
+        try:
+            await replay.run()
+        finally:
+            self.monitor.stop()
+            self.monitor.write("%s_replay" % self.dut._name)
+
+    async def generate(self, frames):
+        # a mix of WireGuard, ARP and ICMP frames back-to-back, the DUT output is only counted
+        generator = TrafficGenerator(rng=np.random.default_rng(int(os.environ.get("TB_SEED", "1"))))
+        length = FrameLengthDriver(self.source, self.dut.sink_length)
+        received = 0
+
+        async def drain():
+            nonlocal received
+            while True:
+                await self.sink.recv()
+                received += 1
+
+        consumer = cocotb.start_soon(drain())
+        self.monitor.start()
+        try:
+            types = await generator.send(self.source, frames, length=length)
+            # until all frames are out, or none came out for a while
+            last = -1
+            while last != received < frames:
+                last = received
+                await ClockCycles(self.dut.clk, 10000)
+        finally:
+            consumer.kill()
+            length.stop()
+            self.monitor.stop()
+            self.monitor.write("%s_traffic" % self.dut._name)
+        # the classes the scoreboard should have counted
+        names = ['type123' if TYPES[t] in ('type1', 'type2', 'type3') else TYPES[t] for t in range(len(TYPES))]
+        counts = dict.fromkeys(CLASSES, 0)
+        for t, n in enumerate(np.bincount(types, minlength=len(TYPES)).tolist()):
+            counts[names[t]] += n
+        return counts
+
+    async def tapit(self, frames=5):
+        # bridge frames between TAP and DUT until 'frames' frames passed, or forever if None
+        bridge = TapBridge(self.tapfd, self.source, self.sink, length=self.dut.sink_length, log=self.log)
+        bridge.start()
+        self.monitor.start()
+        try:
+            await bridge.wait(frames)
+        finally:
+            bridge.stop()
+            self.monitor.stop()
+            self.monitor.write("%s_tap" % self.dut._name)
+
+
 
 async def run_test(dut, payload_lengths=None, payload_data=None, header_lengths=None, idle_inserter=None):
 
@@ -240,18 +176,21 @@ async def run_test(dut, payload_lengths=None, payload_data=None, header_lengths=
     test_pkts = []
     test_frames = []
 
-    #await tb.tapit()
-
-    #t1 = cocotb.start_soon(external(tb.tap2tb()))
-    #tb.log.info("started t1")
-    #t2 = cocotb.start_soon(external(tb.tb2tap()))
-    #tb.log.info("started t2")
-    #await t1
-    #await t2
-
-    t1 = cocotb.start_soon(tb.tapit())
+    tb.scoreboard.start()
+    if tb.replay_path:
+        t1 = cocotb.start_soon(tb.replay())
+    elif tb.traffic:
+        t1 = cocotb.start_soon(tb.generate(tb.traffic))
+    else:
+        t1 = cocotb.start_soon(tb.tapit())
     tb.log.info("started t1")
-    await t1
+    expected = await t1
+    tb.scoreboard.stop()
+
+    assert tb.scoreboard.check() == 0
+    tb.log.info("Classified %d frames: %s", tb.scoreboard.frames, tb.scoreboard.counts)
+    if tb.traffic:
+        assert tb.scoreboard.counts == expected
 
     while False:
         tb.log.info("Waiting for packets on TAP")
@@ -296,10 +235,6 @@ async def run_test(dut, payload_lengths=None, payload_data=None, header_lengths=
     await RisingEdge(dut.clk)
     await RisingEdge(dut.clk)
 
-def cycle_pause():
-    return itertools.cycle([1, 1, 1, 0])
-
-
 def size_list():
     return list(range(1, 129))
 
@@ -362,7 +297,8 @@ def test_CorundumFrameMatchWireguard(request):
     sim_build = os.path.join(tests_dir, "sim_build",
         request.node.name.replace('[', '-').replace(']', ''))
 
-    cocotb_test.simulator.run(
+    # compiled once per RTL source, parameters and simulator version, see common/buildcache.py
+    buildcache.run(
         python_search=[tests_dir],
         verilog_sources=verilog_sources,
         toplevel=toplevel,
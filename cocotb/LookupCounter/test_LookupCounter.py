@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+
+Random lookup, increment and clear streams through LookupCounter, scored
+against the cycle model in common/lookupcounter.py.
+
+The DUT is LookupCounter as generated by corundum.LookupCounter: 1024 words,
+startValue 1, endValue 2^64 - 1, no restart, RAM initialized.
+
+"""
+
+import logging
+import os
+import sys
+
+import numpy as np
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import FallingEdge, RisingEdge
+from cocotb.regression import TestFactory
+
+# shared testbench helpers in ../common
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.lookupcounter import LookupCounterModel, random_stream
+from common.log import log_level
+from common import buildcache
+
+START_VALUE = 1
+END_VALUE = (1 << 64) - 1
+RESTART = False
+
+
+class TB(object):
+    def __init__(self, dut):
+        self.dut = dut
+
+        self.log = logging.getLogger("cocotb.tb")
+        # TB_LOG_LEVEL=DEBUG logs every mismatch, see common/log.py
+        self.log.setLevel(log_level())
+
+        cocotb.start_soon(Clock(dut.clk, 4, units="ns").start())
+
+        self.word_count = 1 << len(dut.io_address)
+        self.model = LookupCounterModel(self.word_count, START_VALUE, END_VALUE, RESTART)
+
+    async def reset(self):
+        self.dut.io_lookup.setimmediatevalue(0)
+        self.dut.io_increment.setimmediatevalue(0)
+        self.dut.io_clear.setimmediatevalue(0)
+        self.dut.io_address.setimmediatevalue(0)
+        self.dut.reset.setimmediatevalue(0)
+        await RisingEdge(self.dut.clk)
+        await RisingEdge(self.dut.clk)
+        self.dut.reset.value = 1
+        await RisingEdge(self.dut.clk)
+        await RisingEdge(self.dut.clk)
+        self.dut.reset.value = 0
+        await RisingEdge(self.dut.clk)
+        await RisingEdge(self.dut.clk)
+
+    async def drive(self, stream):
+        """Drive the inputs one cycle each, returns the counter output of every one of those cycles."""
+        dut = self.dut
+        observed = np.zeros(len(stream['address']), dtype=np.uint64)
+        for i, (lookup, increment, clear, address) in enumerate(zip(
+                stream['lookup'].tolist(), stream['increment'].tolist(),
+                stream['clear'].tolist(), stream['address'].tolist())):
+            # inputs change and the output is sampled half way the cycle
+            await FallingEdge(dut.clk)
+            if dut.io_counter.value.is_resolvable:
+                observed[i] = dut.io_counter.value.integer
+            dut.io_lookup.value = lookup
+            dut.io_increment.value = increment
+            dut.io_clear.value = clear
+            dut.io_address.value = address
+        await FallingEdge(dut.clk)
+        dut.io_lookup.value = 0
+        dut.io_clear.value = 0
+        return observed
+
+
+async def run_test(dut, burst=None, clear=None):
+
+    tb = TB(dut)
+
+    await tb.reset()
+
+    cycles = int(os.environ.get("TB_CYCLES", "20000"))
+    rng = np.random.default_rng(int(os.environ.get("TB_SEED", "1")))
+    stream = random_stream(cycles, tb.word_count, rng, clear=clear, burst=burst)
+    # LATENCY idle cycles flush the outputs of the last inputs
+    for name in ('lookup', 'increment', 'clear'):
+        stream[name] = np.append(stream[name], [False, False])
+    stream['address'] = np.append(stream['address'], [0, 0])
+
+    observed = await tb.drive(stream)
+    expected, valid = tb.model.run(**stream)
+
+    mismatches = np.flatnonzero(valid & (observed != expected))
+    for cycle in mismatches[:16]:
+        tb.log.error("Cycle %d: counter 0x%x, expected 0x%x", cycle, observed[cycle], expected[cycle])
+    tb.log.info("%d cycles, %d lookups, %d mismatches", len(valid), valid.sum(), len(mismatches))
+    assert not len(mismatches)
+
+
+if cocotb.SIM_NAME:
+
+    factory = TestFactory(run_test)
+    # bursts on one address exercise the d3, d4 and d5 hazard bypasses
+    factory.add_option("burst", [0.0, 0.8])
+    factory.add_option("clear", [0.0, 0.05])
+    factory.generate_tests()
+
+
+# cocotb-test
+
+tests_dir = os.path.dirname(__file__)
+rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', '..', 'build', 'rtl'))
+
+
+def test_LookupCounter(request):
+    dut = "LookupCounter"
+    module = os.path.splitext(os.path.basename(__file__))[0]
+
+    sim_build = os.path.join(tests_dir, "sim_build",
+        request.node.name.replace('[', '-').replace(']', ''))
+
+    # compiled once per RTL source, parameters and simulator version, see common/buildcache.py
+    buildcache.run(
+        python_search=[tests_dir],
+        verilog_sources=[os.path.join(rtl_dir, f"{dut}.v")],
+        toplevel=dut,
+        module=module,
+        sim_build=sim_build,
+    )
@@ -0,0 +1 @@
+"""Testbench helpers shared by the cocotb testbenches in this directory."""
@@ -0,0 +1,261 @@
+"""
+
+Benchmark scenarios for the Blackwire receive path, with versioned results
+and a regression check against a stored baseline.
+
+A scenario sends a fixed number of generated frames (common/traffic.py)
+back-to-back into the DUT and records what it achieves: frames and beats per
+cycle in and out, dropped frames and latency percentiles. Frames out pair
+with the frames in by their Type 4 receiver index and counter, so latency
+holds with drops as well. Every run writes
+its metrics per scenario to a results file stamped with the schema version,
+the git commit and the date, and compares them against a baseline results
+file; a metric worse than the baseline by more than the threshold (relative)
+is a regression.
+
+    python -m common.bench bench/BlackwireReceive_<commit>.json --baseline bench/baseline.json --threshold 0.05
+
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import logging
+import os
+import subprocess
+
+import numpy as np
+
+import cocotb
+from cocotb.triggers import ClockCycles
+
+from .monitor import percentile
+from .stash import IMIX
+from .traffic import TYPE4_KEY, TYPE_MIX, TYPES, TrafficGenerator
+
+SCHEMA = 2
+
+# name: TrafficGenerator arguments
+SCENARIOS = {
+    # minimum size Type 4 frames, 74 bytes with an empty packet
+    'min_flood': dict(mix=(('type4', 1),), sizes=((64, 1),)),
+    # maximum size Type 4 frames, 1514 bytes
+    'mtu_flood': dict(mix=(('type4', 1),), sizes=((1500, 1),)),
+    'imix': dict(mix=TYPE_MIX, sizes=IMIX),
+    # a quarter of the Type 4 frames repeats an older counter
+    'replay_mix': dict(mix=(('type4', 1),), sizes=IMIX, replay=0.25),
+    # many sessions with handshakes, one percent of them rekeyed every batch of frames
+    'key_churn': dict(mix=(('type4', 90), ('type1', 4), ('type2', 4), ('type3', 2)), sizes=IMIX, sessions=65536,
+                      churn=0.01, batch=1024),
+}
+
+# +1 if higher is better, -1 if lower is better
+METRICS = {
+    'frames_per_cycle': 1,
+    'beats_per_cycle': 1,
+    'drops': -1,
+    'latency_p50': -1,
+    'latency_p99': -1,
+}
+
+
+def git_commit(path=None):
+    """The short commit hash of the tree, or None outside a git work tree."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=path or os.path.dirname(__file__),
+                              capture_output=True, text=True, check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _key(receivers, counters):
+    # the receiver index and counter bytes of Type 4 frames, as in the frame
+    return [r.to_bytes(4, 'little') + c.to_bytes(8, 'little') for r, c in zip(receivers.tolist(), counters.tolist())]
+
+
+class Pairing(object):
+    """Pair the frames out of the DUT with the frames into it by the Type 4 receiver index and counter.
+
+    'batches' are the batches sent, as TrafficGenerator.send() lists them.
+    A frame out of the DUT pairs with the oldest unpaired Type 4 frame sent
+    with the same 12 key bytes, see TYPE4_KEY. A replayed counter pairs with
+    the original, as the replay is the one dropped. Frames out without a
+    pair are counted as unpaired.
+    """
+
+    def __init__(self, batches):
+        self.sent = collections.defaultdict(collections.deque)
+        i = 0
+        for batch in batches:
+            type4 = np.flatnonzero(batch.types == TYPES.index('type4'))
+            for j, key in zip((type4 + i).tolist(), _key(batch.receivers[type4], batch.counters[type4])):
+                self.sent[key].append(j)
+            i += len(batch.types)
+        self.unpaired = 0
+
+    def pair(self, key):
+        """The index of the frame sent with the receiver index and counter bytes 'key', or None."""
+        sent = self.sent.get(bytes(key))
+        if not sent:
+            self.unpaired += 1
+            return None
+        return sent.popleft()
+
+
+async def run_scenario(name, monitor, frames, length=None, seed=1, quiet=1000, offset=TYPE4_KEY.start, log=None):
+    """Send 'frames' frames of scenario 'name' into the DUT, returns its metrics.
+
+    'monitor' is the StreamMonitor on the source and sink of the DUT. At most
+    64 frames wait in the source queue, and the sink output is drained as it
+    arrives. The run ends 'quiet' cycles after the last frame came out once
+    all were sent, as dropped frames never do. Drops are the frames in that
+    did not come out, including those the DUT discards by design, such as
+    replays. Latency is from the first beat in to the first beat out of
+    every frame out that pairs with a Type 4 frame sent, see Pairing, so
+    drops do not shift it. 'offset' is where the DUT output carries the
+    receiver index and counter. 'length' is an optional FrameLengthDriver
+    for the sink_length of the DUT.
+    """
+    log = log if log is not None else logging.getLogger("cocotb.tb")
+    generator = TrafficGenerator(rng=np.random.default_rng(seed), **SCENARIOS[name])
+    source, sink = monitor.source, monitor.sink
+    received = []
+
+    async def drain():
+        while True:
+            rx_frame = await sink.recv()
+            received.append(bytes(rx_frame.tdata[offset:offset + 12]))
+
+    batches = []
+    consumer = cocotb.start_soon(drain())
+    monitor.start()
+    try:
+        await generator.send(source, frames, length=length, batches=batches)
+        await source.wait()
+        last = -1
+        while last != len(received):
+            last = len(received)
+            await ClockCycles(monitor.clock, quiet)
+    finally:
+        consumer.kill()
+        monitor.stop()
+
+    summary = monitor.summary()
+    ingress, egress = monitor.ingress, monitor.egress
+    frames_in = len(ingress.last)
+    frames_out = len(egress.last)
+    # from the first beat in to the last beat out, or in if nothing came out
+    end = egress.last[-1][0] if egress.last else (ingress.last[-1][0] if ingress.last else 0)
+    cycles = end - ingress.first[0][0] + 1 if ingress.first else 0
+
+    # the n-th frame received is the n-th frame out of the DUT, the i-th frame sent the i-th into it
+    pairing = Pairing(batches)
+    latencies = []
+    for (first_out, _), key in zip(egress.first, received):
+        i = pairing.pair(key)
+        if i is not None and i < len(ingress.first):
+            latencies.append(first_out - ingress.first[i][0])
+    latencies.sort()
+    if frames_out and not latencies:
+        log.warning("%s: none of the %d frames out carries the receiver index and counter of a frame sent "
+                    "at byte %d, no latency", name, frames_out, offset)
+    return {
+        'frames': frames,
+        'frames_in': frames_in,
+        'frames_out': frames_out,
+        'drops': frames_in - frames_out,
+        'unpaired': pairing.unpaired,
+        'cycles': cycles,
+        'frames_per_cycle': frames_out / cycles if cycles else None,
+        'ingress_frames_per_cycle': frames_in / cycles if cycles else None,
+        'beats_per_cycle': egress.beats / cycles if cycles else None,
+        'latency_p50': percentile(latencies, 50),
+        'latency_p99': percentile(latencies, 99),
+        'latency_max': latencies[-1] if latencies else None,
+        'offered_load': summary['offered_load'],
+    }
+
+
+class Results(object):
+    """A results file: the metrics per scenario of one DUT at one commit.
+
+    update() merges one scenario in and rewrites the file, so the scenarios
+    of a suite can run as separate tests.
+    """
+
+    def __init__(self, path, dut):
+        self.path = path
+        self.data = load(path) if os.path.exists(path) else {}
+        if self.data.get('schema') != SCHEMA or self.data.get('dut') != dut:
+            self.data = {'schema': SCHEMA, 'dut': dut, 'scenarios': {}}
+        self.data['commit'] = git_commit()
+        self.data['date'] = datetime.datetime.now().isoformat(timespec='seconds')
+
+    def update(self, scenario, metrics):
+        self.data['scenarios'][scenario] = metrics
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(self.data, f, indent=2, sort_keys=True)
+
+
+def results_path(dut, directory=None):
+    """bench/<dut>_<commit>.json, the directory defaults to $BENCH_DIR or bench/ in the working directory."""
+    directory = directory or os.environ.get('BENCH_DIR', 'bench')
+    return os.path.join(directory, "%s_%s.json" % (dut, git_commit() or 'nogit'))
+
+
+def load(path):
+    with open(path) as f:
+        data = json.load(f)
+    if data.get('schema') != SCHEMA:
+        raise ValueError("%s has results schema %s, expected %d" % (path, data.get('schema'), SCHEMA))
+    return data
+
+
+def compare(results, baseline, threshold=0.05, scenarios=None):
+    """Metrics worse than the baseline by more than 'threshold', relative, as (scenario, metric, baseline, now).
+
+    Only scenarios present in both are compared. A metric that was zero in
+    the baseline regresses on any change for the worse, and a metric the
+    baseline has that is now missing, such as a latency without any frame
+    out, always regresses.
+    """
+    regressions = []
+    for scenario, metrics in sorted(results['scenarios'].items()):
+        if scenarios is not None and scenario not in scenarios:
+            continue
+        base = baseline['scenarios'].get(scenario)
+        if base is None:
+            continue
+        for metric, direction in METRICS.items():
+            now, then = metrics.get(metric), base.get(metric)
+            if then is None:
+                continue
+            if now is None:
+                regressions.append((scenario, metric, then, now))
+                continue
+            worse = (then - now) * direction
+            if (worse > threshold * abs(then)) if then else (worse > 0):
+                regressions.append((scenario, metric, then, now))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare benchmark results against a baseline.")
+    parser.add_argument("results", help="results file to check")
+    parser.add_argument("--baseline", required=True, help="baseline results file")
+    parser.add_argument("--threshold", type=float, default=0.05, help="relative regression threshold")
+    args = parser.parse_args(argv)
+
+    results, baseline = load(args.results), load(args.baseline)
+    for scenario, metrics in sorted(results['scenarios'].items()):
+        print("%-10s %s" % (scenario, ", ".join("%s=%s" % (m, metrics.get(m)) for m in METRICS)))
+    regressions = compare(results, baseline, args.threshold)
+    for scenario, metric, then, now in regressions:
+        print("REGRESSION %s %s: %s -> %s" % (scenario, metric, then, now))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,243 @@
+"""
+
+Content-addressed cache of compiled simulations, shared by all testbenches and test processes.
+
+An entry is keyed on the contents of the HDL sources, the build parameters
+and the simulator and its version, so an unchanged design is never compiled
+twice, no matter where or how often it is run. Entries are evicted least
+recently used first once the cache exceeds its size limit.
+
+Environment variables:
+
+SIM_BUILD_CACHE       cache directory (default ~/.cache/spinalcorundum/sim_build)
+SIM_BUILD_CACHE_SIZE  size limit in MiB (default 10240)
+
+All cache operations are safe between concurrent processes: an entry is built
+by one process under an exclusive lock and published with an atomic rename,
+and entries are only evicted when no process holds them.
+
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import time
+
+import cocotb
+import cocotb_test.simulator
+
+# simulator executable and version flag, for the cache key
+SIMULATOR_VERSION = {
+    'icarus': ['iverilog', '-V'],
+    'verilator': ['verilator', '--version'],
+    'ghdl': ['ghdl', '--version'],
+    'nvc': ['nvc', '--version'],
+    'questa': ['vsim', '-version'],
+    'modelsim': ['vsim', '-version'],
+    'riviera': ['vsim', '-version'],
+    'xcelium': ['xrun', '-version'],
+    'ius': ['irun', '-version'],
+    'vcs': ['vcs', '-ID'],
+}
+
+_versions = {}
+
+
+def simulator():
+    """The simulator cocotb_test will use."""
+    return os.environ.get("SIM", "icarus")
+
+
+def simulator_version(sim):
+    if sim not in _versions:
+        try:
+            out = subprocess.run(SIMULATOR_VERSION.get(sim, [sim, '--version']), stdout=subprocess.PIPE,
+                                 stderr=subprocess.STDOUT, timeout=60).stdout
+            _versions[sim] = out.decode(errors='replace').strip().splitlines()[0] if out.strip() else 'unknown'
+        except (OSError, subprocess.SubprocessError):
+            _versions[sim] = 'unknown'
+    return _versions[sim]
+
+
+def _sources(sources):
+    # cocotb_test accepts a list, or a dict of library name to list
+    if isinstance(sources, dict):
+        return [(lib, s) for lib, files in sorted(sources.items()) for s in files]
+    return [(None, s) for s in sources or []]
+
+
+def build_key(parameters=None, **sim):
+    """Hash of everything that affects the compiled simulation.
+
+    'sim' are the keyword arguments of cocotb_test.simulator.run() that
+    affect the build: verilog_sources, vhdl_sources, toplevel, defines, ...
+    """
+    h = hashlib.sha256()
+    name = simulator()
+    config = {
+        'simulator': name,
+        'version': simulator_version(name),
+        'cocotb': cocotb.__version__,
+        'parameters': {k: str(v) for k, v in (parameters or {}).items()},
+        'waves': bool(sim.get('waves', int(os.getenv("WAVES", 0)))),
+    }
+    for option in ('toplevel', 'toplevel_lang', 'includes', 'defines', 'compile_args',
+                   'vhdl_compile_args', 'verilog_compile_args', 'extra_args', 'timescale'):
+        if sim.get(option) is not None:
+            config[option] = sim[option]
+    h.update(json.dumps(config, sort_keys=True, default=str).encode())
+    for kind in ('verilog_sources', 'vhdl_sources'):
+        for lib, path in _sources(sim.get(kind)):
+            h.update(("%s %s %s\n" % (kind, lib, os.path.basename(path))).encode())
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    h.update(block)
+    return h.hexdigest()
+
+
+class _Lock(object):
+    def __init__(self, path, shared=False, blocking=True):
+        self.file = open(path, 'a+')
+        flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        try:
+            fcntl.flock(self.file, flags if blocking else flags | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.file.close()
+            raise
+
+    def release(self):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def _link_tree(src, dst):
+    # hard link where possible; the checkout is touched so the simulator never
+    # considers the build older than the (possibly regenerated) HDL sources
+    now = time.time()
+
+    def link(s, d):
+        try:
+            os.link(s, d)
+        except OSError:
+            shutil.copy2(s, d)
+        os.utime(d, (now, now))
+    if os.path.exists(dst):
+        shutil.rmtree(dst)
+    shutil.copytree(src, dst, copy_function=link)
+
+
+class BuildCache(object):
+    """Directory of compiled simulations, one subdirectory per build key."""
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or os.environ.get("SIM_BUILD_CACHE",
+                                           os.path.join(os.path.expanduser("~"), ".cache", "spinalcorundum", "sim_build"))
+        self.max_bytes = max_bytes if max_bytes is not None else \
+            int(os.environ.get("SIM_BUILD_CACHE_SIZE", 10240)) << 20
+        os.makedirs(os.path.join(self.root, "locks"), exist_ok=True)
+
+    def _entry(self, key):
+        return os.path.join(self.root, key)
+
+    def _lock(self, key, shared=False, blocking=True):
+        return _Lock(os.path.join(self.root, "locks", key + ".lock"), shared, blocking)
+
+    def ensure(self, key, compile):
+        """Make sure the entry exists, calling compile(directory) to build it if not.
+
+        Returns True if the entry was built by this call.
+        """
+        if os.path.isdir(self._entry(key)):
+            return False
+        with self._lock(key):
+            # another process may have built it while we waited for the lock
+            if os.path.isdir(self._entry(key)):
+                return False
+            tmp = os.path.join(self.root, "tmp-%s-%d" % (key, os.getpid()))
+            shutil.rmtree(tmp, ignore_errors=True)
+            try:
+                compile(tmp)
+                # cocotb_test leaves an empty results file, even when only compiling
+                for name in os.listdir(tmp):
+                    if name.endswith("_results.xml"):
+                        os.remove(os.path.join(tmp, name))
+                os.rename(tmp, self._entry(key))
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+        self.evict(keep=key)
+        return True
+
+    def checkout(self, key, directory):
+        """Copy the entry to 'directory' as hard links, and mark it as most recently used."""
+        with self._lock(key, shared=True):
+            entry = self._entry(key)
+            if not os.path.isdir(entry):
+                raise KeyError(key)
+            _link_tree(entry, directory)
+            os.utime(entry)
+
+    def get(self, key, compile, directory):
+        """Check out the entry to 'directory', building it first if needed."""
+        while True:
+            self.ensure(key, compile)
+            try:
+                return self.checkout(key, directory)
+            except KeyError:
+                # evicted between ensure() and checkout()
+                continue
+
+    def _size(self, path):
+        total = 0
+        for dirpath, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(dirpath, name)).st_size
+                except OSError:
+                    pass
+        return total
+
+    def evict(self, keep=None):
+        """Remove least recently used entries until the cache fits its size limit, except 'keep'."""
+        entries = []
+        for name in os.listdir(self.root):
+            path = self._entry(name)
+            if name == "locks" or name.startswith("tmp-") or not os.path.isdir(path):
+                continue
+            entries.append((os.stat(path).st_mtime, name, self._size(path)))
+        total = sum(size for _, _, size in entries)
+        for _, key, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            try:
+                lock = self._lock(key, blocking=False)
+            except BlockingIOError:
+                # being built or checked out right now
+                continue
+            with lock:
+                shutil.rmtree(self._entry(key), ignore_errors=True)
+            total -= size
+
+
+def run(sim_build, parameters=None, cache=None, **sim):
+    """cocotb_test.simulator.run(), but compiling through the build cache.
+
+    The cached build is checked out into 'sim_build', so the simulator finds an
+    up-to-date build and only runs the simulation.
+    """
+    cache = cache or BuildCache()
+    key = build_key(parameters, **sim)
+    build_sim = {k: v for k, v in sim.items() if k not in ('extra_env', 'testcase', 'seed', 'plus_args')}
+    cache.get(key, lambda directory: cocotb_test.simulator.run(
+        sim_build=directory, parameters=parameters, compile_only=True, **build_sim), sim_build)
+    return cocotb_test.simulator.run(sim_build=sim_build, parameters=parameters, **sim)
@@ -0,0 +1,248 @@
+"""
+
+Reference model of the CorundumFrameMatchWireguard frame classifier, vectorized
+over batches of frames, and a scoreboard that checks the DUT is_* outputs.
+
+A batch is a zero-padded NumPy byte matrix, one frame per row, plus the frame
+lengths. Only the first HEADER_BYTES bytes of a frame are ever looked at, so
+a capture of millions of frames classifies in one pass over its headers:
+
+    python -m common.classify capture.pcap
+    python -m common.classify capture.pcap --select type4 --count 100000 --out type4.pcap
+
+"""
+
+import argparse
+import array
+import logging
+
+import numpy as np
+
+import cocotb
+from cocotb.triggers import RisingEdge
+
+from .pcap import PcapReader, PcapWriter
+
+# byte 0 is Ethernet, byte 14 is IP, byte 34 is UDP header, byte 42 is UDP payload
+HEADER_BYTES = 46
+
+# DUT outputs, in order of precedence for class_of()
+FLAGS = ('is_type123', 'is_type4', 'is_arp', 'is_icmp', 'is_ipv4l5')
+CLASSES = ('type123', 'type4', 'arp', 'icmp', 'ipv4l5', 'other')
+
+# ARP: TYPE=0806, HTYPE=0001, PTYPE=0800, HLEN=6, PLEN=4
+ETH_ARP = np.frombuffer(bytes.fromhex('0806000108000604'), dtype=np.uint8)
+ETH_IP = np.frombuffer(bytes.fromhex('0800'), dtype=np.uint8)
+
+
+def header_matrix(frames, width=HEADER_BYTES):
+    """The first 'width' bytes of each frame as a zero-padded (n, width) uint8 matrix, and the frame lengths."""
+    heads = bytearray()
+    lengths = array.array('l')
+    for frame in frames:
+        head = bytes(frame[:width])
+        heads += head
+        if len(head) < width:
+            heads += bytes(width - len(head))
+        lengths.append(len(frame))
+    matrix = np.frombuffer(heads, dtype=np.uint8).reshape(-1, width)
+    return matrix, np.frombuffer(lengths, dtype=np.int64) if lengths else np.zeros(0, dtype=np.int64)
+
+
+def classify(matrix, lengths, keep_bytes=64):
+    """Classify a batch of frames like CorundumFrameMatchWireguard, returns a dict of flag name to bool array.
+
+    'matrix' holds at least the first HEADER_BYTES bytes of each frame, zero
+    padded past its length, as the DUT sees the unkept bytes of a short first
+    beat. A byte counts as present (its tkeep set) if it is within the frame
+    and within the first beat of 'keep_bytes' bytes (dataWidth / 8).
+    """
+    matrix = np.asarray(matrix, dtype=np.uint8)
+    if matrix.ndim != 2 or matrix.shape[1] < HEADER_BYTES:
+        raise ValueError("need a (frames, >= %d) byte matrix, got shape %s" % (HEADER_BYTES, matrix.shape))
+    # unkept bytes of the first beat are zero, whatever was in the matrix
+    present = np.minimum(np.asarray(lengths), keep_bytes)
+    data = np.where(np.arange(HEADER_BYTES) < present[:, None], matrix[:, :HEADER_BYTES], 0)
+
+    # the tkeep conditions of the DUT, byte 13, 14, 23 and bytes 42 to 45
+    keep13, keep14, keep23, keep45 = (present > i for i in (13, 14, 23, 45))
+
+    is_etharp = (data[:, 12:20] == ETH_ARP).all(axis=1)
+    is_ethip = (data[:, 12:14] == ETH_IP).all(axis=1) & keep13
+    is_ipv4l5 = (data[:, 14] == 0x45) & keep14
+    is_udp = (data[:, 23] == 0x11) & keep23
+    is_icmp = (data[:, 23] == 0x01) & keep23
+    # Wireguard message type, little endian 32-bit field at byte 42
+    is_type4 = (data[:, 42] == 4) & (data[:, 43:46] == 0).all(axis=1)
+    is_type123 = ((data[:, 42] & 0xfc) == 0) & (data[:, 43:46] == 0).all(axis=1) & keep45
+
+    is_ipv4 = is_ethip & is_ipv4l5
+    return {
+        'is_type123': is_ipv4 & is_udp & is_type123,
+        'is_type4': is_ipv4 & is_udp & is_type4,
+        'is_arp': is_etharp,
+        'is_icmp': is_ipv4 & is_icmp,
+        'is_ipv4l5': is_ipv4,
+    }
+
+
+def classify_frames(frames, keep_bytes=64):
+    """Classify a list of frames, see classify()."""
+    return classify(*header_matrix(frames), keep_bytes=keep_bytes)
+
+
+def class_of(flags):
+    """One class per frame, as an index into CLASSES, the first flag of FLAGS that is set."""
+    n = len(flags[FLAGS[0]])
+    classes = np.full(n, len(FLAGS), dtype=np.uint8)
+    for i, flag in reversed(list(enumerate(FLAGS))):
+        classes[flags[flag]] = i
+    return classes
+
+
+def classify_pcap(path, batch=1 << 20, keep_bytes=64):
+    """Classify all frames of a pcap or pcapng file, returns the frame lengths and the class_of() each frame.
+
+    Frames are classified 'batch' at a time, so memory is bounded by the batch
+    size plus a few bytes per frame.
+    """
+    lengths, classes = [], []
+    with PcapReader(path) as reader:
+        frames = iter(reader)
+        while True:
+            matrix, length = header_matrix(frame for _, frame in _take(frames, batch))
+            if not len(length):
+                break
+            lengths.append(length)
+            classes.append(class_of(classify(matrix, length, keep_bytes)))
+    if not lengths:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint8)
+    return np.concatenate(lengths), np.concatenate(classes)
+
+
+def _take(iterator, n):
+    for _ in range(n):
+        try:
+            yield next(iterator)
+        except StopIteration:
+            return
+
+
+class ClassifierScoreboard(object):
+    """Check the is_* outputs of CorundumFrameMatchWireguard against the reference model.
+
+    The DUT registers the classification of the first beat of a frame on its
+    way to the source stage, so the flags belong to a frame on the cycle its
+    first beat becomes valid on the source. On that cycle the scoreboard
+    samples the flags together with the beat itself. Samples are checked in
+    batches of 'batch' frames, and whatever is left on check().
+    """
+
+    def __init__(self, dut, clock=None, prefix="source", batch=4096, log=None):
+        self.dut = dut
+        self.clock = clock if clock is not None else dut.clk
+        self.tvalid = getattr(dut, prefix + "_tvalid")
+        self.tready = getattr(dut, prefix + "_tready")
+        self.tlast = getattr(dut, prefix + "_tlast")
+        self.tdata = getattr(dut, prefix + "_tdata")
+        self.tkeep = getattr(dut, prefix + "_tkeep")
+        self.flags = [getattr(dut, flag) for flag in FLAGS]
+        self.keep_bytes = len(self.tkeep)
+        self.batch = batch
+        self.log = log if log is not None else logging.getLogger("cocotb.tb")
+        self.frames = 0
+        self.mismatches = 0
+        self.counts = dict.fromkeys(CLASSES, 0)
+        self._heads = []
+        self._lengths = []
+        self._observed = []
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = cocotb.start_soon(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    async def _run(self):
+        edge = RisingEdge(self.clock)
+        in_frame = False
+        # the first beat can be valid for several cycles under backpressure, sample it once
+        sampled = False
+        while True:
+            await edge
+            if not self.tvalid.value:
+                continue
+            if not in_frame and not sampled:
+                self._sample()
+                sampled = True
+            if self.tready.value:
+                in_frame = not self.tlast.value
+                sampled = False
+
+    def _sample(self):
+        keep = bin(int(self.tkeep.value)).count('1')
+        data = int(self.tdata.value).to_bytes(self.keep_bytes, 'little')
+        self._heads.append(data[:HEADER_BYTES])
+        self._lengths.append(keep)
+        self._observed.append([bool(flag.value) for flag in self.flags])
+        if len(self._lengths) >= self.batch:
+            self.check()
+
+    def check(self):
+        """Check the pending samples, returns the total number of mismatching frames so far."""
+        if not self._lengths:
+            return self.mismatches
+        matrix, lengths = header_matrix(self._heads)
+        lengths = np.minimum(lengths, np.array(self._lengths))
+        expected = classify(matrix, lengths, self.keep_bytes)
+        expected = np.stack([expected[flag] for flag in FLAGS], axis=1)
+        observed = np.array(self._observed, dtype=bool)
+        for i in np.flatnonzero((expected != observed).any(axis=1)):
+            self.log.error("Frame %d classified as %s, expected %s, header %s", self.frames + i,
+                           [f for f, v in zip(FLAGS, observed[i]) if v],
+                           [f for f, v in zip(FLAGS, expected[i]) if v], bytes(self._heads[i]).hex())
+            self.mismatches += 1
+        classes = class_of(dict(zip(FLAGS, expected.T)))
+        for c, n in zip(*np.unique(classes, return_counts=True)):
+            self.counts[CLASSES[c]] += int(n)
+        self.frames += len(lengths)
+        self._heads, self._lengths, self._observed = [], [], []
+        return self.mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify the frames of a capture like CorundumFrameMatchWireguard.")
+    parser.add_argument("pcap", help="pcap or pcapng capture")
+    parser.add_argument("--keep-bytes", type=int, default=64, help="bytes per beat of the DUT (default 64)")
+    parser.add_argument("--select", choices=CLASSES, action="append",
+                        help="write the frames of this class to --out, can be repeated")
+    parser.add_argument("--count", type=int, help="write at most this many frames")
+    parser.add_argument("--out", help="pcap file for the selected frames")
+    args = parser.parse_args(argv)
+
+    lengths, classes = classify_pcap(args.pcap, keep_bytes=args.keep_bytes)
+    counts = np.bincount(classes, minlength=len(CLASSES))
+    for name, n in zip(CLASSES, counts):
+        sizes = lengths[classes == CLASSES.index(name)]
+        print("%-8s %10d %6.2f%%  mean %7.1f bytes" % (name, n, 100.0 * n / max(1, len(classes)),
+                                                        sizes.mean() if len(sizes) else 0.0))
+    print("%-8s %10d" % ("total", len(classes)))
+
+    if args.select and args.out:
+        selected = np.isin(classes, [CLASSES.index(name) for name in args.select])
+        if args.count is not None:
+            selected[np.flatnonzero(selected)[args.count:]] = False
+        with PcapReader(args.pcap) as reader, PcapWriter(args.out) as writer:
+            for (ns, frame), keep in zip(reader, selected):
+                if keep:
+                    writer.write(frame, ns)
+        print("%d frames written to %s" % (selected.sum(), args.out))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
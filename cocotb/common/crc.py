@@ -0,0 +1,274 @@
+"""
+
+CRC32 model of the Ethernet frame check sequence, and of the per byte lane
+lookup tables of the parallel Crc component (src/main/scala/corundum/Crc.scala).
+
+The software CRC is table driven, slicing-by-8 or by-16, and vectorized over
+a batch of frames, one frame per row of a zero-padded byte matrix. CRC(X + Y)
+is CRC(X) shifted over the length of Y, plus CRC(Y); the shift over n zero
+bytes is a 32x32 matrix over GF(2), raised to the n-th power by repeated
+squaring. That both combines the CRCs of the chunks of a long buffer and
+builds the lane lookup tables for any data width.
+
+"""
+
+import zlib
+
+import numpy as np
+
+# Ethernet CRC32, most significant bit first and reflected
+POLYNOMIAL = 0x04C11DB7
+POLYNOMIAL_REFLECTED = 0xEDB88320
+# CRC32 over a frame including its correct FCS
+RESIDUE = 0x2144DF1C
+
+
+def _reflected_step(c):
+    return (c >> 1) ^ (POLYNOMIAL_REFLECTED & -(c & 1))
+
+
+def _step(c):
+    return ((c << 1) & 0xffffffff) ^ (POLYNOMIAL & -((c >> 31) & 1))
+
+
+def _tables(slices):
+    # table[k][b] is the CRC of byte b followed by k zero bytes, reflected
+    t = np.arange(256, dtype=np.uint32)
+    for _ in range(8):
+        t = (t >> 1) ^ (np.uint32(POLYNOMIAL_REFLECTED) * (t & 1))
+    tables = [t]
+    for _ in range(1, slices):
+        tables.append((tables[-1] >> 8) ^ t[tables[-1] & 0xff])
+    return np.stack(tables)
+
+
+TABLES = _tables(16)
+
+
+def crc32(data, crc=0):
+    """CRC32 of 'data' like zlib.crc32() and the Ethernet FCS, slicing-by-8 in pure Python.
+
+    This is the readable reference; crc32_batch() is the fast one.
+    """
+    t = TABLES.tolist()
+    c = crc ^ 0xffffffff
+    data = memoryview(data).cast('B')
+    n = len(data) // 8 * 8
+    for i in range(0, n, 8):
+        c ^= int.from_bytes(data[i:i + 4], 'little')
+        c = (t[7][c & 0xff] ^ t[6][(c >> 8) & 0xff] ^ t[5][(c >> 16) & 0xff] ^ t[4][c >> 24] ^
+             t[3][data[i + 4]] ^ t[2][data[i + 5]] ^ t[1][data[i + 6]] ^ t[0][data[i + 7]])
+    for b in data[n:]:
+        c = (c >> 8) ^ t[0][(c ^ b) & 0xff]
+    return c ^ 0xffffffff
+
+
+def crc32_batch(matrix, lengths, slices=16, crc=None):
+    """CRC32 of every row of a zero-padded byte matrix, over the first lengths[row] bytes.
+
+    All rows are processed together, 'slices' (8 or 16) bytes per step.
+    Rows are visited longest first, so a step only touches the rows that are
+    still long enough and a batch of mixed lengths costs no more than its data.
+    'crc' optionally continues from earlier CRCs, one per row. 'slices' is a
+    multiple of 4, up to 16.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    # no reordering (and copy) of a batch that is sorted already, such as equal chunks
+    if (lengths[1:] <= lengths[:-1]).all():
+        order = slice(None)
+    else:
+        order = np.argsort(-lengths, kind='stable')
+    length = lengths[order]
+    width = -(-int(length[0]) // 4) * 4 if len(length) else 0
+    matrix = np.asarray(matrix, dtype=np.uint8)[order, :width]
+    if matrix.shape[1] < width:
+        matrix = np.pad(matrix, ((0, 0), (0, width - matrix.shape[1])))
+    # little endian 32-bit words, one row per word position, so a step reads
+    # contiguous words of all frames; transposing words is 4 times cheaper than bytes
+    words = np.ascontiguousarray(np.ascontiguousarray(matrix).view('<u4').T)
+    c = np.full(len(length), 0xffffffff, dtype=np.uint32)
+    if crc is not None:
+        c ^= np.asarray(crc, dtype=np.uint32)[order]
+    # tables in slice order: the first byte of a slice has the most bytes after it
+    tables = [TABLES[slices - 1 - k] for k in range(slices)]
+    ff = np.uint32(0xff)
+    steps = length // slices
+    # frames with at least s + 1 slices are a prefix of the sorted frames
+    active = np.searchsorted(-steps, -np.arange(1, (steps[0] if len(steps) else 0) + 1), side='right')
+    for s, rows in enumerate(active):
+        q = s * slices // 4
+        x = c[:rows] ^ words[q, :rows]
+        acc = tables[0].take(x & ff)
+        acc ^= tables[1].take((x >> 8) & ff)
+        acc ^= tables[2].take((x >> 16) & ff)
+        acc ^= tables[3].take(x >> 24)
+        for k in range(4, slices, 4):
+            x = words[q + k // 4, :rows]
+            acc ^= tables[k].take(x & ff)
+            acc ^= tables[k + 1].take((x >> 8) & ff)
+            acc ^= tables[k + 2].take((x >> 16) & ff)
+            acc ^= tables[k + 3].take(x >> 24)
+        c[:rows] = acc
+    # the remaining bytes of every frame, at most slices - 1, one byte per step
+    tail = length - steps * slices
+    for k in range(slices - 1):
+        rows = np.flatnonzero(tail > k)
+        if not len(rows):
+            break
+        position = steps[rows] * slices + k
+        b = (words[position // 4, rows] >> (8 * (position % 4)).astype(np.uint32)) & ff
+        c[rows] = (c[rows] >> 8) ^ TABLES[0].take((c[rows] ^ b) & ff)
+    result = np.empty_like(c)
+    result[order] = c ^ 0xffffffff
+    return result
+
+
+def fcs_ok(matrix, lengths, slices=16):
+    """For every frame (including its 4 byte FCS) in a zero-padded byte matrix, whether the FCS is correct."""
+    return crc32_batch(matrix, lengths, slices) == RESIDUE
+
+
+def append_fcs(frame):
+    """The frame with its Ethernet FCS appended."""
+    return bytes(frame) + zlib.crc32(frame).to_bytes(4, 'little')
+
+
+# GF(2) matrices as 32 column vectors, column b is the image of bit b
+
+def _gf2_times(matrix, vector):
+    result = 0
+    b = 0
+    while vector:
+        if vector & 1:
+            result ^= matrix[b]
+        vector >>= 1
+        b += 1
+    return result
+
+
+def _gf2_multiply(a, b):
+    # the matrix a * b, that is b applied first
+    return [_gf2_times(a, column) for column in b]
+
+
+def _gf2_apply(matrix, values):
+    # vectorized _gf2_times() over an array of uint32 values
+    values = np.asarray(values, dtype=np.uint32)
+    result = np.zeros_like(values)
+    for b, column in enumerate(matrix):
+        result ^= np.uint32(column) * ((values >> np.uint32(b)) & 1)
+    return result
+
+
+_zeros = {}
+
+
+def zeros_operator(n, reflected=True):
+    """The operator that shifts a CRC register over 'n' zero bytes, as a GF(2) matrix.
+
+    Built from the one bit operator by repeated squaring, and cached per
+    power of two, so any shift costs at most 32 matrix products.
+    """
+    key = (n, reflected)
+    if key in _zeros:
+        return _zeros[key]
+    step = _reflected_step if reflected else _step
+    power = [step(1 << b) for b in range(32)]
+    for _ in range(3):
+        power = _gf2_multiply(power, power)
+    operator = None
+    while n:
+        if n & 1:
+            operator = power if operator is None else _gf2_multiply(power, operator)
+        n >>= 1
+        if n:
+            power = _gf2_multiply(power, power)
+    operator = operator if operator is not None else [1 << b for b in range(32)]
+    _zeros[key] = operator
+    return operator
+
+
+def crc32_combine(crc1, crc2, length2):
+    """CRC32 of X + Y from crc1 = CRC32(X), crc2 = CRC32(Y) and the length of Y, like zlib's crc32_combine()."""
+    return _gf2_times(zeros_operator(length2), crc1) ^ crc2
+
+
+def crc32_chunked(data, chunk=4096, slices=16):
+    """CRC32 of one long buffer: the CRCs of its chunks in one crc32_batch(), then combined pairwise."""
+    data = np.frombuffer(memoryview(data).cast('B'), dtype=np.uint8)
+    chunks = len(data) // chunk
+    if chunks < 2:
+        return int(crc32_batch(data[None, :], [len(data)], slices)[0])
+    crcs = crc32_batch(data[:chunks * chunk].reshape(chunks, chunk), np.full(chunks, chunk), slices)
+    # c is the CRC of the chunks peeled off the front, whenever a level has an odd count
+    c = 0
+    length = chunk
+    while True:
+        if len(crcs) & 1:
+            c = _gf2_times(zeros_operator(length), c) ^ int(crcs[0])
+            crcs = crcs[1:]
+        if not len(crcs):
+            break
+        crcs = _gf2_apply(zeros_operator(length), crcs[0::2]) ^ crcs[1::2]
+        length *= 2
+    tail = data[chunks * chunk:]
+    if len(tail):
+        c = crc32_combine(c, int(crc32_batch(tail[None, :], [len(tail)], slices)[0]), len(tail))
+    return c
+
+
+def lane_luts(data_width):
+    """The lookup tables of Crc(dataWidth), as a (dataWidth / 8, 256) uint32 array.
+
+    luts[i][j] is Crc.partial_crc(i, j): the CRC, most significant bit first,
+    zero initial value, of byte value j followed by i zero bytes. Lane i is
+    the previous lane shifted over one zero byte, for all 256 values at once.
+    """
+    lanes = data_width // 8
+    shift = zeros_operator(1, reflected=False)
+    luts = np.empty((lanes, 256), dtype=np.uint32)
+    t = np.arange(256, dtype=np.uint32) << np.uint32(24)
+    for _ in range(8):
+        t = (t << np.uint32(1)) ^ (np.uint32(POLYNOMIAL) * (t >> np.uint32(31)))
+    luts[0] = t
+    for i in range(1, lanes):
+        luts[i] = _gf2_apply(shift, luts[i - 1])
+    return luts
+
+
+def beat_crc(beats, luts):
+    """CRC contribution of every beat of a (beats, dataWidth / 8) byte matrix, as the Crc component XORs its LUTs.
+
+    The first byte of a beat has the most bytes after it, so it is looked up
+    in the last lane.
+    """
+    beats = np.asarray(beats, dtype=np.uint8)
+    lanes = beats.shape[1]
+    return np.bitwise_xor.reduce(luts[np.arange(lanes - 1, -1, -1), beats], axis=1)
+
+
+def selftest():
+    """Check the models against zlib and each other, returns True if all agree."""
+    rng = np.random.default_rng(1)
+    lengths = rng.integers(0, 1600, 256)
+    matrix = rng.integers(0, 256, (256, 1600), dtype=np.uint8)
+    expected = np.array([zlib.crc32(row[:n].tobytes()) for row, n in zip(matrix, lengths)], dtype=np.uint32)
+    ok = all((crc32_batch(matrix, lengths, slices) == expected).all() for slices in (8, 16))
+    ok &= all(crc32(matrix[i, :lengths[i]].tobytes()) == expected[i] for i in range(16))
+    data = matrix.tobytes()
+    ok &= crc32_chunked(data, chunk=1000) == zlib.crc32(data)
+    ok &= crc32_combine(zlib.crc32(data[:777]), zlib.crc32(data[777:]), len(data) - 777) == zlib.crc32(data)
+    # LUT contributions of a beat equal its CRC, most significant bit first, zero initial value
+    luts = lane_luts(128)
+    beat = matrix[0, :16]
+    c = 0
+    for b in beat.tolist():
+        c ^= b << 24
+        for _ in range(8):
+            c = _step(c)
+    ok &= int(beat_crc(beat[None, :], luts)[0]) == c
+    return bool(ok)
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if selftest() else 1)
@@ -0,0 +1,144 @@
+"""
+
+Reference model of AxisExtractHeader and AxisInsertHeader, and a scoreboard
+that checks every frame as it arrives.
+
+AxisExtractHeader(dataWidth, headerWidthBytes) splits the first
+headerWidthBytes bytes off a frame, outputs them on 'header' and passes the
+rest as the payload; AxisInsertHeader joins a header and a payload again.
+The model only slices memoryviews of the frames: a frame is never copied to
+split it, and the DUT output is compared piece by piece to the header and
+payload it should be joined from, so neither is a frame built to join them.
+
+"""
+
+import collections
+import logging
+
+import cocotb
+from cocotb.triggers import Event, RisingEdge
+
+from .pipeline import LENGTH_MASK, beat_counts
+
+# header widths in bytes of the generated AxisExtractHeader_<n> and AxisInsertHeader_<n>,
+# see src/main/scala/corundum/AxisHeaderWidths.scala
+HEADER_WIDTHS = [1, 2, 7, 8, 14, 15]
+
+
+def extract(frame, header_bytes):
+    """Split a frame into its header and payload, both memoryviews of the frame."""
+    view = memoryview(frame).cast('B')
+    return view[:header_bytes], view[header_bytes:]
+
+
+def header_value(header):
+    """The value of the header output or input: the first header byte is the least significant."""
+    return int.from_bytes(header, 'little')
+
+
+def pieces(header, payload, insert):
+    """The (offset, bytes) pieces the DUT output consists of, and its length."""
+    if insert:
+        return ((0, header), (len(header), payload)), len(header) + len(payload)
+    return ((0, payload),), len(payload)
+
+
+def matches(data, header, payload, keep_bytes, insert=False):
+    """Whether received tdata (whole beats, without tkeep) is the output for a header and payload."""
+    view = memoryview(data).cast('B')
+    parts, length = pieces(header, payload, insert)
+    if len(view) != beat_counts(length, keep_bytes) * keep_bytes:
+        return False
+    return all(view[offset:offset + len(part)] == part for offset, part in parts)
+
+
+class HeaderScoreboard(object):
+    """Check the source frames of AxisExtractHeader, or with 'insert' AxisInsertHeader, as they arrive.
+
+    Call expect() with the header and payload of every frame sent, in order.
+    run() is the scoreboard coroutine: it receives every frame from 'sink', a
+    cocotbext-axi AxiStreamSink, and checks it against the next one expected.
+    A second coroutine samples the header output (of AxisExtractHeader) and
+    source_length on the first beat of every frame; source_length is checked
+    unless 'length' is False.
+    """
+
+    def __init__(self, dut, sink, header_bytes, insert=False, length=True, clock=None, prefix="source", log=None):
+        self.dut = dut
+        self.sink = sink
+        self.header_bytes = header_bytes
+        self.insert = insert
+        self.clock = clock if clock is not None else dut.clk
+        self.tvalid = getattr(dut, prefix + "_tvalid")
+        self.tready = getattr(dut, prefix + "_tready")
+        self.tlast = getattr(dut, prefix + "_tlast")
+        self.keep_bytes = len(getattr(dut, prefix + "_tdata")) // 8
+        self.length = getattr(dut, prefix + "_length") if length else None
+        self.header = None if insert else dut.header
+        self.log = log if log is not None else logging.getLogger("cocotb.tb")
+        self.frames = 0
+        self.mismatches = 0
+        self._expected = collections.deque()
+        self._samples = collections.deque()
+        self._received = Event()
+        self._tasks = []
+
+    def expect(self, header, payload):
+        self._expected.append((header, payload))
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [cocotb.start_soon(self._sample()), cocotb.start_soon(self.run())]
+
+    def stop(self):
+        for task in self._tasks:
+            task.kill()
+        self._tasks = []
+
+    async def wait(self, frames):
+        """Wait until 'frames' frames were checked."""
+        while self.frames < frames:
+            self._received.clear()
+            await self._received.wait()
+
+    async def _sample(self):
+        edge = RisingEdge(self.clock)
+        first = True
+        while True:
+            await edge
+            if self.tvalid.value and self.tready.value:
+                if first:
+                    self._samples.append((
+                        self.header.value.integer if self.header is not None else None,
+                        self.length.value.integer if self.length is not None else None))
+                first = bool(self.tlast.value)
+
+    async def run(self):
+        while True:
+            rx_frame = await self.sink.recv()
+            self.check(rx_frame.tdata)
+            self._received.set()
+
+    def check(self, data):
+        """Check one received frame against the next one expected, returns True if it matches."""
+        if not self._expected:
+            self.log.error("HeaderScoreboard frame %d was never sent: %s", self.frames, bytes(data).hex())
+            self.mismatches += 1
+            self.frames += 1
+            return False
+        header, payload = self._expected.popleft()
+        header_sample, length_sample = self._samples.popleft() if self._samples else (None, None)
+        errors = []
+        if not matches(data, header, payload, self.keep_bytes, self.insert):
+            errors.append("data %s" % bytes(data).hex())
+        if self.header is not None and header_sample != header_value(header):
+            errors.append("header 0x%x, expected 0x%x" % (header_sample or 0, header_value(header)))
+        expected_length = pieces(header, payload, self.insert)[1] & LENGTH_MASK
+        if self.length is not None and length_sample != expected_length:
+            errors.append("source_length %s, expected %d" % (length_sample, expected_length))
+        if errors:
+            self.log.error("HeaderScoreboard frame %d with %d byte payload: %s", self.frames, len(payload),
+                           ", ".join(errors))
+            self.mismatches += 1
+        self.frames += 1
+        return not errors
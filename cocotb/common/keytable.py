@@ -0,0 +1,144 @@
+"""
+
+Session key table for AxisWireguardKeyLookup, standing in for the external key
+LUT (LookupTable or LookupEndpoint, programmed over AXI4 by LookupTableAxi4).
+
+AxisWireguardKeyLookup outputs the receiver of every Type 4 header and
+expects the 256-bit session key on key_in two cycles later. The table holds
+one key per slot in one contiguous bytearray; like the hardware LUT it is
+addressed by the low bits of the (little endian) receiver index, so a lookup
+is a slice of a memoryview, and millions of keys load in one NumPy copy.
+
+"""
+
+import collections
+
+import numpy as np
+
+import cocotb
+from cocotb.triggers import FallingEdge
+
+KEY_BYTES = 32
+# key_in is valid this many cycles after receiver
+KEY_LATENCY = 2
+
+
+def receiver_index(receiver):
+    """The little endian receiver index of the Type 4 header, from the receiver output of the DUT.
+
+    The DUT outputs the four header bytes most significant first, that is
+    byte swapped.
+    """
+    return int.from_bytes(int(receiver).to_bytes(4, 'big'), 'little')
+
+
+class KeyTable(object):
+    """One 32 byte key per slot, 'slots' a power of two, addressed by receiver index modulo slots."""
+
+    def __init__(self, slots):
+        if slots < 1 or slots & (slots - 1):
+            raise ValueError("slots must be a power of two, got %d" % slots)
+        self.slots = slots
+        self.mask = slots - 1
+        self.data = bytearray(slots * KEY_BYTES)
+        self.view = memoryview(self.data)
+        self.keys = np.frombuffer(self.data, dtype=np.uint8).reshape(slots, KEY_BYTES)
+        # slots written since the table was last programmed into the DUT
+        self.dirty = np.zeros(slots, dtype=bool)
+
+    def slot(self, receiver):
+        return receiver & self.mask
+
+    def __getitem__(self, receiver):
+        """The key of a receiver index, as a memoryview into the table."""
+        offset = (receiver & self.mask) * KEY_BYTES
+        return self.view[offset:offset + KEY_BYTES]
+
+    def __setitem__(self, receiver, key):
+        slot = receiver & self.mask
+        self.view[slot * KEY_BYTES:(slot + 1) * KEY_BYTES] = key
+        self.dirty[slot] = True
+
+    def load(self, receivers, keys):
+        """Store many keys at once, 'keys' as an (n, 32) byte array or n * 32 bytes.
+
+        Of receivers that share a slot, the last one wins, as in the hardware LUT.
+        """
+        slots = np.asarray(receivers, dtype=np.uint64) & np.uint64(self.mask)
+        keys = np.frombuffer(keys, dtype=np.uint8) if isinstance(keys, (bytes, bytearray, memoryview)) \
+            else np.asarray(keys, dtype=np.uint8)
+        self.keys[slots.astype(np.intp)] = keys.reshape(-1, KEY_BYTES)
+        self.dirty[slots.astype(np.intp)] = True
+
+    def key_in(self, receiver):
+        """The key_in value for a receiver index: key byte 0 is the least significant byte."""
+        return int.from_bytes(self[receiver], 'little')
+
+    def key_out(self, receiver):
+        """The key_out value the DUT makes of key_in, byte reversed."""
+        return int.from_bytes(self[receiver], 'big')
+
+    def bursts(self, base=0, max_bytes=256 * 4, boundary=4096, dirty_only=True):
+        """AXI4 write bursts that program the (dirty) slots into LookupTableAxi4, as (address, data).
+
+        LookupTableAxi4 assembles a 256-bit word from eight 32-bit bus writes
+        to consecutive addresses, the first at the lowest address and in the
+        lowest bits, so a key is written as its own 32 bytes at slot * 32.
+        Runs of consecutive slots become bursts of at most 'max_bytes' (256
+        beats of 32 bits), that never cross a 'boundary' (4 KiB, per AXI4).
+        Bursts are whole keys, so every key is written in one go.
+        """
+        if base % KEY_BYTES:
+            raise ValueError("base 0x%x is not aligned to a key" % base)
+        selected = self.dirty if dirty_only else np.ones(self.slots, dtype=bool)
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], selected, [False])).astype(np.int8)))
+        step = max(KEY_BYTES, min(max_bytes, boundary) // KEY_BYTES * KEY_BYTES)
+        for first, last in zip(edges[0::2], edges[1::2]):
+            start = int(first) * KEY_BYTES
+            end = int(last) * KEY_BYTES
+            while start < end:
+                address = base + start
+                length = min(end - start, step, boundary - address % boundary)
+                yield address, self.view[start:start + length]
+                start += length
+
+    async def program(self, axi_master, base=0, dirty_only=True):
+        """Write the (dirty) keys into LookupTableAxi4 through a cocotbext-axi AxiMaster, in bursts."""
+        for address, data in list(self.bursts(base, dirty_only=dirty_only)):
+            await axi_master.write(address, bytes(data))
+        self.dirty[:] = False
+
+
+class KeyLookupDriver(object):
+    """Drive key_in of AxisWireguardKeyLookup from a KeyTable, KEY_LATENCY cycles after receiver.
+
+    The receiver is sampled, and key_in driven, half way every clock cycle,
+    so key_in changes exactly KEY_LATENCY cycles after receiver did.
+    """
+
+    def __init__(self, dut, table, clock=None):
+        self.dut = dut
+        self.table = table
+        self.clock = clock if clock is not None else dut.clk
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = cocotb.start_soon(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    async def _run(self):
+        edge = FallingEdge(self.clock)
+        receiver = self.dut.receiver
+        key_in = self.dut.key_in
+        pipeline = collections.deque([0] * KEY_LATENCY)
+        table = self.table
+        while True:
+            await edge
+            value = receiver.value
+            pipeline.append(table.key_in(receiver_index(value.integer)) if value.is_resolvable else 0)
+            key_in.value = pipeline.popleft()
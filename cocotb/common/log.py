@@ -0,0 +1,69 @@
+"""
+
+Frame logging for the cocotb testbenches, that costs close to nothing when not enabled.
+
+Environment variables:
+
+TB_LOG_LEVEL   testbench log level, DEBUG, INFO (default), WARNING, ...
+TB_LOG_SAMPLE  log only every n-th frame per direction (default 1, every frame)
+TB_LOG_HEX     number of frame bytes in the hex dump of a logged frame (default 64, 0 for all)
+TB_PCAP        capture all frames to <TB_PCAP>_<direction>.pcap, regardless of the log level
+
+"""
+
+import logging
+import os
+
+from .pcap import PcapWriter
+
+
+def log_level(default='INFO'):
+    """The testbench log level, from $TB_LOG_LEVEL."""
+    level = os.environ.get('TB_LOG_LEVEL', default).upper()
+    return int(level) if level.isdigit() else logging.getLevelName(level)
+
+
+class hexdump(object):
+    """Hex string of (at most 'limit' bytes of) a frame, only formatted when it is logged."""
+
+    __slots__ = ('data', 'limit')
+
+    def __init__(self, data, limit=None):
+        self.data = data
+        self.limit = limit
+
+    def __str__(self):
+        if self.limit and len(self.data) > self.limit:
+            return "%s... (%d bytes)" % (bytes(self.data[:self.limit]).hex(), len(self.data))
+        return bytes(self.data).hex()
+
+
+class FrameLog(object):
+    """Log the frames in one direction through the testbench, such as "TAP to TB".
+
+    Frames are logged at DEBUG level, lazily, truncated and optionally
+    sampled, so a frame that is not logged costs one level check. If $TB_PCAP
+    (or 'pcap') is set, every frame is also captured in full to a pcap file.
+    """
+
+    def __init__(self, log, direction, level=logging.DEBUG, sample=None, limit=None, pcap=None):
+        self.log = log
+        self.direction = direction
+        self.level = level
+        self.sample = sample if sample is not None else int(os.environ.get('TB_LOG_SAMPLE', '1'))
+        self.limit = limit if limit is not None else int(os.environ.get('TB_LOG_HEX', '64'))
+        pcap = pcap if pcap is not None else os.environ.get('TB_PCAP')
+        name = direction.replace(' ', '_')
+        self.pcap = PcapWriter("%s_%s.pcap" % (pcap, name)) if pcap else None
+        self.frames = 0
+
+    def __call__(self, data):
+        self.frames += 1
+        if self.pcap is not None:
+            self.pcap.write(data)
+        if self.frames % self.sample == 0 and self.log.isEnabledFor(self.level):
+            self.log.log(self.level, "%s frame %d: %s", self.direction, self.frames, hexdump(data, self.limit))
+
+    def close(self):
+        if self.pcap is not None:
+            self.pcap.close()
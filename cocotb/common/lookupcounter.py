@@ -0,0 +1,156 @@
+"""
+
+Cycle model of LookupCounter (src/main/scala/corundum/LookupCounter.scala).
+
+LookupCounter reads a counter from memory in two cycles (d1, d2) and writes
+the updated counter back two cycles later (d3, d4), bypassing the writes that
+are still in flight (d3, d4, d5) when the same address is looked up again.
+With the bypass the pipeline is free of hazards, so every lookup sees the
+counter as if all earlier lookups had completed; the model therefore keeps
+one counter per address and only delays its output by LATENCY cycles.
+
+Per cycle the inputs are lookup, increment, clear and address:
+
+- lookup outputs the counter LATENCY cycles later; with increment the
+  counter increments after, except at end, where it restarts at start or
+  stays at end
+- clear sets the counter to start after the lookup, also without lookup,
+  and takes precedence over increment
+- increment without lookup (or clear) has no effect
+
+"""
+
+import numpy as np
+
+LATENCY = 2
+
+
+def word_width(end):
+    """LookupCounter.word_width(), the counter width in bits for an end value."""
+    return 1 if end == 1 else (end - 1).bit_length()
+
+
+class LookupCounterModel(object):
+    """Counters of LookupCounter(wordCount, startValue, endValue, restart), cycle by cycle or in batches.
+
+    'init' is the initial memory content, by default 'start' as with initRAM.
+    step() and run() keep the pipeline between calls, so they can be mixed.
+    """
+
+    def __init__(self, word_count, start=0, end=(1 << 64) - 1, restart=False, init=None):
+        if not 0 <= start < end < (1 << 64):
+            raise ValueError("need 0 <= start < end < 2**64, got start=%d, end=%d" % (start, end))
+        self.word_count = word_count
+        self.start = start
+        self.end = end
+        self.restart = restart
+        self.counters = np.full(word_count, start if init is None else init, dtype=np.uint64)
+        # (counter, valid) on the output for the inputs of the last LATENCY cycles, oldest first
+        self._pipeline = [(0, False)] * LATENCY
+
+    def _next(self, counter, increment, clear):
+        if clear:
+            return self.start
+        if increment:
+            if counter != self.end:
+                return counter + 1
+            return self.start if self.restart else counter
+        return counter
+
+    def step(self, lookup, increment, clear, address):
+        """Clock one cycle, returns the (counter, valid) output of this cycle.
+
+        'valid' tells whether the counter is the result of a lookup or clear
+        LATENCY cycles ago; otherwise it is the counter at that address anyway.
+        """
+        counter = int(self.counters[address])
+        if lookup or clear:
+            self.counters[address] = self._next(counter, lookup and increment, clear)
+        self._pipeline.append((counter, bool(lookup or clear)))
+        return self._pipeline.pop(0)
+
+    def _advance(self, base, count):
+        # counters 'base' after 'count' increments, vectorized
+        room = np.uint64(self.end) - base
+        fits = count <= room
+        value = base + np.minimum(count, room)
+        if self.restart:
+            period = self.end - self.start + 1
+            # increments past end, the first one restarts at start
+            over = np.where(fits, np.uint64(0), count - room - np.uint64(1))
+            if period < (1 << 64):
+                over %= np.uint64(period)
+            value = np.where(fits, value, np.uint64(self.start) + over)
+        return value
+
+    def lookup(self, lookup, increment, clear, address):
+        """The counter each cycle's lookup returns, without latency, and update the counters.
+
+        All arguments are arrays with one element per cycle. Within a batch
+        the cycles are grouped per address with a stable sort, and the counter
+        of a cycle follows from the last clear before it and the number of
+        increments since, so the cost does not depend on the access pattern.
+        """
+        lookup = np.asarray(lookup, dtype=bool)
+        clear = np.asarray(clear, dtype=bool)
+        increment = np.asarray(increment, dtype=bool) & lookup & ~clear
+        address = np.asarray(address, dtype=np.int64)
+        if not len(address):
+            return np.zeros(0, dtype=np.uint64)
+
+        order = np.argsort(address, kind='stable')
+        a = address[order]
+        c = clear[order]
+        inc = increment[order].astype(np.uint64)
+        first = np.ones(len(a), dtype=bool)
+        first[1:] = a[1:] != a[:-1]
+        # a counter restarts from memory at the first access, or from start after a clear
+        after_clear = np.zeros(len(a), dtype=bool)
+        after_clear[1:] = c[:-1] & ~first[1:]
+        starts = np.flatnonzero(first | after_clear)
+        segment = np.cumsum(first | after_clear) - 1
+        increments = np.cumsum(inc) - inc
+        count = increments - increments[starts][segment]
+        base = np.where(after_clear[starts][segment], np.uint64(self.start), self.counters[a[starts]][segment])
+        value = self._advance(base, count)
+
+        # the counter after the last access per address
+        last = np.flatnonzero(np.append(first[1:], True))
+        final = self._advance(value[last], inc[last])
+        final[c[last]] = self.start
+        self.counters[a[last]] = final
+
+        counters = np.empty_like(value)
+        counters[order] = value
+        return counters
+
+    def run(self, lookup, increment, clear, address):
+        """Clock a batch of cycles, returns the counter and valid output per cycle, see step()."""
+        counters = self.lookup(lookup, increment, clear, address)
+        valid = np.asarray(lookup, dtype=bool) | np.asarray(clear, dtype=bool)
+        counters = np.concatenate([np.array([p[0] for p in self._pipeline], dtype=np.uint64), counters])
+        valid = np.concatenate([np.array([p[1] for p in self._pipeline], dtype=bool), valid])
+        self._pipeline = list(zip(counters[-LATENCY:].tolist(), valid[-LATENCY:].tolist()))
+        return counters[:-LATENCY], valid[:-LATENCY]
+
+
+def random_stream(cycles, word_count, rng=None, lookup=0.9, increment=0.8, clear=0.01, burst=0.3, burst_length=8):
+    """Random inputs for 'cycles' cycles, as a dict of arrays for LookupCounterModel.run().
+
+    A fraction 'burst' of the cycles repeats the address of the cycle before,
+    in runs of up to 'burst_length', so the d3, d4 and d5 bypasses are all hit.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    address = rng.integers(0, word_count, cycles)
+    repeat = rng.random(cycles) < burst
+    # every cycle takes the address of the last cycle that does not repeat
+    index = np.arange(cycles)
+    source = np.maximum.accumulate(np.where(repeat, 0, index))
+    repeat &= (index - source) % burst_length != 0
+    source = np.maximum.accumulate(np.where(repeat, 0, index))
+    return {
+        'lookup': rng.random(cycles) < lookup,
+        'increment': rng.random(cycles) < increment,
+        'clear': rng.random(cycles) < clear,
+        'address': address[source],
+    }
@@ -0,0 +1,138 @@
+"""
+
+Run a cocotb testbench over a matrix of parameters, concurrently on all cores.
+
+A matrix has build parameters, which are passed to the simulator compiler
+(DATA_WIDTH, ...), and run options, which are passed to the testbench in the
+environment (payload lengths, pause patterns, ...). Every combination is an
+independent job. Every distinct set of build parameters is compiled once,
+through the build cache; each job then runs in its own hard-linked checkout of
+that build, so jobs never share a working directory and never recompile.
+
+"""
+
+import argparse
+import collections
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cocotb_test.simulator
+
+from . import buildcache
+
+Job = collections.namedtuple('Job', 'name build parameters env')
+
+
+def _name(prefix, values):
+    return "-".join([prefix] + ["%s=%s" % (k, v) for k, v in sorted(values.items())])
+
+
+def _product(values):
+    return [dict(zip(values.keys(), v)) for v in itertools.product(*values.values())]
+
+
+def expand(name, parameters=None, env=None):
+    """All combinations of the build parameters and run options, as a list of jobs.
+
+    'parameters' and 'env' map a name to a list of values. 'parameters' can
+    also be a list of parameter dicts, for parameters that depend on each other.
+    """
+    parameters = parameters or {}
+    env = env or {}
+    if isinstance(parameters, dict):
+        parameters = _product(parameters)
+    jobs = []
+    for build_parameters in parameters:
+        build = _name(name, build_parameters)
+        for run_env in _product(env):
+            run_env = {k: str(v) for k, v in run_env.items()}
+            jobs.append(Job(_name(build, run_env), build, build_parameters, run_env))
+    return jobs
+
+
+def shard(jobs, index, count):
+    """The jobs of shard 'index' out of 'count', jobs of one build stay in one shard."""
+    builds = sorted(set(job.build for job in jobs))
+    mine = set(builds[index::count])
+    return [job for job in jobs if job.build in mine]
+
+
+def build(job, sim, cache):
+    """Compile the simulation of the build parameters of a job, returns an error message or None."""
+    try:
+        key = buildcache.build_key(job.parameters, **sim)
+        cache.ensure(key, lambda directory: cocotb_test.simulator.run(
+            sim_build=directory, parameters=job.parameters, compile_only=True, **sim))
+        return None
+    except (Exception, SystemExit) as e:
+        return str(e) or e.__class__.__name__
+
+
+def run_job(job, run_dir, sim, cache):
+    """Run one job in its own checkout of the build, returns (job name, passed, seconds, message)."""
+    start = time.time()
+    try:
+        env = dict(sim.get('extra_env') or {})
+        env.update({'PARAM_%s' % k: str(v) for k, v in job.parameters.items()})
+        env.update(job.env)
+        buildcache.run(run_dir, job.parameters, cache, **dict(sim, extra_env=env))
+        return job.name, True, time.time() - start, ""
+    except (Exception, SystemExit) as e:
+        return job.name, False, time.time() - start, str(e) or e.__class__.__name__
+
+
+def run_matrix(jobs, sim, sim_build, workers=None, log=print):
+    """Run all jobs on 'workers' processes, returns a list of (job name, passed, seconds, message).
+
+    'sim' are the keyword arguments for cocotb_test.simulator.run() that all
+    jobs share (toplevel, module, verilog_sources, python_search, ...).
+    """
+    by_build = collections.OrderedDict()
+    for job in jobs:
+        by_build.setdefault(job.build, []).append(job)
+
+    def report(result):
+        results.append(result)
+        log("%s %s (%.1f s)%s" % ("PASS" if result[1] else "FAIL", result[0], result[2],
+                                  (": " + result[3]) if result[3] else ""))
+
+    cache = buildcache.BuildCache()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        # all builds first, the jobs of a build are queued as soon as it is done
+        builds = {pool.submit(build, build_jobs[0], sim, cache): name for name, build_jobs in by_build.items()}
+        runs = []
+        for future in as_completed(builds):
+            name = builds[future]
+            error = future.result()
+            for job in by_build[name]:
+                if error is not None:
+                    report((job.name, False, 0.0, "build failed: %s" % error))
+                else:
+                    runs.append(pool.submit(run_job, job, os.path.join(sim_build, job.name), sim, cache))
+        for future in as_completed(runs):
+            report(future.result())
+    return results
+
+
+def main(jobs, sim, sim_build, argv=None):
+    parser = argparse.ArgumentParser(description="Run the testbench over its parameter matrix.")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                        help="number of concurrent simulations (default: number of cores)")
+    parser.add_argument("--shard", default="1/1", help="run shard I of N, as I/N (default 1/1)")
+    parser.add_argument("--list", action="store_true", help="list the jobs, do not run them")
+    args = parser.parse_args(argv)
+
+    index, count = (int(x) for x in args.shard.split('/'))
+    jobs = shard(jobs, index - 1, count)
+    if args.list:
+        for job in jobs:
+            print(job.name)
+        return 0
+    start = time.time()
+    results = run_matrix(jobs, sim, sim_build, args.workers)
+    failed = [r for r in results if not r[1]]
+    print("%d jobs, %d failed, %.1f s" % (len(results), len(failed), time.time() - start))
+    return 1 if failed else 0
@@ -0,0 +1,177 @@
+"""
+
+Throughput and latency statistics of the AXI Stream frames through a DUT.
+
+"""
+
+import csv
+import json
+import os
+
+import cocotb
+from cocotb.triggers import RisingEdge
+from cocotb.utils import get_sim_time
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a sorted list, or None if it is empty."""
+    if not values:
+        return None
+    rank = max(0, min(len(values) - 1, -(-p * len(values) // 100) - 1))
+    return values[int(rank)]
+
+
+def distribution(values):
+    values = sorted(values)
+    return {
+        'min': values[0] if values else None,
+        'p50': percentile(values, 50),
+        'p99': percentile(values, 99),
+        'max': values[-1] if values else None,
+        'mean': sum(values) / len(values) if values else None,
+    }
+
+
+class _Port(object):
+    """Beat and frame boundaries on one AXI Stream interface, sampled every clock."""
+
+    def __init__(self, bus):
+        self.tvalid = bus.tvalid
+        self.tready = getattr(bus, 'tready', None)
+        self.tlast = bus.tlast
+        self.beats = 0
+        self.valid_cycles = 0
+        # cycles with tvalid but not tready (backpressure)
+        self.stall_cycles = 0
+        # cycles inside a frame without a beat
+        self.bubble_cycles = 0
+        self.in_frame = False
+        # cycle and sim time of the first and last beat per frame
+        self.first = []
+        self.last = []
+
+    def sample(self, cycle):
+        valid = self.tvalid.value
+        if not valid:
+            if self.in_frame:
+                self.bubble_cycles += 1
+            return
+        self.valid_cycles += 1
+        if self.tready is not None and not self.tready.value:
+            self.stall_cycles += 1
+            if self.in_frame:
+                self.bubble_cycles += 1
+            return
+        self.beats += 1
+        if not self.in_frame:
+            self.first.append((cycle, get_sim_time('ns')))
+            self.in_frame = True
+        if self.tlast.value:
+            self.last.append((cycle, get_sim_time('ns')))
+            self.in_frame = False
+
+    def summary(self, cycles):
+        return {
+            'frames': len(self.last),
+            'beats': self.beats,
+            'beats_per_cycle': self.beats / cycles if cycles else None,
+            'bubble_cycles': self.bubble_cycles,
+            'backpressure_duty': self.stall_cycles / self.valid_cycles if self.valid_cycles else None,
+        }
+
+
+def _offered(port):
+    generator = getattr(port, '_pause_generator', None)
+    return generator.summary() if hasattr(generator, 'summary') else None
+
+
+class StreamMonitor(object):
+    """Timestamp the frames going into and coming out of the DUT, in cycles and sim time.
+
+    Attach to the AxiStreamSource driving the DUT sink and the AxiStreamSink
+    receiving from the DUT source. The n-th frame out of the DUT is paired
+    with the n-th frame into it, so latencies only hold for DUTs that do not
+    drop or reorder frames. Latency is from the first beat in to the first
+    beat out, and from the last beat in to the last beat out.
+
+    The monitor samples both interfaces on every clock, so it has a cost per
+    simulated cycle; start it only in tests that report statistics.
+    """
+
+    def __init__(self, source, sink, clock=None):
+        self.clock = clock if clock is not None else source.clock
+        self.source = source
+        self.sink = sink
+        self.ingress = _Port(source.bus)
+        self.egress = _Port(sink.bus)
+        self.cycles = 0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = cocotb.start_soon(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    async def _run(self):
+        edge = RisingEdge(self.clock)
+        ingress, egress = self.ingress, self.egress
+        while True:
+            await edge
+            self.cycles += 1
+            ingress.sample(self.cycles)
+            egress.sample(self.cycles)
+
+    def frames(self):
+        """Per frame rows: first/last beat cycle in and out, and the latencies in cycles and ns."""
+        rows = []
+        for i, (first_in, last_in, first_out, last_out) in enumerate(
+                zip(self.ingress.first, self.ingress.last, self.egress.first, self.egress.last)):
+            rows.append({
+                'frame': i,
+                'first_in': first_in[0], 'last_in': last_in[0],
+                'first_out': first_out[0], 'last_out': last_out[0],
+                'latency_cycles': first_out[0] - first_in[0],
+                'latency_ns': first_out[1] - first_in[1],
+                'last_latency_cycles': last_out[0] - last_in[0],
+            })
+        return rows
+
+    def summary(self):
+        rows = self.frames()
+        # cycles from the first beat into the DUT up to the last beat out of it
+        active = 0
+        if self.ingress.first and self.egress.last:
+            active = self.egress.last[-1][0] - self.ingress.first[0][0] + 1
+        return {
+            'cycles': self.cycles,
+            'active_cycles': active,
+            'ingress': self.ingress.summary(active),
+            'egress': self.egress.summary(active),
+            'latency_cycles': distribution([r['latency_cycles'] for r in rows]),
+            'latency_ns': distribution([r['latency_ns'] for r in rows]),
+            'last_latency_cycles': distribution([r['last_latency_cycles'] for r in rows]),
+            # load offered by the pause generators of common/pause.py on the source and sink, if any
+            'offered_load': {'ingress': _offered(self.source), 'egress': _offered(self.sink)},
+        }
+
+    def write(self, name, directory=None):
+        """Write the summary to <name>.json and the per frame rows to <name>.csv.
+
+        The directory defaults to $STATS_DIR, or stats/ in the working directory.
+        """
+        directory = directory or os.environ.get('STATS_DIR', 'stats')
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, name)
+        summary = self.summary()
+        with open(path + '.json', 'w') as f:
+            json.dump(dict(summary, name=name), f, indent=2)
+        with open(path + '.csv', 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['frame', 'first_in', 'last_in', 'first_out', 'last_out',
+                                                   'latency_cycles', 'latency_ns', 'last_latency_cycles'])
+            writer.writeheader()
+            writer.writerows(self.frames())
+        return summary
@@ -0,0 +1,263 @@
+"""
+
+Pause generators for AXI Stream sources (set_pause_generator) and for sink
+ready: fixed patterns, Bernoulli, bursty on/off (Markov), a token bucket at a
+target rate in Gb/s, and replay of recorded ready traces.
+
+A pause generator yields one value per clock cycle, true to pause (deassert
+tvalid, or tready on a sink). Each generator here is also the factory the
+testbenches pass around: calling it returns a fresh copy to run, and its
+__name__ names the statistics it is run with. It reports the load it offers,
+the fraction of cycles it does not pause, both nominal ('load') and as
+measured over the cycles it ran ('measured_load'), so DUT throughput can be
+plotted against offered load.
+
+In the testbenches TB_IDLE selects a generator by name or by spec, see parse():
+
+    TB_IDLE=bernoulli:0.25 TB_IDLE=markov:16:4 TB_IDLE=rate:40:3:512 TB_IDLE=trace:ready.txt
+
+Random generators parsed from a spec are seeded from TB_SEED, or from the
+spec (bernoulli:0.25:7), so runs are reproducible. Every copy of a seeded
+generator draws its own stream, the n-th copy from (seed, n), so a source
+and a sink paused by one generator do not pause in lockstep.
+
+"""
+
+import copy
+import os
+
+import numpy as np
+
+from cocotb.triggers import RisingEdge
+
+# random decisions drawn per chunk of cycles
+CHUNK = 4096
+
+
+class PauseGenerator(object):
+    """Base of the pause generators: counts cycles and pauses, subclasses implement _pauses()."""
+
+    load = 1.0
+
+    def __init__(self, name):
+        self.__name__ = name
+        self.cycles = 0
+        self.paused = 0
+        self.stream = 0
+        self._copies = 0
+        self._iterator = None
+
+    def __call__(self):
+        # a fresh copy, so one generator can pause a source and a sink at the same time
+        self._copies += 1
+        generator = copy.copy(self)
+        generator.cycles = 0
+        generator.paused = 0
+        generator.stream = self._copies
+        generator._copies = 0
+        generator._iterator = generator._pauses()
+        return generator
+
+    def _rng(self, seed):
+        # unseeded draws from the OS, seeded copies each draw their own reproducible stream
+        return np.random.default_rng(None if seed is None else [seed, self.stream])
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._iterator is None:
+            self._iterator = self._pauses()
+        pause = next(self._iterator)
+        self.cycles += 1
+        self.paused += pause
+        return pause
+
+    def _pauses(self):
+        raise NotImplementedError
+
+    @property
+    def measured_load(self):
+        """Fraction of the cycles so far that did not pause, or None before the first cycle."""
+        return 1 - self.paused / self.cycles if self.cycles else None
+
+    def gbps(self, data_width, period_ns):
+        """Nominal offered rate in Gb/s on a bus of 'data_width' bits clocked every 'period_ns'."""
+        return self.load * data_width / period_ns
+
+    def summary(self):
+        return {'name': self.__name__, 'load': self.load, 'measured_load': self.measured_load,
+                'cycles': self.cycles}
+
+
+class Pattern(PauseGenerator):
+    """A fixed pattern of pauses, repeated, like itertools.cycle([1, 1, 1, 0])."""
+
+    def __init__(self, pattern, name=None):
+        super().__init__(name or "pattern_" + "".join(str(int(p)) for p in pattern))
+        self.pattern = [int(bool(p)) for p in pattern]
+        self.load = 1 - sum(self.pattern) / len(self.pattern)
+
+    def _pauses(self):
+        while True:
+            yield from self.pattern
+
+
+class Bernoulli(PauseGenerator):
+    """Pause every cycle independently with probability 'pause'."""
+
+    def __init__(self, pause, seed=None, name=None):
+        super().__init__(name or "bernoulli_%g" % pause)
+        self.pause = pause
+        self.seed = seed
+        self.load = 1 - pause
+
+    def _pauses(self):
+        rng = self._rng(self.seed)
+        while True:
+            yield from (rng.random(CHUNK) < self.pause).astype(np.uint8).tolist()
+
+
+class Markov(PauseGenerator):
+    """Bursty on/off: runs of 'on' and 'off' cycles, geometrically distributed with the given means.
+
+    The mean run lengths set both the offered load, on / (on + off), and
+    the burstiness at that load.
+    """
+
+    def __init__(self, on, off, seed=None, name=None):
+        if on < 1 or off < 1:
+            raise ValueError("mean run lengths must be at least one cycle, got on=%g, off=%g" % (on, off))
+        super().__init__(name or "markov_%g_%g" % (on, off))
+        self.on = on
+        self.off = off
+        self.seed = seed
+        self.load = on / (on + off)
+
+    def _pauses(self):
+        rng = self._rng(self.seed)
+        # start in the stationary distribution
+        pause = int(rng.random() >= self.load)
+        while True:
+            # runs of alternating state, as many as about CHUNK cycles take
+            runs = np.empty(2 * max(1, int(CHUNK / (self.on + self.off))), dtype=np.int64)
+            runs[0::2] = rng.geometric(1 / (self.off if pause else self.on), len(runs) // 2)
+            runs[1::2] = rng.geometric(1 / (self.on if pause else self.off), len(runs) // 2)
+            values = np.zeros(len(runs), dtype=np.uint8)
+            values[0::2] = pause
+            values[1::2] = 1 - pause
+            yield from np.repeat(values, runs).tolist()
+
+
+class TokenBucket(PauseGenerator):
+    """Offer 'gbps' on a bus of 'data_width' bits clocked every 'period_ns', in bursts of 'burst' beats.
+
+    Every cycle adds rate tokens; once there are 'burst' tokens, that many
+    beats go back-to-back. BlackwireReceive runs at period_ns=3 in
+    simulation, standing in for its 322 MHz clock.
+    """
+
+    def __init__(self, gbps, period_ns=3, data_width=512, burst=1, name=None):
+        super().__init__(name or "rate_%gG" % gbps)
+        self.rate = gbps * period_ns / data_width
+        if not 0 < self.rate <= 1:
+            raise ValueError("%g Gb/s is not within what %d bits every %g ns carries" % (gbps, data_width, period_ns))
+        self.burst = max(int(burst), 1)
+        self.load = self.rate
+
+    def _pauses(self):
+        rate = self.rate
+        burst = self.burst
+        tokens = 0.0
+        sending = 0
+        while True:
+            tokens += rate
+            if sending:
+                sending -= 1
+                yield 0
+            elif tokens >= burst:
+                tokens -= burst
+                sending = burst - 1
+                yield 0
+            else:
+                yield 1
+
+
+class Trace(PauseGenerator):
+    """Replay a recorded ready trace, one value per cycle, true for ready, repeated.
+
+    'ready' is a sequence of values, or the path of a text file of 0 and 1
+    characters or of a .npy array, as written by save_trace().
+    """
+
+    def __init__(self, ready, name=None):
+        if isinstance(ready, str):
+            name = name or "trace_" + ready.rsplit('/', 1)[-1].split('.')[0]
+            ready = load_trace(ready)
+        super().__init__(name or "trace")
+        self.pauses = (~np.asarray(ready, dtype=bool)).astype(np.uint8).tolist()
+        if not self.pauses:
+            raise ValueError("empty ready trace")
+        self.load = 1 - sum(self.pauses) / len(self.pauses)
+
+    def _pauses(self):
+        while True:
+            yield from self.pauses
+
+
+def load_trace(path):
+    if path.endswith('.npy'):
+        return np.load(path).astype(bool)
+    with open(path) as f:
+        return np.array([c == '1' for c in f.read() if c in '01'], dtype=bool)
+
+
+def save_trace(path, ready):
+    ready = np.asarray(ready, dtype=bool)
+    if path.endswith('.npy'):
+        np.save(path, ready)
+    else:
+        with open(path, 'w') as f:
+            f.write(''.join('1' if r else '0' for r in ready.tolist()))
+
+
+async def record(signal, clock, cycles):
+    """Record a ready (or valid) signal for 'cycles' cycles at the rising edge, for Trace()."""
+    edge = RisingEdge(clock)
+    values = np.zeros(cycles, dtype=bool)
+    for i in range(cycles):
+        await edge
+        value = signal.value
+        values[i] = value.is_resolvable and bool(value.integer)
+    return values
+
+
+def parse(spec, seed=None):
+    """A pause generator from a spec, or None for 'None' or an empty spec.
+
+    pattern:1110  bernoulli:PAUSE[:SEED]  markov:ON:OFF[:SEED]  rate:GBPS[:PERIOD_NS[:DATA_WIDTH[:BURST]]]  trace:PATH
+
+    Without a SEED in the spec, random generators are seeded with 'seed', by
+    default TB_SEED or 1.
+    """
+    if not spec or spec == "None":
+        return None
+    kind, _, rest = spec.partition(':')
+    args = rest.split(':') if rest else []
+    if seed is None:
+        seed = int(os.environ.get("TB_SEED", "1"))
+    if kind == 'pattern':
+        return Pattern([int(c) for c in args[0]])
+    if kind == 'bernoulli':
+        return Bernoulli(float(args[0]), seed=int(args[1]) if len(args) > 1 else seed)
+    if kind == 'markov':
+        return Markov(float(args[0]), float(args[1]), seed=int(args[2]) if len(args) > 2 else seed)
+    if kind == 'rate':
+        return TokenBucket(float(args[0]), *[float(a) if i == 0 else int(a) for i, a in enumerate(args[1:])])
+    if kind == 'trace':
+        return Trace(rest)
+    raise ValueError("unknown pause generator %r" % spec)
+
+
+# the pause pattern the testbenches always used, three cycles paused out of four
+cycle_pause = Pattern([1, 1, 1, 0], name="cycle_pause")
@@ -0,0 +1,157 @@
+"""
+
+Capture files of the Ethernet frames through the testbench, readable by Wireshark and tcpdump.
+
+"""
+
+import mmap
+import struct
+
+from cocotb.utils import get_sim_time
+
+# classic pcap with nanosecond timestamps, link type Ethernet
+PCAP_MAGIC_NS = 0xa1b23c4d
+LINKTYPE_ETHERNET = 1
+PCAP_HEADER = struct.Struct('<IHHiIII')
+PCAP_RECORD = struct.Struct('<IIII')
+PCAP_MAGIC_US = 0xa1b2c3d4
+
+# pcapng block types and the byte order magic in the section header block
+PCAPNG_SHB = 0x0a0d0d0a
+PCAPNG_IDB = 0x00000001
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+PCAPNG_BYTE_ORDER = 0x1a2b3c4d
+
+
+class PcapWriter(object):
+    """Write frames to a pcap file, timestamped with the simulation time."""
+
+    def __init__(self, path, snaplen=65535):
+        self.path = path
+        self.snaplen = snaplen
+        self.file = open(path, 'wb')
+        self.file.write(PCAP_HEADER.pack(PCAP_MAGIC_NS, 2, 4, 0, 0, snaplen, LINKTYPE_ETHERNET))
+        self.frames = 0
+
+    def write(self, data, ns=None):
+        if ns is None:
+            ns = int(get_sim_time('ns'))
+        captured = data[:self.snaplen]
+        self.file.write(PCAP_RECORD.pack(ns // 1000000000, ns % 1000000000, len(captured), len(data)))
+        self.file.write(captured)
+        self.frames += 1
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PcapReader(object):
+    """Iterate over the frames of a pcap or pcapng file, as (timestamp in ns, frame).
+
+    The file is memory mapped and parsed lazily, one record at a time, so a
+    capture of any size is replayed in constant memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < 4:
+            raise ValueError("%s: not a pcap or pcapng file" % path)
+        magic = struct.unpack_from('<I', self.map)[0]
+        if magic == PCAPNG_SHB:
+            self.format = 'pcapng'
+        elif magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS) or struct.unpack_from('>I', self.map)[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            self.format = 'pcap'
+        else:
+            raise ValueError("%s: not a pcap or pcapng file" % path)
+
+    def __iter__(self):
+        return self._pcapng() if self.format == 'pcapng' else self._pcap()
+
+    def _pcap(self):
+        data = self.map
+        endian = '<' if struct.unpack_from('<I', data)[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS) else '>'
+        magic, _, _, _, _, _, linktype = struct.unpack_from(endian + 'IHHiIII', data)
+        if linktype != LINKTYPE_ETHERNET:
+            raise ValueError("%s: link type %d is not Ethernet" % (self.path, linktype))
+        scale = 1 if magic == PCAP_MAGIC_NS else 1000
+        record = struct.Struct(endian + 'IIII')
+        offset = PCAP_HEADER.size
+        while offset + record.size <= len(data):
+            sec, frac, caplen, _ = record.unpack_from(data, offset)
+            offset += record.size
+            yield sec * 1000000000 + frac * scale, data[offset:offset + caplen]
+            offset += caplen
+
+    def _pcapng(self):
+        data = self.map
+        endian = '<'
+        # per interface: link type and timestamp resolution as (power of ten or two, exponent)
+        interfaces = []
+        offset = 0
+        while offset + 12 <= len(data):
+            block_type = struct.unpack_from(endian + 'I', data, offset)[0]
+            if block_type == PCAPNG_SHB:
+                endian = '<' if struct.unpack_from('<I', data, offset + 8)[0] == PCAPNG_BYTE_ORDER else '>'
+                interfaces = []
+            length = struct.unpack_from(endian + 'I', data, offset + 4)[0]
+            if length < 12 or offset + length > len(data):
+                break
+            body = offset + 8
+            if block_type == PCAPNG_IDB:
+                linktype = struct.unpack_from(endian + 'H', data, body)[0]
+                interfaces.append((linktype, self._tsresol(data, endian, body + 8, offset + length - 4)))
+            elif block_type == PCAPNG_EPB:
+                interface, high, low, caplen, _ = struct.unpack_from(endian + 'IIIII', data, body)
+                linktype, resolution = interfaces[interface]
+                if linktype != LINKTYPE_ETHERNET:
+                    raise ValueError("%s: link type %d is not Ethernet" % (self.path, linktype))
+                yield self._ns((high << 32) | low, resolution), data[body + 20:body + 20 + caplen]
+            elif block_type == PCAPNG_SPB:
+                size = struct.unpack_from(endian + 'I', data, body)[0]
+                caplen = min(size, length - 16)
+                yield 0, data[body + 4:body + 4 + caplen]
+            offset += length
+
+    @staticmethod
+    def _tsresol(data, endian, offset, end):
+        # if_tsresol option, default microseconds
+        while offset + 4 <= end:
+            code, length = struct.unpack_from(endian + 'HH', data, offset)
+            if code == 0:
+                break
+            if code == 9:
+                value = data[offset + 4]
+                return (2, value & 0x7f) if value & 0x80 else (10, value)
+            offset += 4 + (length + 3) // 4 * 4
+        return (10, 6)
+
+    @staticmethod
+    def _ns(timestamp, resolution):
+        base, exponent = resolution
+        if base == 2:
+            return (timestamp * 1000000000) >> exponent
+        if exponent <= 9:
+            return timestamp * 10 ** (9 - exponent)
+        return timestamp // 10 ** (exponent - 9)
+
+    def close(self):
+        if not self.file.closed:
+            self.map.close()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
@@ -0,0 +1,64 @@
+"""
+
+Per-frame sideband signals alongside back-to-back AXI Stream frames, and the
+frame lengths and beat counts the scoreboards expect.
+
+"""
+
+import collections
+
+import numpy as np
+
+import cocotb
+from cocotb.triggers import RisingEdge
+
+# sink_length and source_length are 12 bits
+LENGTH_MASK = 0xfff
+
+
+def beat_counts(lengths, keep_bytes):
+    """Number of beats of every frame on a bus of 'keep_bytes' byte lanes, at least one."""
+    return np.maximum(-(-np.asarray(lengths, dtype=np.int64) // keep_bytes), 1)
+
+
+class FrameLengthDriver(object):
+    """Drive a per-frame sideband signal, such as sink_length, alongside an AXI Stream source.
+
+    DUTs sample sink_length on every beat, so with frames queued back-to-back
+    the signal must switch to the next frame exactly after the last beat of
+    the current one was accepted. Call push() for every frame sent, in order.
+    'source' can also be an AxiStreamSink, for a signal the DUT samples at its
+    output, such as the header of AxisInsertHeader.
+    Lengths are driven modulo the signal width, as a 12-bit sink_length
+    carries jumbo frame lengths modulo 4096.
+    """
+
+    def __init__(self, source, signal):
+        self.source = source
+        self.signal = signal
+        self.mask = (1 << len(signal)) - 1
+        self.lengths = collections.deque()
+        self._task = None
+
+    def push(self, length):
+        self.lengths.append(length)
+        if len(self.lengths) == 1:
+            self.signal.value = length & self.mask
+        if self._task is None:
+            self._task = cocotb.start_soon(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    async def _run(self):
+        bus = self.source.bus
+        while self.lengths:
+            await RisingEdge(self.source.clock)
+            accepted = bus.tvalid.value and (not hasattr(bus, "tready") or bus.tready.value)
+            if accepted and bus.tlast.value:
+                self.lengths.popleft()
+                if self.lengths:
+                    self.signal.value = self.lengths[0] & self.mask
+        self._task = None
@@ -0,0 +1,98 @@
+"""
+
+Traffic backend that needs no TAP interface (nor root): replay a pcap or pcapng
+capture into the DUT, and capture the DUT output to a pcap file.
+
+"""
+
+import logging
+
+import cocotb
+from cocotb.result import SimTimeoutError
+from cocotb.triggers import Event, Timer, with_timeout
+from cocotb.utils import get_sim_time
+
+from cocotbext.axi import AxiStreamFrame
+
+from .log import FrameLog
+from .pcap import PcapReader, PcapWriter
+from .pipeline import FrameLengthDriver
+
+
+class PcapReplay(object):
+    """Replay the frames of a capture file into the DUT, and capture the frames out of it.
+
+    Frames are sent back-to-back at full simulator speed, or if 'timed' at
+    the capture timestamps relative to the first frame. At most 'window'
+    frames are queued in the AXI Stream source, so the capture is never read
+    ahead of the DUT. The DUT output is written to the 'capture' pcap file.
+
+    If 'length' is given, it is the DUT signal set to the frame length on
+    every frame passed to the source (such as dut.sink_length).
+    """
+
+    def __init__(self, path, source, sink, capture=None, length=None, log=None, window=16, timed=False):
+        self.path = path
+        self.source = source
+        self.sink = sink
+        self.capture = PcapWriter(capture) if capture else None
+        self.length = FrameLengthDriver(source, length) if length is not None else None
+        self.log = log if log is not None else logging.getLogger("cocotb.tb")
+        self.log_sent = FrameLog(self.log, "pcap to TB")
+        self.log_received = FrameLog(self.log, "TB to pcap")
+        self.window = window
+        self.timed = timed
+        self.frames_sent = 0
+        self.frames_received = 0
+        self._progress = Event()
+
+    async def run(self, idle=(10, 'us')):
+        """Replay all frames, then wait until the DUT output is idle for 'idle'."""
+        limit = self.source.queue_occupancy_limit_frames
+        self.source.queue_occupancy_limit_frames = self.window
+        consumer = cocotb.start_soon(self._consume())
+        try:
+            with PcapReader(self.path) as reader:
+                await self._produce(reader)
+            await self.source.wait()
+            while True:
+                self._progress.clear()
+                try:
+                    await with_timeout(self._progress.wait(), *idle)
+                except SimTimeoutError:
+                    break
+        finally:
+            consumer.kill()
+            self.source.queue_occupancy_limit_frames = limit
+            if self.length is not None:
+                self.length.stop()
+            if self.capture is not None:
+                self.capture.close()
+            self.log_sent.close()
+            self.log_received.close()
+        self.log.info("PcapReplay %s: %d frames sent, %d frames received", self.path, self.frames_sent, self.frames_received)
+
+    async def _produce(self, reader):
+        start = None
+        for timestamp, data in reader:
+            if self.timed:
+                if start is None:
+                    start = int(get_sim_time('ns')) - timestamp
+                delay = start + timestamp - int(get_sim_time('ns'))
+                if delay > 0:
+                    await Timer(delay, 'ns')
+            if self.length is not None:
+                self.length.push(len(data))
+            await self.source.send(AxiStreamFrame(data))
+            self.log_sent(data)
+            self.frames_sent += 1
+
+    async def _consume(self):
+        while True:
+            rx_frame = await self.sink.recv()
+            data = bytes(rx_frame.tdata)
+            self.log_received(data)
+            if self.capture is not None:
+                self.capture.write(data)
+            self.frames_received += 1
+            self._progress.set()
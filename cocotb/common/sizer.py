@@ -0,0 +1,247 @@
+"""
+
+Reference model of AxisUpSizer and AxisDownSizer, vectorized over batches of
+frames, and a scoreboard that checks their source stream.
+
+Frames are a zero-padded NumPy byte matrix, one frame per row, plus the frame
+lengths. to_beats() cuts them into the beats of a data width: one row of
+bytes per beat, with tkeep per byte and tlast per beat. resize() repacks
+beats to another width, as the sizers do. When the widths divide evenly, and
+every frame fills whole beats of the wider width, both are reshapes of the
+same memory, without copying.
+
+"""
+
+import collections
+import logging
+
+import numpy as np
+
+import cocotb
+from cocotb.triggers import RisingEdge
+
+from .pipeline import LENGTH_MASK, beat_counts
+
+# tdata (beats, bytes) uint8, tkeep (beats, bytes) bool, tlast (beats,) bool, frame index per beat
+Beats = collections.namedtuple('Beats', 'tdata tkeep tlast frame')
+
+
+def frame_matrix(frames):
+    """Frames as a zero-padded (n, width) uint8 matrix, width the longest frame, and the frame lengths."""
+    lengths = np.fromiter((len(frame) for frame in frames), dtype=np.int64, count=len(frames))
+    width = int(lengths.max()) if len(lengths) else 0
+    data = bytearray(len(lengths) * width)
+    for i, frame in enumerate(frames):
+        data[i * width:i * width + len(frame)] = frame
+    return np.frombuffer(data, dtype=np.uint8).reshape(len(lengths), width), lengths
+
+
+def _keep(lengths, counts, keep_bytes):
+    # tkeep of all beats, full except the last beat of every frame
+    remaining = np.repeat(np.asarray(lengths, dtype=np.int64), counts)
+    position = np.arange(len(remaining)) - np.repeat(np.cumsum(counts) - counts, counts)
+    remaining -= position * keep_bytes
+    return np.arange(keep_bytes) < remaining[:, None]
+
+
+def _beats(tdata, lengths, counts, keep_bytes):
+    frame = np.repeat(np.arange(len(counts)), counts)
+    tlast = np.zeros(len(frame), dtype=bool)
+    tlast[np.cumsum(counts) - 1] = True
+    return Beats(tdata, _keep(lengths, counts, keep_bytes), tlast, frame)
+
+
+def to_beats(matrix, lengths, data_width):
+    """Cut frames into beats of 'data_width' bits.
+
+    The beats are a view of 'matrix' if its width is a whole number of beats
+    and every frame uses all of them, as frames of equal length do, and a
+    copy of the used beats otherwise.
+    """
+    keep_bytes = data_width // 8
+    matrix = np.asarray(matrix, dtype=np.uint8)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    counts = beat_counts(lengths, keep_bytes)
+    if matrix.shape[1] % keep_bytes:
+        matrix = np.pad(matrix, ((0, 0), (0, keep_bytes - matrix.shape[1] % keep_bytes)))
+    per_frame = max(matrix.shape[1] // keep_bytes, 1)
+    if not matrix.shape[1]:
+        matrix = np.zeros((len(lengths), keep_bytes), dtype=np.uint8)
+    beats = matrix.reshape(len(lengths), per_frame, keep_bytes)
+    if (counts == per_frame).all():
+        tdata = beats.reshape(-1, keep_bytes)
+    else:
+        tdata = beats[np.arange(per_frame) < counts[:, None]]
+    return _beats(tdata, lengths, counts, keep_bytes)
+
+
+def from_beats(beats):
+    """The frames of a beat stream, as a zero-padded byte matrix and the frame lengths."""
+    frames = int(beats.frame[-1]) + 1 if len(beats.frame) else 0
+    lengths = np.bincount(beats.frame, weights=beats.tkeep.sum(axis=1), minlength=frames).astype(np.int64)
+    counts = np.bincount(beats.frame, minlength=frames)
+    keep_bytes = beats.tdata.shape[1]
+    per_frame = int(counts.max()) if frames else 0
+    matrix = np.zeros((frames, per_frame, keep_bytes), dtype=np.uint8)
+    matrix[np.arange(per_frame) < counts[:, None]] = np.where(beats.tkeep, beats.tdata, 0)
+    return matrix.reshape(frames, per_frame * keep_bytes), lengths
+
+
+def resize(beats, data_width):
+    """Repack a beat stream to beats of 'data_width' bits, as AxisUpSizer and AxisDownSizer do.
+
+    Frames start on a new beat and the last beat of a frame is cut short, so
+    unused lanes are zero. Downsizing is a reshape of every beat into
+    'factor' narrower beats, dropping the empty ones after the last byte of a
+    frame; upsizing gathers 'factor' beats per wider beat, a reshape if all
+    frames have a multiple of 'factor' beats.
+    """
+    keep_in = beats.tdata.shape[1]
+    keep_out = data_width // 8
+    frames = int(beats.frame[-1]) + 1 if len(beats.frame) else 0
+    lengths = np.bincount(beats.frame, weights=beats.tkeep.sum(axis=1), minlength=frames).astype(np.int64)
+    counts = beat_counts(lengths, keep_out)
+    if keep_out == keep_in:
+        return beats
+    if keep_in % keep_out == 0:
+        tdata = beats.tdata.reshape(-1, keep_out)
+        tkeep = beats.tkeep.reshape(-1, keep_out)
+        if len(tdata) != counts.sum():
+            # drop the narrow beats past the last byte of a frame
+            tdata = tdata[tkeep.any(axis=1)]
+        return _beats(tdata, lengths, counts, keep_out)
+    if keep_out % keep_in == 0:
+        factor = keep_out // keep_in
+        tdata = np.where(beats.tkeep, beats.tdata, 0) if not beats.tkeep.all() else beats.tdata
+        if len(tdata) == counts.sum() * factor:
+            return _beats(tdata.reshape(-1, keep_out), lengths, counts, keep_out)
+        # beat index within its frame, and the wide beat and lane it lands in
+        in_counts = np.bincount(beats.frame, minlength=frames)
+        position = np.arange(len(tdata)) - np.repeat(np.cumsum(in_counts) - in_counts, in_counts)
+        wide = np.repeat(np.cumsum(counts) - counts, in_counts) + position // factor
+        out = np.zeros((int(counts.sum()), factor, keep_in), dtype=np.uint8)
+        out[wide, position % factor] = tdata
+        return _beats(out.reshape(-1, keep_out), lengths, counts, keep_out)
+    raise ValueError("data widths %d and %d do not divide" % (keep_in * 8, data_width))
+
+
+class SizerScoreboard(object):
+    """Check the source stream of AxisUpSizer or AxisDownSizer against resize().
+
+    Call expect() with every frame sent on the sink, in order. The scoreboard
+    drives source_tready, optionally paused by a pause generator like
+    cocotbext-axi's, and records every accepted beat with a single read of
+    tdata; the beats are checked in batches of 'batch' frames, and whatever
+    is left on check(), so checking costs little next to the simulator.
+
+    source_length is compared on the first beat of every frame, modulo 4096
+    as it is 12 bits wide, unless 'length' is False.
+    """
+
+    def __init__(self, dut, data_width_in, clock=None, prefix="source", batch=1024, length=True, log=None):
+        self.dut = dut
+        self.clock = clock if clock is not None else dut.clk
+        self.tvalid = getattr(dut, prefix + "_tvalid")
+        self.tready = getattr(dut, prefix + "_tready")
+        self.tlast = getattr(dut, prefix + "_tlast")
+        self.tdata = getattr(dut, prefix + "_tdata")
+        self.length = getattr(dut, prefix + "_length") if length else None
+        self.data_width_in = data_width_in
+        self.data_width_out = len(self.tdata)
+        self.batch = batch
+        self.log = log if log is not None else logging.getLogger("cocotb.tb")
+        self.frames = 0
+        self.beats = 0
+        self.mismatches = 0
+        self._pause = None
+        self._expected = collections.deque()
+        self._data = []
+        self._last = []
+        self._lengths = []
+        # complete frames in _data
+        self._complete = 0
+        self._task = None
+
+    @property
+    def received(self):
+        """Frames received so far, checked or not."""
+        return self.frames + self._complete
+
+    def set_pause_generator(self, generator=None):
+        self._pause = generator
+
+    def expect(self, frame):
+        self._expected.append(frame)
+
+    def start(self):
+        if self._task is None:
+            self.tready.value = 0 if self._pause is not None else 1
+            self._task = cocotb.start_soon(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    async def _run(self):
+        edge = RisingEdge(self.clock)
+        tvalid, tready, tlast, tdata = self.tvalid, self.tready, self.tlast, self.tdata
+        first = True
+        while True:
+            await edge
+            if tvalid.value and tready.value:
+                self._data.append(tdata.value.integer)
+                last = bool(tlast.value)
+                self._last.append(last)
+                if first and self.length is not None:
+                    self._lengths.append(self.length.value.integer)
+                first = last
+                if last:
+                    self._complete += 1
+                    if self._complete >= self.batch:
+                        self.check()
+            if self._pause is not None:
+                tready.value = not next(self._pause)
+
+    def check(self):
+        """Check the complete frames received so far, returns the total number of mismatches."""
+        frames = self._complete
+        if not frames:
+            return self.mismatches
+        beats = len(self._last) - self._last[::-1].index(True)
+        keep_out = self.data_width_out // 8
+        data = b''.join(value.to_bytes(keep_out, 'little') for value in self._data[:beats])
+        observed = np.frombuffer(data, dtype=np.uint8).reshape(beats, keep_out)
+        observed_last = np.array(self._last[:beats], dtype=bool)
+        sent = [self._expected.popleft() for _ in range(min(frames, len(self._expected)))]
+        if len(sent) < frames:
+            self.log.error("SizerScoreboard %d frames received that were never sent", frames - len(sent))
+            self.mismatches += frames - len(sent)
+        matrix, lengths = frame_matrix(sent)
+        expected = resize(to_beats(matrix, lengths, self.data_width_in), self.data_width_out)
+
+        # frame boundaries first, then the kept bytes of frames with the right number of beats
+        observed_counts = np.diff(np.concatenate(([0], np.flatnonzero(observed_last) + 1)))[:len(sent)]
+        expected_counts = beat_counts(lengths, keep_out)
+        wrong_beats = observed_counts != expected_counts
+        wrong_data = np.zeros(len(sent), dtype=bool)
+        if not wrong_beats.any():
+            bad = ((observed[:len(expected.tdata)] != expected.tdata) & expected.tkeep).any(axis=1)
+            wrong_data[expected.frame[bad]] = True
+        else:
+            # beats no longer line up after the first frame with a wrong beat count
+            wrong_data[np.argmax(wrong_beats):] = True
+        wrong_length = np.zeros(len(sent), dtype=bool)
+        if self.length is not None:
+            wrong_length = np.array(self._lengths[:len(sent)], dtype=np.int64) != (lengths & LENGTH_MASK)
+        errors = wrong_beats | wrong_data | wrong_length
+        for i in np.flatnonzero(errors)[:16]:
+            self.log.error("Frame %d of %d bytes: %d beats, expected %d%s%s", self.frames + i, lengths[i],
+                           observed_counts[i], expected_counts[i], ", data mismatch" if wrong_data[i] else "",
+                           ", source_length %d" % self._lengths[i] if wrong_length[i] else "")
+        self.mismatches += int(errors.sum())
+        self.frames += frames
+        self.beats += beats
+        del self._data[:beats], self._last[:beats], self._lengths[:frames]
+        self._complete = 0
+        return self.mismatches
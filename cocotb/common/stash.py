@@ -0,0 +1,259 @@
+"""
+
+Discrete-event model of CorundumFrameStash and CorundumFrameFlowStash, for
+sizing fifoSize (and maxPacketFifoWords) per link speed without running RTL.
+
+The stash is store-and-forward: a frame leaves only once it is completely in
+the FIFO, and the FIFO holds fifoSize + 1 words. The model steps per frame,
+not per cycle. Every frame is written one beat per cycle, no earlier than the
+beat fifoSize + 1 words ahead of it was read. It is read out one beat per
+ready cycle of the downstream ready pattern. So a million frames take
+seconds, independent of their length and of idle time.
+
+The model is cycle-approximate. The register stages in front of and behind
+the FIFO are lumped into one fixed 'latency', and FIFO occupancy is reported
+at the end of every frame written.
+
+    python -m common.stash --data-width 512 --gbps 100 --clock-mhz 322 --fifo-size 16 32 64 --imix
+
+"""
+
+import argparse
+import bisect
+import collections
+
+import numpy as np
+
+# the usual simple IMIX: 7 : 4 : 1 frames of 64, 576 and 1500 bytes
+IMIX = ((64, 7), (576, 4), (1500, 1))
+# Ethernet preamble, start of frame delimiter, FCS and interframe gap, in bytes
+ETHERNET_OVERHEAD = 8 + 4 + 12
+
+
+def default_fifo_size(data_width):
+    """CorundumFrameStash(dataWidth).fifoSize: the words for 1532 bytes, rounded up to a power of two."""
+    words = -(-1532 // (data_width // 8))
+    return 1 << (words - 1).bit_length()
+
+
+def imix_lengths(frames, rng=None, mix=IMIX):
+    """Frame lengths drawn from a (length, weight) mix."""
+    rng = rng if rng is not None else np.random.default_rng()
+    lengths, weights = zip(*mix)
+    return rng.choice(np.array(lengths), size=frames, p=np.array(weights) / sum(weights))
+
+
+def arrivals(lengths, gbps, clock_mhz, overhead=ETHERNET_OVERHEAD):
+    """The cycle each frame is offered at, for back-to-back frames on a 'gbps' link into a 'clock_mhz' clock."""
+    ns = np.cumsum(np.asarray(lengths) + overhead) * 8 / gbps
+    ns = np.concatenate(([0.0], ns[:-1]))
+    return (ns * clock_mhz / 1000).astype(np.int64)
+
+
+class _Ready(object):
+    """Downstream ready pattern, repeated: ready cycle numbering in both directions."""
+
+    def __init__(self, pattern=None):
+        if pattern is None:
+            self.period = None
+            return
+        pattern = np.asarray(pattern, dtype=bool)
+        if not pattern.any():
+            raise ValueError("ready pattern is never ready")
+        self.period = len(pattern)
+        self.count = int(pattern.sum())
+        # the cycles within a period that are ready, and ready cycles before each cycle
+        self.cycles = np.flatnonzero(pattern).tolist()
+        self.before = np.concatenate(([0], np.cumsum(pattern)[:-1])).tolist()
+        self.duty = self.count / self.period
+
+    def before_cycle(self, t):
+        """Number of ready cycles before cycle t."""
+        if self.period is None:
+            return t
+        q, r = divmod(t, self.period)
+        return q * self.count + self.before[r]
+
+    def at(self, n):
+        """The cycle of ready cycle n, counting from 0."""
+        if self.period is None:
+            return n
+        q, r = divmod(n, self.count)
+        return q * self.period + self.cycles[r]
+
+
+Result = collections.namedtuple('Result', 'frames beats truncated dropped in_start in_end out_start out_end '
+                                          'occupancy stall_cycles deadlock')
+
+
+class StashModel(object):
+    """CorundumFrameStash(dataWidth, fifoSize), or with 'max_packet_fifo_words' CorundumFrameFlowStash.
+
+    'latency' is the number of cycles from the last beat written into the
+    stash until the frame can start to leave it, for an idle stash.
+    """
+
+    def __init__(self, data_width=512, fifo_size=None, max_frame_bytes=2048, max_packet_fifo_words=None, latency=6):
+        self.keep_width = data_width // 8
+        self.fifo_size = fifo_size if fifo_size is not None else default_fifo_size(data_width)
+        self.capacity = self.fifo_size + 1
+        self.max_beats = max_frame_bytes // self.keep_width
+        self.max_packet_fifo_words = max_packet_fifo_words
+        self.latency = latency
+
+    def run(self, lengths, arrivals=None, errors=None, ready=None):
+        """Pass frames of 'lengths' bytes through the stash, returns a Result with one entry per frame.
+
+        'arrivals' is the cycle each frame is offered at (default: all at
+        once, saturating the stash), 'errors' marks frames with tuser(0)
+        set, and 'ready' is the downstream ready pattern, one bool per cycle,
+        repeated (default: always ready). Frames over max_frame_bytes are
+        truncated; those and the error frames are dropped on the way out,
+        without waiting for ready. A frame larger than the FIFO can never
+        leave it: the model then reports the deadlock and stops.
+        """
+        lengths = np.asarray(lengths, dtype=np.int64)
+        n = len(lengths)
+        beats = -(-lengths // self.keep_width)
+        # oversize frames push max_beats words and the remainder is thrown away on input
+        fifo_beats = np.minimum(beats, self.max_beats)
+        truncated = beats > self.max_beats
+        dropped = truncated | (np.asarray(errors, dtype=bool) if errors is not None else False)
+        offered = np.zeros(n, dtype=np.int64) if arrivals is None else np.asarray(arrivals, dtype=np.int64)
+        ready = _Ready(ready)
+
+        in_start = []
+        in_end = []
+        out_start = []
+        out_end = []
+        occupancy = []
+        stall = []
+
+        # per frame, as lists for bisect: first FIFO word index, first read cycle, and the
+        # ready cycle count at the first read (or -1 for a dropped frame, read every cycle)
+        first_word = []
+        first_read = []
+        first_ready = []
+        capacity = self.capacity
+        flow = self.max_packet_fifo_words
+        latency = self.latency
+        words = 0
+        previous_in = -1
+        previous_out = -1
+        deadlock = None
+
+        def read_time(m):
+            # cycle FIFO word m is read at
+            k = bisect.bisect_right(first_word, m) - 1
+            if first_ready[k] < 0:
+                return first_read[k] + m - first_word[k]
+            return ready.at(first_ready[k] + m - first_word[k])
+
+        def reads_by(t):
+            # FIFO words read up to and including cycle t
+            k = bisect.bisect_right(first_read, t) - 1
+            if k < 0:
+                return 0
+            if first_ready[k] < 0:
+                done = t - first_read[k] + 1
+            else:
+                done = ready.before_cycle(t + 1) - first_ready[k]
+            return first_word[k] + min(done, fifo_list[k])
+
+        fifo_list = fifo_beats.tolist()
+        for i, (f, b, offer, drop) in enumerate(zip(fifo_list, beats.tolist(), offered.tolist(), dropped.tolist())):
+            if f > capacity:
+                deadlock = i
+                break
+            start = max(offer, previous_in + 1)
+            if flow is not None and i and capacity - (words - reads_by(previous_in)) <= flow:
+                # FlowStash halts the sink after a frame, until the FIFO has room for a maximum size packet
+                start = max(start, read_time(words - capacity + flow) + 1)
+            last_word = words + f - 1
+            # the last word waits for the word 'capacity' ahead of it to be read
+            last_write = start + f - 1
+            if last_word >= capacity:
+                last_write = max(last_write, read_time(last_word - capacity) + 1)
+            stall.append(last_write - (start + f - 1))
+            in_start.append(start)
+            in_end.append(last_write + b - f)
+            occupancy.append(last_word + 1 - reads_by(last_write))
+
+            out = max(last_write + latency, previous_out + 1)
+            first_word.append(words)
+            if drop:
+                first_read.append(out)
+                first_ready.append(-1)
+                end = out + f - 1
+            else:
+                r = ready.before_cycle(out)
+                out = ready.at(r)
+                first_read.append(out)
+                first_ready.append(r)
+                end = ready.at(r + f - 1)
+            out_start.append(out)
+            out_end.append(end)
+            words += f
+            previous_in = in_end[-1]
+            previous_out = end
+
+        frames = n if deadlock is None else deadlock
+        columns = [np.array(c, dtype=np.int64) for c in (in_start, in_end, out_start, out_end, occupancy, stall)]
+        return Result(frames, fifo_beats[:frames], truncated[:frames], dropped[:frames], *columns, deadlock)
+
+    def summary(self, result):
+        """Occupancy, availability, drops and throughput of a run."""
+        frames = result.frames
+        cycles = int(result.out_end[-1] - result.in_start[0] + 1) if frames else 0
+        forwarded = ~result.dropped
+        latency = result.out_start - result.in_start
+        return {
+            'fifo_size': self.fifo_size,
+            'frames': frames,
+            'deadlock_frame': result.deadlock,
+            'truncated': int(result.truncated.sum()),
+            'dropped': int(result.dropped.sum()),
+            'max_occupancy': int(result.occupancy.max()) if frames else 0,
+            # a write that waited for room, or a frame that never fits, found the FIFO full
+            'min_availability': 0 if result.stall_cycles.any() or result.deadlock is not None else
+                                self.capacity - (int(result.occupancy.max()) if frames else 0),
+            'stall_cycles': int(result.stall_cycles.sum()),
+            'stalled_frames': int((result.stall_cycles > 0).sum()),
+            'cycles': cycles,
+            'beats_out_per_cycle': float(result.beats[forwarded].sum()) / cycles if cycles else None,
+            'latency_p50': float(np.percentile(latency, 50)) if frames else None,
+            'latency_p99': float(np.percentile(latency, 99)) if frames else None,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Size the CorundumFrameStash FIFO for a link speed and load.")
+    parser.add_argument("--data-width", type=int, default=512)
+    parser.add_argument("--fifo-size", type=int, nargs='+', help="fifoSize values to compare (default from data width)")
+    parser.add_argument("--max-packet-fifo-words", type=int, help="model CorundumFrameFlowStash with this threshold")
+    parser.add_argument("--frames", type=int, default=1000000)
+    parser.add_argument("--length", type=int, default=1500, help="frame length in bytes, unless --imix")
+    parser.add_argument("--imix", action="store_true", help="simple IMIX frame lengths")
+    parser.add_argument("--gbps", type=float, help="offered line rate (default: saturate)")
+    parser.add_argument("--clock-mhz", type=float, default=322.265625)
+    parser.add_argument("--ready", type=float, default=1.0, help="downstream ready duty cycle, Bernoulli")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    lengths = imix_lengths(args.frames, rng) if args.imix else np.full(args.frames, args.length)
+    offered = arrivals(lengths, args.gbps, args.clock_mhz) if args.gbps else None
+    ready = rng.random(1 << 16) < args.ready if args.ready < 1.0 else None
+    print("%9s %9s %9s %9s %12s %9s %9s" % ("fifoSize", "deadlock", "max_occ", "min_avail", "stall_cyc",
+                                           "beats/cyc", "lat_p99"))
+    for fifo_size in args.fifo_size or [default_fifo_size(args.data_width)]:
+        model = StashModel(args.data_width, fifo_size, max_packet_fifo_words=args.max_packet_fifo_words)
+        s = model.summary(model.run(lengths, offered, ready=ready))
+        print("%9d %9s %9d %9d %12d %9.3f %9.0f" % (
+            fifo_size, s['deadlock_frame'] if s['deadlock_frame'] is not None else '-', s['max_occupancy'],
+            s['min_availability'], s['stall_cycles'], s['beats_out_per_cycle'] or 0.0, s['latency_p99'] or 0.0))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
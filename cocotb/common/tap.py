@@ -0,0 +1,218 @@
+"""
+
+Linux TAP interface for the cocotb testbenches.
+
+Linux apps <-> 192.168.255.1 <-> 192.168.255.2 <-> CocoTB <-> DUT
+
+"""
+
+import fcntl
+import getpass
+import logging
+import os
+import queue
+import selectors
+import struct
+import subprocess
+import threading
+
+import cocotb
+from cocotb.triggers import Event, Timer
+
+from cocotbext.axi import AxiStreamFrame
+
+from .log import FrameLog
+from .pipeline import FrameLengthDriver
+
+
+# based on an old example in CocoTB (which was removed upstream as it was unmaintained)
+# and an slightly updated fix mentioned in a CocoTB issue
+def close_tap(name="tap0"):
+    cmd1 = 'sudo tunctl -d %s' % name
+    print(cmd1)
+    subprocess.run(cmd1, shell=True)
+
+
+# Linux host interface TAP IP is hardcoded as 192.168.255.1 further
+# Linux apps <-> 192.168.255.1 <-> 192.168.255.2 <-> CocoTB <-> DUT
+def create_tap(name="tap0", ip="192.168.255.2"):
+    cocotb.log.info("Attempting to create interface %s (%s)" % (name, ip))
+    TUNSETIFF = 0x400454ca
+    TUNSETOWNER = TUNSETIFF + 2
+    #IFF_TUN = 0x0001
+    IFF_TAP = 0x0002
+    IFF_NO_PI = 0x1000
+    tun = open('/dev/net/tun', 'r+b', buffering=0)
+    tun_num = int(name.split('tap')[-1])
+    cmd1 = 'sudo tunctl -u %s -t %s' % (getpass.getuser(), name)
+    print(cmd1)
+    subprocess.check_call(cmd1, shell=True)
+    subprocess.check_call('sudo ip link set %s up' % (name), shell=True)
+    subprocess.check_call('sudo ip addr add 192.168.255.1 peer %s dev %s' % (ip, name), shell=True)
+
+    while True:
+        try:
+            name = 'tap{}'.format(tun_num)
+            ifr = struct.pack('16sH', name.encode('utf-8'), IFF_TAP | IFF_NO_PI)
+            print('ifr', ifr.hex())
+            cocotb.log.info(name)
+            fcntl.ioctl(tun, TUNSETIFF, ifr)
+            break
+        except IOError as e:
+            # Errno 16 if tun device already exists, otherwise this
+            # failed for different reason.
+            if e.errno != 16:
+                raise e
+
+        tun_num += 1
+    subprocess.check_call('sudo ip link set address aa:bb:cc:22:22:22 dev %s' % name, shell=True)
+    # Prevent ICMP as first packets, forcibly set ARP cache
+    subprocess.check_call('sudo arp -s %s aa:bb:cc:11:11:11' % ip, shell=True)
+
+    fcntl.ioctl(tun, TUNSETOWNER, os.getuid())
+    name = 'tap{}'.format(tun_num)
+    cocotb.log.info("Created interface %s (%s)" % (name, ip))
+    return tun, name
+
+
+class TapBridge(object):
+    """Pass Ethernet frames between a TAP interface and the DUT, in both directions.
+
+    A helper thread waits on the TAP file descriptor with a selector, and
+    exchanges frames with the simulator through two queues. The simulator
+    never does a system call on the TAP interface: frames from the TAP
+    interface are picked up every 'poll' of simulation time and all handed to
+    the AXI Stream source at once, so multiple frames are in flight in the
+    DUT. Frames from the AXI Stream sink are written to the TAP interface by
+    the helper thread.
+
+    If 'length' is given, it is the DUT signal set to the frame length on
+    every frame passed to the source (such as dut.sink_length).
+    """
+
+    def __init__(self, tapfd, source, sink, length=None, log=None, poll=(100, 'ns'), mtu=16 * 1024):
+        self.tapfd = tapfd
+        self.source = source
+        self.sink = sink
+        self.length = FrameLengthDriver(source, length) if length is not None else None
+        self.log = log if log is not None else logging.getLogger("cocotb.tb")
+        self.log_tap2tb = FrameLog(self.log, "TAP to TB")
+        self.log_tb2tap = FrameLog(self.log, "TB to TAP")
+        self.poll = poll
+        self.mtu = mtu
+
+        # frames from TAP to DUT, and from DUT to TAP
+        self.tap2tb = queue.Queue()
+        self.tb2tap = queue.Queue()
+        self.frames_tap2tb = 0
+        self.frames_tb2tap = 0
+        self.frames_dropped = 0
+
+        self._stop = threading.Event()
+        self._wake_r, self._wake_w = os.pipe()
+        self._thread = None
+        self._coroutines = []
+        self._progress = Event()
+
+    def start(self):
+        os.set_blocking(self.tapfd, False)
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        # a daemon thread never keeps the simulator from exiting
+        self._thread = threading.Thread(target=self._run, name="TapBridge", daemon=True)
+        self._thread.start()
+        self._coroutines = [cocotb.start_soon(self._tap_to_tb()), cocotb.start_soon(self._tb_to_tap())]
+
+    def stop(self):
+        for coroutine in self._coroutines:
+            coroutine.kill()
+        self._coroutines = []
+        if self.length is not None:
+            self.length.stop()
+        if self._thread is not None:
+            self._stop.set()
+            self._wake()
+            self._thread.join()
+            self._thread = None
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+        self.log_tap2tb.close()
+        self.log_tb2tap.close()
+
+    async def wait(self, frames=None):
+        """Wait until 'frames' frames passed the bridge in either direction, or forever."""
+        while frames is None or self.frames_tap2tb + self.frames_tb2tap < frames:
+            self._progress.clear()
+            await self._progress.wait()
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, b'\0')
+        except BlockingIOError:
+            # the pipe is full, so the helper thread wakes up anyway
+            pass
+
+    # helper thread, the only place that touches the TAP interface
+    def _run(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self.tapfd, selectors.EVENT_READ)
+        selector.register(self._wake_r, selectors.EVENT_READ)
+        try:
+            while not self._stop.is_set():
+                for key, _ in selector.select():
+                    if key.fd == self.tapfd:
+                        self._read_tap()
+                    else:
+                        self._write_tap()
+        finally:
+            selector.close()
+
+    def _read_tap(self):
+        while True:
+            try:
+                packet = os.read(self.tapfd, self.mtu)
+            except BlockingIOError:
+                return
+            self.tap2tb.put(packet)
+
+    def _write_tap(self):
+        try:
+            os.read(self._wake_r, 4096)
+        except BlockingIOError:
+            pass
+        while True:
+            try:
+                packet = self.tb2tap.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                os.write(self.tapfd, packet)
+            except BlockingIOError:
+                # the kernel drops the frame as well if its queue is full
+                self.frames_dropped += 1
+
+    # simulator side
+    async def _tap_to_tb(self):
+        while True:
+            try:
+                packet = self.tap2tb.get_nowait()
+            except queue.Empty:
+                await Timer(*self.poll)
+                continue
+            self.log_tap2tb(packet)
+            if self.length is not None:
+                self.length.push(len(packet))
+            # does not wait for the frame to be transmitted, only for room in the source queue
+            await self.source.send(AxiStreamFrame(packet))
+            self.frames_tap2tb += 1
+            self._progress.set()
+
+    async def _tb_to_tap(self):
+        while True:
+            rx_frame = await self.sink.recv()
+            packet = bytes(rx_frame.tdata)
+            self.log_tb2tap(packet)
+            self.tb2tap.put(packet)
+            self._wake()
+            self.frames_tb2tap += 1
+            self._progress.set()
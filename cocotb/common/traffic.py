@@ -0,0 +1,339 @@
+"""
+
+Traffic generator for the Blackwire receive path: Ethernet/IPv4/UDP frames
+with WireGuard Type 1 to 4 messages, ARP requests and ICMP echo requests, in
+configurable type and size mixes.
+
+Every frame type and size is a template, built once. Each template owns a
+preallocated buffer of 'batch' rows, filled with copies of the template when
+the generator is created. A batch then only patches the fields that vary per
+frame into the rows it uses, vectorized per template: IPv4 identification
+and header checksum, WireGuard sender and receiver indices, Type 4 counters
+and the ICMP sequence number and checksum, and optionally the FCS. The frames
+of a batch are memoryviews of those rows, valid until the next batch.
+
+Type 4 receiver indices belong to 'sessions' sessions, each with its own
+incrementing counter; a fraction 'replay' of the Type 4 frames repeats an
+older counter, as a replay attack would, and a fraction 'churn' of the
+sessions is rekeyed every batch, with a new receiver index.
+
+    python -m common.traffic --frames 100000 --out imix.pcap
+
+"""
+
+import argparse
+import collections
+
+import numpy as np
+
+from .crc import crc32_batch
+from .stash import IMIX
+
+TYPES = ('type1', 'type2', 'type3', 'type4', 'arp', 'icmp')
+
+# frame type weights, mostly data with some handshakes and network control
+TYPE_MIX = (('type4', 94), ('type1', 1), ('type2', 1), ('type3', 1), ('arp', 2), ('icmp', 1))
+
+# Ethernet frames without FCS are at least this long
+MIN_FRAME_BYTES = 60
+# Ethernet, IPv4 and UDP headers, the UDP payload starts at byte 42
+UDP_PAYLOAD = 42
+# WireGuard message lengths, a Type 4 message has a 16 byte header and 16 byte tag around the padded packet
+TYPE1_BYTES = 148
+TYPE2_BYTES = 92
+TYPE3_BYTES = 64
+TYPE4_OVERHEAD = 32
+
+MAC_DST = bytes.fromhex('020000000001')
+MAC_SRC = bytes.fromhex('020000000002')
+IP_DST = bytes([192, 168, 255, 1])
+IP_SRC = bytes([192, 168, 255, 2])
+WIREGUARD_PORT = 51820
+
+Batch = collections.namedtuple('Batch', 'frames types lengths receivers counters')
+
+# receiver index and counter of a Type 4 frame, little endian
+TYPE4_KEY = slice(UDP_PAYLOAD + 4, UDP_PAYLOAD + 16)
+
+
+def _ipv4(protocol, length):
+    # without checksum, patched per frame
+    return bytes([0x45, 0, length >> 8, length & 0xff, 0, 0, 0x40, 0, 64, protocol, 0, 0]) + IP_SRC + IP_DST
+
+
+def _udp_frame(payload):
+    length = 8 + len(payload)
+    return (MAC_DST + MAC_SRC + b'\x08\x00' + _ipv4(0x11, 20 + length) +
+            WIREGUARD_PORT.to_bytes(2, 'big') + WIREGUARD_PORT.to_bytes(2, 'big') + length.to_bytes(2, 'big') +
+            bytes(2) + payload)
+
+
+def _wireguard(message_type, length, rng):
+    # type, 3 reserved bytes and random content for everything else
+    return bytes([message_type, 0, 0, 0]) + rng.integers(0, 256, length - 4, dtype=np.uint8).tobytes()
+
+
+def _arp():
+    return (b'\xff' * 6 + MAC_SRC + b'\x08\x06' + bytes.fromhex('0001080006040001') + MAC_SRC + IP_SRC +
+            bytes(6) + IP_DST)
+
+
+def _icmp(length):
+    # echo request, identifier 1, sequence patched per frame, incrementing data
+    data = bytes(i & 0xff for i in range(length - UDP_PAYLOAD - 8))
+    return MAC_DST + MAC_SRC + b'\x08\x00' + _ipv4(0x01, length - 14) + bytes([8, 0, 0, 0, 0, 1, 0, 0]) + data
+
+
+def type4_length(frame_bytes):
+    """Length of the Type 4 frame closest to, but at least, 'frame_bytes' that a padded packet gives."""
+    packet = max(frame_bytes - UDP_PAYLOAD - TYPE4_OVERHEAD, 0)
+    return UDP_PAYLOAD + TYPE4_OVERHEAD + -(-packet // 16) * 16
+
+
+def _checksum(words):
+    # ones' complement sum of big endian 16-bit words, per row
+    s = words.sum(axis=1, dtype=np.uint64)
+    s = (s & 0xffff) + (s >> 16)
+    s = (s & 0xffff) + (s >> 16)
+    return (~s & 0xffff).astype(np.uint16)
+
+
+class _Template(object):
+    """One frame type and length, with a buffer of rows that are all a copy of it."""
+
+    def __init__(self, kind, frame, rows, fcs):
+        self.kind = kind
+        self.type = TYPES.index(kind)
+        frame = frame.ljust(MIN_FRAME_BYTES, b'\x00')
+        self.length = len(frame) + (4 if fcs else 0)
+        self.buffer = np.empty((rows, self.length), dtype=np.uint8)
+        self.buffer[:, :len(frame)] = np.frombuffer(frame, dtype=np.uint8)
+        self.view = memoryview(self.buffer.reshape(-1))
+
+
+def _le(values, width):
+    # little endian bytes of integers, (n, width)
+    return np.asarray(values, dtype='<u8').view(np.uint8).reshape(-1, 8)[:, :width]
+
+
+def _be16(values):
+    return np.asarray(values, dtype='>u2').view(np.uint8).reshape(-1, 2)
+
+
+class TrafficGenerator(object):
+    """Frames in a mix of types and sizes, generated a batch at a time.
+
+    'mix' weighs the TYPES, 'sizes' weighs the frame lengths of Type 4 and
+    ICMP frames, as (length, weight) pairs such as the simple IMIX. Type 4
+    lengths round up to what a padded packet gives, see type4_length().
+    Frames are without FCS, as Corundum passes them, unless 'fcs'.
+    """
+
+    def __init__(self, mix=TYPE_MIX, sizes=IMIX, sessions=1024, batch=4096, fcs=False, replay=0.0,
+                 replay_depth=256, churn=0.0, rng=None):
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.batch_size = batch
+        self.fcs = fcs
+        self.replay = replay
+        self.replay_depth = replay_depth
+        self.churn = churn
+        # one receiver index and next counter per session
+        self.receivers = self.rng.choice(1 << 32, size=sessions, replace=False).astype(np.uint64)
+        self.counters = np.zeros(sessions, dtype=np.uint64)
+        self.sequence = 0
+        self.identification = 0
+
+        types = dict(mix)
+        lengths, weights = zip(*sizes)
+        size_p = np.array(weights, dtype=float) / sum(weights)
+        self.templates = []
+        p = []
+        for kind in TYPES:
+            weight = types.get(kind, 0)
+            if not weight:
+                continue
+            if kind in ('type4', 'icmp'):
+                for length, q in zip(lengths, size_p):
+                    if kind == 'type4':
+                        frame = _udp_frame(_wireguard(4, type4_length(length) - UDP_PAYLOAD, self.rng))
+                    else:
+                        frame = _icmp(max(length, UDP_PAYLOAD + 8))
+                    self.templates.append(_Template(kind, frame, batch, fcs))
+                    p.append(weight * q)
+            else:
+                if kind == 'arp':
+                    frame = _arp()
+                else:
+                    size = {'type1': TYPE1_BYTES, 'type2': TYPE2_BYTES, 'type3': TYPE3_BYTES}[kind]
+                    frame = _udp_frame(_wireguard(TYPES.index(kind) + 1, size, self.rng))
+                self.templates.append(_Template(kind, frame, batch, fcs))
+                p.append(weight)
+        if not self.templates:
+            raise ValueError("the type mix has no frame types")
+        self.p = np.array(p) / sum(p)
+
+    def batch(self, n=None):
+        """The next 'n' frames (at most 'batch'), as memoryviews valid until the next call, and their fields.
+
+        Returns a Batch of the frames, their type (index into TYPES), length,
+        and the receiver index and counter of Type 4 frames (0 otherwise).
+        """
+        n = self.batch_size if n is None else n
+        if n > self.batch_size:
+            raise ValueError("at most %d frames per batch, got %d" % (self.batch_size, n))
+        rng = self.rng
+        choice = rng.choice(len(self.templates), size=n, p=self.p)
+        types = np.empty(n, dtype=np.uint8)
+        lengths = np.empty(n, dtype=np.int64)
+        receivers = np.zeros(n, dtype=np.uint64)
+        counters = np.zeros(n, dtype=np.uint64)
+
+        if self.churn:
+            # rekeyed sessions get a new receiver index and start counting again
+            rekeyed = rng.random(len(self.receivers)) < self.churn
+            self.receivers[rekeyed] = rng.integers(0, 1 << 32, int(rekeyed.sum()), dtype=np.uint64)
+            self.counters[rekeyed] = 0
+
+        # the Type 4 frames get their session, receiver and counter in frame order
+        type4 = np.flatnonzero(np.array([t.kind == 'type4' for t in self.templates])[choice])
+        if len(type4):
+            session = rng.integers(0, len(self.receivers), len(type4))
+            order = np.argsort(session, kind='stable')
+            ordered = session[order]
+            starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+            rank = np.arange(len(ordered)) - np.repeat(starts, np.diff(np.r_[starts, len(ordered)]))
+            counter = np.empty(len(type4), dtype=np.uint64)
+            counter[order] = self.counters[ordered] + rank.astype(np.uint64)
+            self.counters += np.bincount(session, minlength=len(self.counters)).astype(np.uint64)
+            if self.replay:
+                replayed = rng.random(len(type4)) < self.replay
+                back = rng.integers(1, self.replay_depth + 1, len(type4)).astype(np.uint64)
+                counter = np.where(replayed, counter - np.minimum(back, counter), counter)
+            receivers[type4] = self.receivers[session]
+            counters[type4] = counter
+
+        frames = [None] * n
+        for k, template in enumerate(self.templates):
+            where = np.flatnonzero(choice == k)
+            if not len(where):
+                continue
+            self._patch(template, where, receivers[where], counters[where])
+            types[where] = template.type
+            lengths[where] = template.length
+            step = template.length
+            view = template.view
+            for row, i in enumerate(where.tolist()):
+                frames[i] = view[row * step:(row + 1) * step]
+        self.identification = (self.identification + n) & 0xffff
+        return Batch(frames, types, lengths, receivers, counters)
+
+    def _patch(self, template, where, receivers, counters):
+        rows = template.buffer[:len(where)]
+        kind = template.kind
+        count = len(where)
+        if kind != 'arp':
+            rows[:, 18:20] = _be16((self.identification + where) & 0xffff)
+            rows[:, 24:26] = 0
+            header = rows[:, 14:34].view('>u2')
+            rows[:, 24:26] = _be16(_checksum(header))
+        if kind == 'type4':
+            rows[:, TYPE4_KEY] = np.concatenate((_le(receivers, 4), _le(counters, 8)), axis=1)
+        elif kind == 'type1':
+            rows[:, 46:50] = _le(self.rng.integers(0, 1 << 32, count, dtype=np.uint64), 4)
+        elif kind == 'type2':
+            rows[:, 46:50] = _le(self.rng.integers(0, 1 << 32, count, dtype=np.uint64), 4)
+            rows[:, 50:54] = _le(self.receivers[self.rng.integers(0, len(self.receivers), count)], 4)
+        elif kind == 'type3':
+            rows[:, 46:50] = _le(self.receivers[self.rng.integers(0, len(self.receivers), count)], 4)
+        elif kind == 'icmp':
+            sequence = (self.sequence + np.arange(count)) & 0xffff
+            self.sequence = (self.sequence + count) & 0xffff
+            rows[:, 40:42] = _be16(sequence)
+            rows[:, 36:38] = 0
+            end = 14 + int(rows[0, 16]) * 256 + int(rows[0, 17])
+            icmp = rows[:, 34:end]
+            if icmp.shape[1] & 1:
+                icmp = np.pad(icmp, ((0, 0), (0, 1)))
+            rows[:, 36:38] = _be16(_checksum(np.ascontiguousarray(icmp).view('>u2')))
+        if self.fcs:
+            length = template.length - 4
+            crc = crc32_batch(rows, np.full(count, length))
+            rows[:, length:] = crc.astype('<u4').view(np.uint8).reshape(-1, 4)
+
+    def __iter__(self):
+        while True:
+            yield from self.batch().frames
+
+    async def send(self, source, frames, limit=64, length=None, batches=None):
+        """Queue 'frames' frames into a cocotbext-axi AxiStreamSource, back-to-back.
+
+        At most 'limit' frames wait in the source queue, so the source never
+        runs dry yet memory stays bounded. 'length' is an optional
+        FrameLengthDriver for the sink_length of the DUT. If 'batches' is a
+        list, every Batch sent is appended to it, without its frames. Returns
+        the types of the frames sent.
+        """
+        source.queue_occupancy_limit_frames = limit
+        types = []
+        while frames > 0:
+            batch = self.batch(min(frames, self.batch_size))
+            for frame in batch.frames:
+                if length is not None:
+                    length.push(len(frame))
+                await source.send(bytearray(frame))
+            types.append(batch.types)
+            if batches is not None:
+                batches.append(batch._replace(frames=None))
+            frames -= len(batch.frames)
+        return np.concatenate(types) if types else np.zeros(0, dtype=np.uint8)
+
+
+def selftest():
+    """Check that frames classify as their type and checksums hold, returns True if all do."""
+    import zlib
+    from .classify import CLASSES, class_of, classify_frames
+    generator = TrafficGenerator(mix=[(t, 1) for t in TYPES], sessions=16, batch=2048, fcs=True, replay=0.1,
+                                 rng=np.random.default_rng(1))
+    batch = generator.batch()
+    frames = [bytes(f) for f in batch.frames]
+    expected = np.array([CLASSES.index('type123') if t < 3 else CLASSES.index(TYPES[t]) for t in batch.types])
+    ok = (class_of(classify_frames([f[:-4] for f in frames])) == expected).all()
+    ok &= all(zlib.crc32(f[:-4]) == int.from_bytes(f[-4:], 'little') for f in frames)
+    for f, t in zip(frames, batch.types):
+        if TYPES[t] != 'arp':
+            words = np.frombuffer(f[14:34], dtype='>u2')
+            ok &= _checksum(words[None, :])[0] == 0
+    return bool(ok)
+
+
+def main(argv=None):
+    from .pcap import PcapWriter
+    parser = argparse.ArgumentParser(description="Generate a mix of WireGuard, ARP and ICMP frames into a pcap.")
+    parser.add_argument("--frames", type=int, default=100000)
+    parser.add_argument("--sessions", type=int, default=1024)
+    parser.add_argument("--replay", type=float, default=0.0, help="fraction of Type 4 frames with an old counter")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="pcap file to write the frames to")
+    args = parser.parse_args(argv)
+
+    generator = TrafficGenerator(sessions=args.sessions, replay=args.replay, rng=np.random.default_rng(args.seed))
+    writer = PcapWriter(args.out) if args.out else None
+    counts = np.zeros(len(TYPES), dtype=np.int64)
+    remaining = args.frames
+    while remaining > 0:
+        batch = generator.batch(min(remaining, generator.batch_size))
+        counts += np.bincount(batch.types, minlength=len(TYPES))
+        if writer is not None:
+            # one frame per microsecond, there is no simulation time
+            for i, frame in enumerate(batch.frames, args.frames - remaining):
+                writer.write(frame, ns=i * 1000)
+        remaining -= len(batch.frames)
+    if writer is not None:
+        writer.close()
+    for kind, count in zip(TYPES, counts):
+        print("%-6s %d" % (kind, count))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
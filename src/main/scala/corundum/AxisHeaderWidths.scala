@@ -0,0 +1,23 @@
+package corundum
+
+import spinal.core._
+
+// AxisExtractHeader and AxisInsertHeader for a range of header widths, for the cocotb testbenches
+// generates build/rtl/AxisExtractHeader_<headerWidthBytes>.v and AxisInsertHeader_<headerWidthBytes>.v
+// sbt "runMain corundum.AxisHeaderWidthsVerilog [headerWidthBytes ...]"
+object AxisHeaderWidthsVerilog {
+  // single byte, within and at the end of the first word, Ethernet, one byte short of the beat
+  // keep in sync with HEADER_WIDTHS in cocotb/common/header.py
+  final val headerWidths = List(1, 2, 7, 8, 14, 15)
+
+  def main(args: Array[String]) {
+    val dataWidth = Config.cryptoDataWidth
+    val widths = if (args.length > 0) args.map(_.toInt).toList else headerWidths
+    for (headerWidthBytes <- widths) {
+      Config.spinal.generateVerilog(new AxisExtractHeader(dataWidth, headerWidthBytes)
+        .setDefinitionName(s"AxisExtractHeader_${headerWidthBytes}"))
+      Config.spinal.generateVerilog(new AxisInsertHeader(dataWidth, headerWidthBytes)
+        .setDefinitionName(s"AxisInsertHeader_${headerWidthBytes}"))
+    }
+  }
+}
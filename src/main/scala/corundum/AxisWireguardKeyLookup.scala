@@ -14,6 +14,9 @@ object AxisWireguardKeyLookup {
   def main(args: Array[String]) {
     val vhdlReport = Config.spinal.generateVhdl(new AxisWireguardKeyLookup(Config.cryptoDataWidth, has_internal_test_lut = true))
     val verilogReport = Config.spinal.generateVerilog(new AxisWireguardKeyLookup(Config.cryptoDataWidth, has_internal_test_lut = true))
+    // with key_in from an external key LUT, for the cocotb testbench
+    Config.spinal.generateVerilog(new AxisWireguardKeyLookup(Config.cryptoDataWidth, has_internal_test_lut = false)
+      .setDefinitionName("AxisWireguardKeyLookupExternal"))
   }
 }
 
@@ -380,4 +380,88 @@ object PreventReplayRFC6479_MN {
       throw new SimSuccess
     }
   }
-}
\ No newline at end of file
+}
+// Replays a binary trace written by src/main/scala/research/RFC6479_Trace.py,
+// the expected drop of every record comes from the Python reference model.
+// ~runMain corundum.PreventReplayMNTraceSim replay_trace.bin
+object PreventReplayMNTraceSim {
+  import java.nio.ByteOrder
+  import java.nio.MappedByteBuffer
+  import java.nio.channels.FileChannel
+
+  // maps the records in segments, as a single mapping is limited to 2 GiB
+  class ReplayTrace(path: String) {
+    val channel = new RandomAccessFile(path, "r").getChannel()
+    val header = channel.map(FileChannel.MapMode.READ_ONLY, 0, 64).order(ByteOrder.LITTLE_ENDIAN)
+    val magic = new Array[Byte](8)
+    header.get(magic)
+    require(new String(magic, "US-ASCII") == "RFC6479T", path + " is not a replay trace")
+    val headerSize   = header.getShort(10).toInt
+    val recordSize   = header.getShort(12).toInt
+    val kind         = header.getShort(14).toInt
+    val n            = header.getInt(20)
+    val m            = header.getInt(24)
+    val counterWidth = header.getShort(28).toInt
+    val numSessions  = header.getInt(32)
+    require(header.getShort(8) == 1 && recordSize == 16, path + " has an unsupported version")
+    require(kind == 0, path + " is not a trace of the M x N block window")
+    val records = (channel.size() - headerSize) / recordSize
+    val segmentRecords = 1 << 24
+    val segments = new Array[MappedByteBuffer](((records + segmentRecords - 1) / segmentRecords).toInt)
+
+    def record(i: Long): MappedByteBuffer = {
+      val segment = (i / segmentRecords).toInt
+      if (segments(segment) == null) {
+        val size = (records - segment.toLong * segmentRecords) min segmentRecords
+        segments(segment) = channel.map(FileChannel.MapMode.READ_ONLY,
+          headerSize + segment.toLong * segmentRecords * recordSize, size * recordSize)
+        segments(segment).order(ByteOrder.LITTLE_ENDIAN)
+      }
+      segments(segment)
+    }
+    def offset(i: Long) = ((i % segmentRecords) * recordSize).toInt
+    def counter(i: Long) = BigInt(java.lang.Long.toUnsignedString(record(i).getLong(offset(i))))
+    def session(i: Long) = record(i).getInt(offset(i) + 8).toLong & 0xffffffffL
+    def drop(i: Long)    = record(i).get(offset(i) + 12) != 0
+  }
+
+  def main(args: Array[String]) {
+    val trace = new ReplayTrace(if (args.length > 0) args(0) else "replay_trace.bin")
+    val sessionIdWidth = log2Up(trace.numSessions max 2)
+    printf("%d records, N = %d, M = %d, %d sessions\n", trace.records, trace.n, trace.m, trace.numSessions)
+    SimConfig.doSim(new PreventReplayMN(sessionIdWidth, trace.counterWidth, trace.n, trace.m, initMem = true)){dut =>
+      dut.clockDomain.forkStimulus(period = 2)
+
+      dut.clockDomain.waitSampling()
+      dut.io.sessionId.assignBigInt(0)
+      dut.io.counter.assignBigInt(0)
+      dut.io.valid #= false
+      dut.io.clear #= false
+
+      // drop is valid two cycles after the counter is presented
+      for(i <- 0L until trace.records + 2){
+
+        if(i < trace.records){
+          dut.io.sessionId.assignBigInt(trace.session(i))
+          dut.io.counter.assignBigInt(trace.counter(i))
+          dut.io.valid #= true
+        } else {
+          dut.io.valid #= false
+        }
+
+        dut.clockDomain.waitRisingEdge()
+        if(i >= 2){
+          val retVal = dut.io.drop.toBoolean
+          if(retVal != trace.drop(i - 2)){
+            printf("record %d session %d counter %s: drop %s, expected %s\n", i - 2,
+              trace.session(i - 2), trace.counter(i - 2).toString, retVal.toString, trace.drop(i - 2).toString)
+            throw new SimFailure("WRONG RESULT")
+          }
+        }
+      }
+
+      dut.clockDomain.waitRisingEdge()
+      throw new SimSuccess
+    }
+  }
+}
@@ -1,19 +1,179 @@
 import random
 import math
 
+import numpy as np
+
+
+class ReplayWindow:
+    """RFC6479 anti-replay window with M blocks of N bits, as in PreventReplayMN.
+
+    The bitmap is a single int of M*N bits. Sliding the window forward clears
+    whole blocks with one mask, instead of clearing bit by bit. The table of
+    all masks has M*(M+1) masks of M*N bits; it is precomputed up to
+    keep_table_bits, beyond that (a W-bit sliding window over 256 bits) each
+    mask is computed when the window slides.
+    validate() returns True if the packet with the given counter must be dropped.
+    validate_batch() does the same for a whole uint64 counter stream, handling
+    runs of strictly increasing counters with vector operations.
+    """
+
+    # the window top is kept as S+1, so that counter 0 is accepted on a fresh window
+    offset = 1
+    # runs shorter than this are cheaper to validate one by one
+    min_run_length = 32
+    # number of counters converted to NumPy at a time, bounds the temporary memory
+    chunk_size = 1 << 20
+    # keep masks per (N, M), shared by all windows
+    _keep_tables = {}
+    # largest keep table, in bits, that is precomputed
+    keep_table_bits = 1 << 25
+
+    def __init__(self, n=64, m=4, counter_width=64):
+        assert n > 0 and (n & (n - 1)) == 0, "N must be a power of two"
+        assert m > 0 and (m & (m - 1)) == 0, "M must be a power of two"
+        self.n = n
+        self.m = m
+        self.counter_width = counter_width
+        self.window_size = (m - 1) * n
+        self.reject_after_messages = (1 << counter_width) - (m - 1) * n - 1
+        self.n_bits = int(math.log2(n))
+        self.ptr_mask = m * n - 1
+        # keep[first][top] keeps all blocks, except the top blocks after block first
+        self.keep = None
+        if m * (m + 1) * m * n <= self.keep_table_bits:
+            if (n, m) not in self._keep_tables:
+                self._keep_tables[(n, m)] = [[self._keep_mask(first, top) for top in range(m + 1)]
+                                             for first in range(m)]
+            self.keep = self._keep_tables[(n, m)]
+        self.clear()
+
+    def _keep_mask(self, first, top):
+        size = self.m * self.n
+        full = (1 << size) - 1
+        if top >= self.m:
+            return 0
+        # clear the top blocks following block first, rotated around the bitmap
+        clear = ((1 << (top * self.n)) - 1) << (((first + 1) % self.m) * self.n)
+        clear = (clear | (clear >> size)) & full
+        return full & ~clear
+
+    def clear(self):
+        self.wt = 0
+        self.bitmap = 0
+
+    def validate(self, counter):
+        # Linux WireGuard: if (their_counter >= REJECT_AFTER_MESSAGES)
+        if counter >= self.reject_after_messages:
+            return True
+        s = counter + self.offset
+        wt = self.wt
+        # New packet. Slide the window, accept the packet
+        if s > wt:
+            top = (s >> self.n_bits) - (wt >> self.n_bits)
+            bitmap = self.bitmap
+            if top >= self.m:
+                bitmap = 0
+            elif top:
+                first = (wt >> self.n_bits) & (self.m - 1)
+                bitmap &= self.keep[first][top] if self.keep is not None else self._keep_mask(first, top)
+            self.bitmap = bitmap | (1 << (s & self.ptr_mask))
+            self.wt = s
+            return False
+        # Too old.
+        if s + self.window_size < wt:
+            return True
+        # S is inside of window. Check and set the bit that S_ptr is pointing to.
+        bit = 1 << (s & self.ptr_mask)
+        if self.bitmap & bit:
+            return True
+        self.bitmap |= bit
+        return False
+
+    def validate_many(self, counters):
+        validate = self.validate
+        return [validate(counter) for counter in counters]
+
+    def _rejected(self, counters):
+        return counters >= np.uint64(self.reject_after_messages)
+
+    def _unpack(self):
+        nbytes = (self.m * self.n + 7) // 8
+        raw = np.frombuffer(self.bitmap.to_bytes(nbytes, 'little'), dtype=np.uint8)
+        return np.unpackbits(raw, bitorder='little')[:self.m * self.n].astype(bool)
+
+    def _pack(self, bits):
+        return int.from_bytes(np.packbits(bits, bitorder='little').tobytes(), 'little')
+
+    def _validate_run(self, counters):
+        # counters is strictly increasing and contains no rejected values
+        s = counters + np.uint64(self.offset)
+        wt = self.wt
+        drops = np.zeros(len(s), dtype=bool)
+        bits = self._unpack()
+        # s[:k] is inside or below the window, s[k:] slides the window forward
+        k = int(np.searchsorted(s, np.uint64(wt), side='right'))
+        if k:
+            old = s[:k]
+            ptr = (old & np.uint64(self.ptr_mask)).astype(np.intp)
+            if wt > self.window_size:
+                too_old = old < np.uint64(wt - self.window_size)
+            else:
+                too_old = np.zeros(k, dtype=bool)
+            drops[:k] = too_old | bits[ptr]
+            bits[ptr[~too_old]] = True
+        if k < len(s):
+            new = s[k:]
+            last = int(new[-1])
+            current = wt >> self.n_bits
+            top = (last >> self.n_bits) - current
+            blocks = bits.reshape(self.m, self.n)
+            if top >= self.m:
+                blocks[:] = False
+            elif top:
+                blocks[((current + 1) % self.m + np.arange(top)) % self.m] = False
+            # only values within the last M blocks survive the later slides
+            if (last >> self.n_bits) >= self.m:
+                new = new[(new >> np.uint64(self.n_bits)) > np.uint64((last >> self.n_bits) - self.m)]
+            bits[(new & np.uint64(self.ptr_mask)).astype(np.intp)] = True
+            self.wt = last
+        self.bitmap = self._pack(bits)
+        return drops
+
+    def _validate_chunk(self, counters, drops):
+        index = np.flatnonzero(~self._rejected(counters))
+        values = counters[index]
+        if len(values) == 0:
+            return
+        # split into runs of strictly increasing counters
+        starts = np.concatenate(([0], np.flatnonzero(values[1:] <= values[:-1]) + 1, [len(values)]))
+        lengths = np.diff(starts)
+        long_runs = np.flatnonzero(lengths >= self.min_run_length)
+        done = 0
+        for run in long_runs.tolist():
+            a, b = int(starts[run]), int(starts[run + 1])
+            if done < a:
+                drops[index[done:a]] = self.validate_many(values[done:a].tolist())
+            drops[index[a:b]] = self._validate_run(values[a:b])
+            done = b
+        if done < len(values):
+            drops[index[done:]] = self.validate_many(values[done:].tolist())
+
+    def validate_batch(self, counters):
+        """Validate a stream of counters, returns the boolean drop vector."""
+        counters = np.asarray(counters, dtype=np.uint64)
+        # rejected counters are dropped and leave the window untouched
+        drops = np.ones(len(counters), dtype=bool)
+        for i in range(0, len(counters), self.chunk_size):
+            self._validate_chunk(counters[i:i + self.chunk_size], drops[i:i + self.chunk_size])
+        return drops
+
+
 def rfc6479():
 
-    W            = 32
     N            = 32
     M            = 4
-    Wt           = 0
-    Wb           = Wt - W + 1
-    NUM_SESSIONS = 8
 
     random.seed(123)
-    memory    = '01111111111111111111111111111111'
-    S_base    = 0
-    variation = 8
     swapped   = list(range(100, 150))
     for _ in range(40):
         index1 = random.randint(0, len(swapped)-1)
@@ -21,71 +181,19 @@ def rfc6479():
         # Swap the elements at the randomly chosen indices
         swapped[index1], swapped[index2] = swapped[index2], swapped[index1]
 
-    values = list(range(50)) + [x for i, x in enumerate(list(range(50, 100))) if i not in random.sample(range(len(list(range(50, 100)))), 20)]  + swapped   
-    for i in values:
-        if i == 118:
-            a = 1
-        if i == 99:
-            b = 1
-        #S = ''.join(random.choice(['0', '1'])for _ in range(64))
-        S = bin(i)[2:].zfill(64) 
-        Wt_ptr = (Wt) & (M * N - 1)
-        Wb_ptr = (Wb) & (M * N - 1)
-
-        if(int(S,2) == 0):       # Start of operations, or wrapped.
-            print("S=", int(S, 2), " DROP = 0")
-            continue
-
-        elif(int(S,2) > Wt):     # New packet. Slide the window, accept the packet
-            Wt = int(S,2)
-            Wb = Wt - W + 1
-            Wt_ptr = (Wt) & (M * N - 1)
-            Wb_ptr = (Wb) & (M * N - 1)
-            #Slide the window and 0-initialize the needed bits.
-            #We find the block of Wt_ptr is pointing to by doing Wt_ptr // N = Wt_ptr >> log2(N)
-            #We find the # of bits to 0-initialize as N - (W_ptr mod N)
-            block_number = (Wt_ptr) >> int(math.log2(N))
-            value_index  = (Wt_ptr) & (N - 1)
-            number_of_bits_to_init = (N) - value_index
-
-            # Update the value to accept this packet
-            updated_list = list(memory)
-            updated_list[Wt_ptr] = '1'
-            
-            if(Wt_ptr > Wb_ptr):
-                for i in range(Wb_ptr,Wt_ptr):
-                    updated_list[i] = '0'
-            else:
-                for i in range(Wb_ptr, len(updated_list)):
-                    updated_list[i] = '0'
-                for i in range(0, Wt_ptr):
-                    updated_list[i] = '0'
-
-            #Clear the bits after Wt until the end of the block.
-            for i in range(1, number_of_bits_to_init):
-                updated_list[block_number * N + value_index + i] = '0' 
-
-            memory = ''.join(updated_list)
-            print("S=", int(S,2), "DROP = 0, WINDOW SLID FORWARD")
-            continue
-
-        elif(int(S,2) + W < Wt): # Too old.
-            print("S=", int(S, 2), "DROP = 1 DUE TO TOO OLD PACKET")
-            continue
+    values = list(range(50)) + [x for i, x in enumerate(list(range(50, 100))) if i not in random.sample(range(len(list(range(50, 100)))), 20)]  + swapped
 
+    window = ReplayWindow(n=N, m=M)
+    for S in values:
+        Wt = window.wt
+        drop = window.validate(S)
+        if S + window.offset > Wt:
+            print("S=", S, "DROP = 0, WINDOW SLID FORWARD")
+        elif S + window.offset + window.window_size < Wt:
+            print("S=", S, "DROP = 1 DUE TO TOO OLD PACKET")
         else:
-            # S is inside of window. Check the bit in memory that S_ptr is pointing to.
-            S_ptr = int(S,2) & (M * N - 1)
-            if(memory[S_ptr] == '0'):
-            # We haven't seen this packet yet. We set the bit in memory, and don't update the window.
-                updated_list = list(memory)
-                updated_list[S_ptr] = '1'
-                memory = ''.join(updated_list)
-                print("S=", int(S, 2), "DROP = 0, INSIDE WINDOW")
-            else:
-            # We've seen this packet already, we drop it, and we don't update the window.
-                print("S=", int(S, 2), "DROP = 1, INSIDE WINDOW")
+            print("S=", S, "DROP = %d, INSIDE WINDOW" % drop)
 
 
-  
-rfc6479()
+if __name__ == "__main__":
+    rfc6479()
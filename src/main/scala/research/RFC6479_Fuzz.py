@@ -0,0 +1,244 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from RFC6479 import ReplayWindow
+from RFC6479_NO_M_N import SlidingWindow
+from RFC6479_Sessions import ReplaySessionTable
+
+# Differential fuzzer for the Python anti-replay models.
+#
+# Every fuzz case is a sequence of counters for one window. A batch of cases is
+# a (cases, length) matrix that all models process in lockstep: per case with
+# the scalar and the batch API, and all cases at once as sessions of a
+# ReplaySessionTable. Every model is compared with an exact, vectorised oracle:
+# a counter is dropped if it is rejected, older than the window, or a repeat.
+#
+# The block window of M x N bits behaves as an exact window of (M-1)*N. The
+# W-bit sliding window behaves as an exact window of W-1, because S + W == Wt
+# maps onto the (always set) bit of Wt itself.
+#
+# validate_batch() only takes its vector path for strictly increasing runs of
+# at least min_run_length counters, and ReplaySessionTable only takes its per
+# session path for sessions with at least min_session_packets packets. Both
+# thresholds are drawn anew for every batch, small values included, and the
+# in-order profiles generate runs of hundreds of counters, so that every path
+# is compared with the oracle.
+
+# step kinds of the generated sequences
+IN_ORDER, SMALL_JUMP, BLOCK_JUMP, HUGE_JUMP, REORDER, DUPLICATE, WRAP, EDGE, REJECT_EDGE = range(9)
+# probabilities of the step kinds per profile, every case follows one profile
+PROFILES = {
+    'mixed': np.array([0.40, 0.10, 0.05, 0.01, 0.20, 0.07, 0.02, 0.148, 0.002]),
+    # runs of about 200 strictly increasing counters
+    'in_order': np.array([0.995, 0, 0, 0, 0.003, 0.002, 0, 0, 0]),
+    'in_order_jumps': np.array([0.965, 0.02, 0.01, 0.001, 0.002, 0.001, 0, 0.001, 0]),
+}
+MIN_RUN_LENGTHS = [1, 2, 3, 8, 32, 128]
+
+
+class Family:
+    """A set of models that must all behave as one exact window."""
+
+    def __init__(self, name, make_window, window, rejected, reject_edge):
+        self.name = name
+        self.make_window = make_window
+        # exact window size, and counters that are always dropped
+        self.window = window
+        self.rejected = rejected
+        self.reject_edge = reject_edge
+        self.min_run_length = ReplayWindow.min_run_length
+        self.min_session_packets = ReplaySessionTable.min_session_packets
+        # counters validated by the vector path of validate_batch()
+        self.run_counters = 0
+        self.models = {
+            'validate': self._scalar,
+            'validate_batch': self._batch,
+            'ReplaySessionTable': self._table,
+        }
+
+    def tune(self, rng, length):
+        """Draw the thresholds of the vector paths for the next batch of cases of 'length' counters."""
+        self.min_run_length = int(rng.choice(MIN_RUN_LENGTHS))
+        self.min_session_packets = int(rng.choice([1, 2, 16, length, length + 1]))
+
+    def describe(self):
+        return "%s min_run_length=%d min_session_packets=%d" % (self.name, self.min_run_length,
+                                                                 self.min_session_packets)
+
+    def _window(self):
+        window = self.make_window()
+        window.min_run_length = self.min_run_length
+        run = window._validate_run
+
+        def counted(counters):
+            self.run_counters += len(counters)
+            return run(counters)
+        window._validate_run = counted
+        return window
+
+    def _scalar(self, cases):
+        return np.array([self.make_window().validate_many(row.tolist()) for row in cases], dtype=bool)
+
+    def _batch(self, cases):
+        return np.array([self._window().validate_batch(row) for row in cases], dtype=bool)
+
+    def _table(self, cases):
+        table = ReplaySessionTable(len(cases), self._window())
+        # above the case length, all cases advance one step at a time; otherwise per session
+        table.min_session_packets = self.min_session_packets
+        sessions = np.tile(np.arange(len(cases)), cases.shape[1])
+        drops = table.validate_batch(sessions, cases.T.ravel())
+        return drops.reshape(cases.shape[1], len(cases)).T
+
+    def oracle(self, cases):
+        rejected = self.rejected(cases)
+        valid = ~rejected
+        # highest valid counter before every position
+        top = np.maximum.accumulate(np.where(valid, cases, np.uint64(0)), axis=1)
+        seen = np.logical_or.accumulate(valid, axis=1)
+        top = np.concatenate((np.zeros((len(cases), 1), np.uint64), top[:, :-1]), axis=1)
+        seen = np.concatenate((np.zeros((len(cases), 1), bool), seen[:, :-1]), axis=1)
+        w = np.uint64(self.window)
+        too_old = seen & (top > w) & (cases < top - w)
+        # repeats of an earlier counter in the same case
+        order = np.argsort(cases, axis=1, kind='stable')
+        ordered = np.take_along_axis(cases, order, axis=1)
+        repeat = np.zeros(cases.shape, dtype=bool)
+        repeat[:, 1:] = ordered[:, 1:] == ordered[:, :-1]
+        repeated = np.empty(cases.shape, dtype=bool)
+        np.put_along_axis(repeated, order, repeat, axis=1)
+        return rejected | too_old | repeated
+
+
+def families(n, m, w):
+    block = ReplayWindow(n, m)
+    return [
+        Family("ReplayWindow(n=%d, m=%d)" % (n, m), lambda: ReplayWindow(n, m), block.window_size,
+               lambda c: c >= np.uint64(block.reject_after_messages), block.reject_after_messages),
+        Family("SlidingWindow(w=%d)" % w, lambda: SlidingWindow(w), w - 1,
+               lambda c: c == 0, 1 << 64),
+    ]
+
+
+def generate_cases(rng, cases, length, window, reject_edge):
+    """Generate adversarial counter sequences around an exact window size, each following a random profile."""
+    shape = (cases, length)
+    profile = rng.integers(0, len(PROFILES), cases)
+    kind = np.empty(shape, dtype=np.int64)
+    for i, p in enumerate(PROFILES.values()):
+        rows = np.flatnonzero(profile == i)
+        kind[rows] = rng.choice(len(p), size=(len(rows), length), p=p / p.sum())
+    steps = np.zeros(shape, dtype=np.uint64)
+    steps[kind == IN_ORDER] = 1
+    steps[kind == SMALL_JUMP] = rng.integers(2, window + 2, np.count_nonzero(kind == SMALL_JUMP))
+    steps[kind == BLOCK_JUMP] = rng.integers(window, 4 * window + 2, np.count_nonzero(kind == BLOCK_JUMP))
+    steps[kind == HUGE_JUMP] = rng.integers(1 << 20, 1 << 40, np.count_nonzero(kind == HUGE_JUMP))
+    top = np.cumsum(steps, axis=1)
+    values = top.copy()
+    # reordered packets arrive up to twice the window behind the newest
+    back = kind == REORDER
+    delta = rng.integers(1, 2 * window + 2, np.count_nonzero(back)).astype(np.uint64)
+    values[back] = np.where(top[back] > delta, top[back] - delta, np.uint64(0))
+    values[kind == WRAP] = 0
+    near = kind == REJECT_EDGE
+    values[near] = np.uint64(reject_edge - 2) + rng.integers(0, 3, np.count_nonzero(near)).astype(np.uint64)
+    # exactly at, just inside and just outside the window edge S + W == Wt
+    edge = kind == EDGE
+    newest = np.maximum.accumulate(values, axis=1)
+    newest = np.concatenate((np.zeros((cases, 1), np.uint64), newest[:, :-1]), axis=1)
+    offset = rng.integers(0, 3, np.count_nonzero(edge)).astype(np.uint64)
+    low = newest[edge] + np.uint64(1) >= np.uint64(window) + offset
+    values[edge] = np.where(low, newest[edge] - np.uint64(window) + np.uint64(1) - offset, values[edge])
+    duplicate = np.flatnonzero((kind == DUPLICATE).ravel()[1:]) + 1
+    duplicate = duplicate[duplicate % length != 0]
+    values.ravel()[duplicate] = values.ravel()[duplicate - 1]
+    return values
+
+
+def divergence(family, model, case):
+    """Index of the first difference between the model and the oracle, or None."""
+    cases = np.asarray(case, dtype=np.uint64)[None, :]
+    diff = np.flatnonzero(family.models[model](cases)[0] != family.oracle(cases)[0])
+    return int(diff[0]) if len(diff) else None
+
+
+def shrink(family, model, case):
+    """Minimise a diverging case by delta debugging, then simplify its values."""
+    case = list(case[:divergence(family, model, case) + 1])
+    chunk = len(case) // 2
+    while chunk >= 1:
+        i = 0
+        while i < len(case):
+            candidate = case[:i] + case[i + chunk:]
+            if candidate and divergence(family, model, candidate) is not None:
+                case = candidate
+            else:
+                i += chunk
+        chunk //= 2
+    # move all counters down by whole bitmaps, keeping their block alignment
+    window = family.make_window()
+    step = window.m * window.n
+    base = (min(case) // step) * step
+    while base:
+        candidate = [c - base if c < family.reject_edge - 4 else c for c in case]
+        if divergence(family, model, candidate) is not None:
+            return candidate
+        base = (base // (2 * step)) * step
+    return case
+
+
+def fuzz(n=64, m=4, w=128, cases=1024, length=256, seed=1, seconds=60.0, models=None, log=print):
+    """Run batches until time runs out or a model diverges.
+
+    Returns None, or (family and thresholds, model name, minimal counter sequence).
+    """
+    rng = np.random.default_rng(seed)
+    start = time.time()
+    total = 0
+    sequences = 0
+    checked = families(n, m, w)
+    while time.time() - start < seconds:
+        for family in checked:
+            family.tune(rng, length)
+            batch = generate_cases(rng, cases, length, family.window, family.reject_edge)
+            expected = family.oracle(batch)
+            for name in models or family.models:
+                drops = family.models[name](batch)
+                bad = np.flatnonzero((drops != expected).any(axis=1))
+                if len(bad):
+                    return family.describe(), name, shrink(family, name, batch[bad[0]].tolist())
+            total += batch.size
+            sequences += len(batch)
+        elapsed = time.time() - start
+        log("%d cases of %d counters in %.1f s, %.0f counters per minute, %d counters through vector runs" %
+            (sequences, length, elapsed, total * 60 / elapsed, sum(f.run_counters for f in checked)))
+    return None
+
+
+def rfc6479_fuzz(argv=None):
+    parser = argparse.ArgumentParser(description="Differential fuzzing of the anti-replay window models.")
+    parser.add_argument("-n", type=int, default=64, help="bits per block N (default 64)")
+    parser.add_argument("-m", type=int, default=4, help="number of blocks M (default 4)")
+    parser.add_argument("-w", "--window", type=int, default=128, help="sliding window size W (default 128)")
+    parser.add_argument("--cases", type=int, default=1024, help="cases per batch (default 1024)")
+    parser.add_argument("--length", type=int, default=256, help="counters per case (default 256)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--seconds", type=float, default=60.0, help="time to fuzz (default 60)")
+    parser.add_argument("--models", nargs="+", choices=['validate', 'validate_batch', 'ReplaySessionTable'],
+                        help="models to check (default all)")
+    args = parser.parse_args(argv)
+
+    found = fuzz(args.n, args.m, args.window, args.cases, args.length, args.seed, args.seconds, args.models)
+    if found is not None:
+        family, model, case = found
+        print("%s %s diverges from the exact window on:" % (family, model), file=sys.stderr)
+        print(case, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(rfc6479_fuzz())
@@ -1,83 +1,169 @@
-import random
-import math
-
-def rfc6479():
-
-    W            = 128
-    N            = 8
-    M            = 4
-    Wt           = 0
-    Wb           = Wt - W + 1
-    NUM_SESSIONS = 8 
-
-    random.seed(123)
-    memory    = ['0']*W
-    S_base    = 0
-    variation = 8
-    swapped   = list(range(100, 150))
-    for _ in range(40):
-        index1 = random.randint(0, len(swapped)-1)
-        index2 = random.randint(0, len(swapped)-1)
-        # Swap the elements at the randomly chosen indices
-        swapped[index1], swapped[index2] = swapped[index2], swapped[index1]
-
-    values = []
-    results = []
-    
-    file = open("/project-on-host/SpinalCorundum/outputs_sw.txt")
-    lines = file.readlines()
-    for line in lines:
-        retvals = line.split(",")
-        values.append(int(retvals[0]))
-        results.append(int(retvals[1]))
-    for j in range(len(values)):
-        i = values[j]
-        check = results[j]
-        if(i == 65390):
-            a=1
-        S = bin(i)[2:].zfill(64) 
-        Wt_ptr = (Wt) & (W - 1)
-        Wb_ptr = (Wb) & (W - 1)
-
-        if(int(S,2) == 0):       # Start of operations, or wrapped.
-            #print("S=", int(S, 2), " DROP = 0 ", memory[::-1])
-            assert(check == 1)
-            continue
-
-        elif(int(S,2) > Wt):     # New packet. Slide the window, accept the packet
-            diff = int(S,2) - Wt
-            
-            #              block +1 , diff times
-            for j in range(Wt+1, int(S,2)):
-                memory[j % W] = '0' 
-
-            Wt = int(S,2)
-            Wt_ptr = (Wt) & (W - 1)
-            memory[Wt_ptr] = '1'
-            #print("S=", int(S,2), "DROP = 0, WINDOW SLIDES FORWARD BY ", diff, " ", memory[::-1])
-            assert(check == 0)
-
-            continue
-
-        elif(int(S,2) + W < Wt): # Too old.
-            #print("S=", int(S, 2), "DROP = 1 DUE TO TOO OLD PACKET ", memory[::-1])
-            assert(check == 1)
-            continue
-
-        else:
-            # S is inside of window. Check the bit in memory that S_ptr is pointing to.
-            S_ptr = int(S,2) % W
-            if(memory[S_ptr] == '0'):
-            # We haven't seen this packet yet. We set the bit in memory, and don't update the window.
-                memory[S_ptr] = '1'
-                #print("S=", int(S, 2), "DROP = 0, INSIDE WINDOW ", memory[::-1])
-                assert(check == 0)
-            else:
-            # We've seen this packet already, we drop it, and we don't update the window.
-                #print("S=", int(S, 2), "DROP = 1, INSIDE WINDOW ", memory[::-1])
-                assert(check == 1)
-
-    #print(values)
-
-  
-rfc6479()
+import argparse
+import sys
+
+import numpy as np
+
+from RFC6479 import ReplayWindow
+
+
+class SlidingWindow(ReplayWindow):
+    """Plain W-bit ring anti-replay window, one bit per counter value.
+
+    This is the ReplayWindow with blocks of a single bit, without the S+1 offset.
+    Counter value 0 (start of operations, or wrapped) is always dropped.
+    """
+
+    offset = 0
+
+    def __init__(self, w=128, counter_width=64):
+        super().__init__(n=1, m=w, counter_width=counter_width)
+        self.window_size = w
+        self.reject_after_messages = 1 << counter_width
+
+    def validate(self, counter):
+        if counter == 0:
+            return True
+        return super().validate(counter)
+
+    def _rejected(self, counters):
+        return counters == 0
+
+
+POW10 = np.array([10 ** i for i in range(20)], dtype=np.uint64)
+
+
+def read_chunks(file, chunk_size=1 << 23):
+    """Read a binary file in bulk, yielding chunks that end on a line boundary."""
+    rest = b''
+    while True:
+        data = file.read(chunk_size)
+        if not data:
+            break
+        data = rest + data
+        end = data.rfind(b'\n') + 1
+        rest = data[end:]
+        if end:
+            yield data[:end]
+    if rest.strip():
+        yield rest + b'\n'
+
+
+def parse_chunk(chunk):
+    """Parse 'counter,drop' lines, returns the line index, counter and drop arrays.
+
+    Blank lines are skipped, any other line that is not a counter of at most
+    2**64 - 1 and a drop of 0 or 1, separated by a comma, raises a ValueError
+    with the line index in the chunk. Spaces are allowed around the numbers.
+    """
+    b = np.frombuffer(chunk, dtype=np.uint8)
+    sep = (b == ord(',')) | (b == ord('\n'))
+    digit = (b >= ord('0')) & (b <= ord('9'))
+    space = (b == ord('\r')) | (b == ord(' '))
+    other = ~(sep | digit | space)
+    # every byte belongs to the field that is terminated by the next separator
+    field = np.cumsum(sep) - sep
+    nfields = int(sep.sum())
+    ndigits = np.bincount(field[digit], minlength=nfields)
+    # the digits of field i are d[start[i]:end[i]]
+    end = np.cumsum(ndigits)
+    start = end - ndigits
+    ends_line = b[sep] == ord('\n')
+    line_of_field = np.cumsum(ends_line) - ends_line
+    fields_per_line = np.bincount(line_of_field, minlength=int(ends_line.sum()))
+    first_field = np.cumsum(fields_per_line) - fields_per_line
+    digits_per_line = np.bincount(line_of_field, weights=ndigits, minlength=len(fields_per_line))
+    # value of every field, sum of its digits times their decimal weight,
+    # fields of more than 20 digits get a wrong value and are rejected below
+    d = (b[digit] - ord('0')).astype(np.uint64)
+    pos = end[field[digit]] - np.arange(len(d)) - 1
+    if len(d) and ndigits.max() > len(POW10):
+        np.minimum(pos, len(POW10) - 1, out=pos)
+    values = np.zeros(nfields, dtype=np.uint64)
+    nonempty = np.flatnonzero(ndigits)
+    if len(d):
+        values[nonempty] = np.add.reduceat(d * POW10[pos], start[nonempty])
+    # a 20 digit value wraps on its leading digit times 10**19, the rest is exact
+    wide = np.flatnonzero(ndigits == len(POW10))
+    lead = d[start[wide]]
+    rest = values[wide] - lead * POW10[-1]
+    overflow = wide[(lead > 1) | ((lead == 1) & (rest > np.uint64((1 << 64) - 1 - 10 ** 19)))]
+    # a space with digits of its field on both sides splits a number
+    s = np.flatnonzero(space)
+    split = field[s]
+    if len(s):
+        before = np.cumsum(digit)[s] - start[split]
+        split = split[(before > 0) & (before < ndigits[split])]
+    broken = line_of_field[np.concatenate((field[other], overflow, split))]
+    blank = (fields_per_line == 1) & (digits_per_line == 0)
+    blank[broken] = False
+    ok = fields_per_line == 2
+    f = first_field[ok]
+    ok[ok] = (ndigits[f] > 0) & (ndigits[f + 1] > 0) & (np.maximum(ndigits[f], ndigits[f + 1]) <= len(POW10)) & \
+        (values[f + 1] <= 1)
+    ok[broken] = False
+    bad = ~(ok | blank)
+    if bad.any():
+        raise ValueError(int(np.flatnonzero(bad)[0]))
+    lines = np.flatnonzero(ok)
+    return lines, values[first_field[lines]], values[first_field[lines] + 1].astype(bool)
+
+
+def parse_lines(chunks):
+    """Yield (line numbers, counters, drops) per chunk, line numbers start at 1."""
+    line = 1
+    for chunk in chunks:
+        try:
+            lines, counters, drops = parse_chunk(chunk)
+        except ValueError as e:
+            raise ValueError("line %d: expected 'counter,drop'" % (line + e.args[0]))
+        yield lines + line, counters, drops
+        line += chunk.count(b'\n')
+
+
+def check_stream(records, window):
+    """Check (line numbers, counters, drops) records against the window model.
+
+    Returns the number of matching records, and (line number, counter, expected drop)
+    of the first mismatch, or None if all records match.
+    """
+    checked = 0
+    for lines, counters, expected in records:
+        drops = window.validate_batch(counters)
+        mismatch = np.flatnonzero(drops != expected)
+        if len(mismatch):
+            i = mismatch[0]
+            return checked + int(i), (int(lines[i]), int(counters[i]), int(expected[i]))
+        checked += len(counters)
+    return checked, None
+
+
+def rfc6479(argv=None):
+    parser = argparse.ArgumentParser(description="Check a 'counter,drop' trace against the W-bit sliding window model.")
+    parser.add_argument("path", nargs="?", default="-", help="trace file, or - for stdin (default)")
+    parser.add_argument("-w", "--window", type=int, default=128, help="window size W (default 128)")
+    args = parser.parse_args(argv)
+
+    window = SlidingWindow(args.window)
+    file = None
+    try:
+        file = sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+        checked, mismatch = check_stream(parse_lines(read_chunks(file)), window)
+    except OSError as e:
+        print("%s: %s" % (args.path, e.strerror or e), file=sys.stderr)
+        return 2
+    except ValueError as e:
+        print("%s: %s" % (args.path, e), file=sys.stderr)
+        return 2
+    finally:
+        if file is not None and file is not sys.stdin.buffer:
+            file.close()
+    if mismatch is not None:
+        print("%s:%d: counter %d expected DROP = %d, after %d matching counters" %
+              ((args.path,) + mismatch + (checked,)), file=sys.stderr)
+        return 1
+    print("%s: %d counters match" % (args.path, checked))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(rfc6479())
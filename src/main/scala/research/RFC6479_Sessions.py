@@ -0,0 +1,150 @@
+import numpy as np
+
+from RFC6479 import ReplayWindow
+
+
+class ReplaySessionTable:
+    """Anti-replay windows for many sessions, indexed by sessionId as in PreventReplayMN.
+
+    All windows live in one contiguous table: a uint64 array with the window top
+    Wt per session, and a 2-D uint8 array with the M*N-bit bitmap per session
+    (bit i in byte i // 8, least significant bit first). The window semantics
+    are taken from a template window, by default ReplayWindow(n=64, m=4).
+    """
+
+    # sessions with at least this many packets in a batch use ReplayWindow.validate_batch()
+    min_session_packets = 256
+    # maximum number of sessions unpacked at a time in the vectorised step
+    step_size = 1 << 16
+
+    def __init__(self, num_sessions, window=None):
+        self.window = window if window is not None else ReplayWindow()
+        self.num_sessions = num_sessions
+        self.bits = self.window.m * self.window.n
+        self.nbytes = (self.bits + 7) // 8
+        self.wt = np.zeros(num_sessions, dtype=np.uint64)
+        self.bitmap = np.zeros((num_sessions, self.nbytes), dtype=np.uint8)
+        self.packets = np.zeros(num_sessions, dtype=np.uint64)
+        self.drops = np.zeros(num_sessions, dtype=np.uint64)
+
+    def clear(self, sessions=None):
+        if sessions is None:
+            sessions = slice(None)
+        self.wt[sessions] = 0
+        self.bitmap[sessions] = 0
+        self.packets[sessions] = 0
+        self.drops[sessions] = 0
+
+    def load(self, session):
+        """Return the window state of a single session as a ReplayWindow."""
+        self.window.wt = int(self.wt[session])
+        self.window.bitmap = int.from_bytes(self.bitmap[session].tobytes(), 'little')
+        return self.window
+
+    def store(self, session):
+        self.wt[session] = self.window.wt
+        self.bitmap[session] = np.frombuffer(self.window.bitmap.to_bytes(self.nbytes, 'little'), dtype=np.uint8)
+
+    def validate(self, session, counter):
+        drop = self.load(session).validate(counter)
+        self.store(session)
+        self.packets[session] += 1
+        self.drops[session] += drop
+        return drop
+
+    def _step(self, sessions, counters):
+        # one packet per session, all sessions are distinct
+        w = self.window
+        s = counters + np.uint64(w.offset)
+        wt = self.wt[sessions]
+        new = s > wt
+        bits = np.unpackbits(self.bitmap[sessions], axis=1, bitorder='little')[:, :self.bits].astype(bool)
+        # slide the window of the new packets, clearing the blocks in (Wt, S]
+        current = wt >> np.uint64(w.n_bits)
+        top = np.minimum((s >> np.uint64(w.n_bits)) - current, np.uint64(w.m)).astype(np.int64)
+        relative = (np.arange(w.m)[None, :] - (current % np.uint64(w.m)).astype(np.int64)[:, None] - 1) % w.m
+        clear = new[:, None] & (relative < np.where(new, top, 0)[:, None])
+        bits.reshape(len(s), w.m, w.n)[clear] = False
+        ptr = (s & np.uint64(w.ptr_mask)).astype(np.intp)
+        rows = np.arange(len(s))
+        lowest = np.where(wt > np.uint64(w.window_size), wt - np.uint64(w.window_size), np.uint64(0))
+        too_old = ~new & (s < lowest)
+        drops = ~new & (too_old | bits[rows, ptr])
+        bits[rows[~too_old], ptr[~too_old]] = True
+        self.wt[sessions] = np.where(new, s, wt)
+        self.bitmap[sessions] = np.packbits(bits, axis=1, bitorder='little')
+        return drops
+
+    def validate_batch(self, sessions, counters):
+        """Validate an interleaved (sessionId, counter) stream, returns the drop vector."""
+        sessions = np.asarray(sessions, dtype=np.intp)
+        counters = np.asarray(counters, dtype=np.uint64)
+        drops = np.ones(len(counters), dtype=bool)
+        index = np.flatnonzero(~self.window._rejected(counters))
+        # group the packets per session, keeping their order within each session
+        index = index[np.argsort(sessions[index], kind='stable')]
+        grouped = sessions[index]
+        starts = np.concatenate(([0], np.flatnonzero(grouped[1:] != grouped[:-1]) + 1, [len(index)]))
+        lengths = np.diff(starts)
+
+        # sessions with many packets in this batch are validated per session
+        for group in np.flatnonzero(lengths >= self.min_session_packets).tolist():
+            a, b = starts[group], starts[group + 1]
+            session = int(grouped[a])
+            drops[index[a:b]] = self.load(session).validate_batch(counters[index[a:b]])
+            self.store(session)
+
+        # the other sessions are validated together, the k-th packet of every session at once
+        small = np.repeat(lengths < self.min_session_packets, lengths)
+        rank = np.arange(len(index)) - np.repeat(starts[:-1], lengths)
+        index, rank = index[small], rank[small]
+        by_rank = np.argsort(rank, kind='stable')
+        index = index[by_rank]
+        bounds = np.searchsorted(rank[by_rank], np.arange(rank.max() + 2 if len(rank) else 1))
+        for r in range(len(bounds) - 1):
+            for a in range(bounds[r], bounds[r + 1], self.step_size):
+                step = index[a:min(a + self.step_size, bounds[r + 1])]
+                drops[step] = self._step(sessions[step], counters[step])
+
+        self.packets += np.bincount(sessions, minlength=self.num_sessions).astype(np.uint64)
+        self.drops += np.bincount(sessions[drops], minlength=self.num_sessions).astype(np.uint64)
+        return drops
+
+    def statistics(self):
+        """Per-session packet and drop counts, for all sessions that received packets."""
+        active = np.flatnonzero(self.packets)
+        stats = np.zeros(len(active), dtype=[('session', np.uint32), ('packets', np.uint64),
+                                              ('drops', np.uint64), ('drop_rate', np.float64)])
+        stats['session'] = active
+        stats['packets'] = self.packets[active]
+        stats['drops'] = self.drops[active]
+        stats['drop_rate'] = self.drops[active] / self.packets[active]
+        return stats
+
+
+def rfc6479_sessions():
+
+    NUM_SESSIONS = 1024
+    PACKETS      = 1000000
+
+    rng = np.random.default_rng(123)
+    # interleave in-order counters of all sessions, with some duplicated packets
+    sessions = rng.integers(0, NUM_SESSIONS, PACKETS)
+    counters = np.zeros(PACKETS, dtype=np.uint64)
+    order = np.argsort(sessions, kind='stable')
+    counts = np.bincount(sessions, minlength=NUM_SESSIONS)
+    counters[order] = np.arange(PACKETS) - np.repeat(np.cumsum(counts) - counts, counts)
+    replayed = rng.random(PACKETS) < 0.01
+    counters[replayed] = np.maximum(counters[replayed], 1) - 1
+
+    table = ReplaySessionTable(NUM_SESSIONS)
+    drops = table.validate_batch(sessions, counters)
+    stats = table.statistics()
+    print("packets", PACKETS, "dropped", int(drops.sum()), "sessions", len(stats))
+    for row in np.sort(stats, order='drop_rate')[-5:][::-1]:
+        print("session", row['session'], "packets", row['packets'], "drops", row['drops'],
+              "drop rate %.4f" % row['drop_rate'])
+
+
+if __name__ == "__main__":
+    rfc6479_sessions()
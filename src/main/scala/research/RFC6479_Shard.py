@@ -0,0 +1,117 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from RFC6479_Sessions import ReplaySessionTable
+from RFC6479_Trace import read_trace, trace_window
+
+# Window state is independent per session, so a multi-session trace is split by
+# session over worker processes. Workers map the trace file themselves and
+# write their drops into a shared vector at the original record positions, so
+# neither the records nor the results are pickled.
+
+
+def assign_shards(sessions_packets, shards):
+    """Assign sessions to shards, balancing the number of packets per shard.
+
+    Sessions are dealt out in order of decreasing packet count, in snake order
+    over the shards. Returns the shard and the index within the shard per session.
+    """
+    order = np.argsort(-sessions_packets, kind='stable')
+    rounds, position = np.divmod(np.arange(len(order)), shards)
+    shard_of = np.empty(len(order), dtype=np.int32)
+    shard_of[order] = np.where(rounds % 2, shards - 1 - position, position)
+    local_of = np.empty(len(order), dtype=np.int64)
+    # index within the shard, in session order
+    by_shard = np.argsort(shard_of, kind='stable')
+    counts = np.bincount(shard_of, minlength=shards)
+    local_of[by_shard] = np.arange(len(order)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return shard_of, local_of.astype(np.int32), counts
+
+
+def _attach(name, dtype, shape):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _run_shard(path, shard, num_local, maps_name, drops_name, chunk_size):
+    header, records = read_trace(path)
+    maps_shm, maps = _attach(maps_name, np.int32, (2, max(header.num_sessions, 1)))
+    drops_shm, drops = _attach(drops_name, bool, (len(records),))
+    try:
+        table = ReplaySessionTable(max(num_local, 1), trace_window(header))
+        for a in range(0, len(records), chunk_size):
+            sessions = records['session'][a:a + chunk_size]
+            mine = np.flatnonzero(maps[0][sessions] == shard)
+            drops[a + mine] = table.validate_batch(maps[1][sessions[mine]], records['counter'][a + mine])
+        return int(table.packets.sum()), int(table.drops.sum())
+    finally:
+        # the views must be released before the shared memory can be closed
+        del maps, drops
+        maps_shm.close()
+        drops_shm.close()
+
+
+def run_sharded(path, workers=None, chunk_size=1 << 22):
+    """Validate a binary replay trace on all cores, returns the drop vector in record order.
+
+    Also returns the number of worker processes used, at most one per session with packets.
+    """
+    workers = workers or os.cpu_count()
+    header, records = read_trace(path)
+    num_sessions = max(header.num_sessions, 1)
+    packets = np.zeros(num_sessions, dtype=np.int64)
+    for a in range(0, len(records), chunk_size):
+        packets += np.bincount(records['session'][a:a + chunk_size], minlength=num_sessions)
+    shards = max(1, min(workers, int(np.count_nonzero(packets))))
+    shard_of, local_of, counts = assign_shards(packets, shards)
+
+    maps_shm = shared_memory.SharedMemory(create=True, size=2 * num_sessions * 4)
+    drops_shm = shared_memory.SharedMemory(create=True, size=max(len(records), 1))
+    maps = np.ndarray((2, num_sessions), dtype=np.int32, buffer=maps_shm.buf)
+    try:
+        maps[0], maps[1] = shard_of, local_of
+        with ProcessPoolExecutor(max_workers=shards) as pool:
+            futures = [pool.submit(_run_shard, path, shard, int(counts[shard]), maps_shm.name,
+                                   drops_shm.name, chunk_size) for shard in range(shards)]
+            for future in futures:
+                future.result()
+        drops = np.ndarray((len(records),), dtype=bool, buffer=drops_shm.buf).copy()
+    finally:
+        del maps
+        maps_shm.close()
+        maps_shm.unlink()
+        drops_shm.close()
+        drops_shm.unlink()
+    return drops, shards
+
+
+def rfc6479_shard(argv=None):
+    parser = argparse.ArgumentParser(description="Check a binary replay trace against the model on all cores.")
+    parser.add_argument("path", help="binary replay trace, see RFC6479_Trace.py")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                        help="number of worker processes (default: number of cores)")
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    drops, shards = run_sharded(args.path, args.workers)
+    elapsed = time.time() - start
+    header, records = read_trace(args.path)
+    mismatch = np.flatnonzero(drops != records['drop'].astype(bool))
+    if len(mismatch):
+        r = records[mismatch[0]]
+        print("%s: record %d session %d counter %d expected DROP = %d" %
+              (args.path, mismatch[0], r['session'], r['counter'], r['drop']), file=sys.stderr)
+        return 1
+    print("%s: %d records match, %d dropped, %.1f s with %d workers" %
+          (args.path, len(records), int(drops.sum()), elapsed, shards))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(rfc6479_shard())
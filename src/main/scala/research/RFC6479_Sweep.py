@@ -0,0 +1,103 @@
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+import sys
+
+import numpy as np
+
+from RFC6479 import ReplayWindow
+
+# Window sizing sweep: runs the M x N block model over a grid of N and M and a
+# set of reorder profiles, reporting the false drop rate (all counters in the
+# stream are unique, so every drop is a false drop) and the memory bits needed
+# per session. Every point is cached on disk under the hash of its parameters.
+
+# bump when the model or the stream generation changes, to invalidate the cache
+SWEEP_VERSION = 1
+
+FIELDS = ['n', 'm', 'window', 'bits_per_session', 'depth', 'rate', 'packets', 'drops', 'false_drop_rate']
+
+
+def reordered(packets, depth, rate, seed):
+    """In-order counters where a fraction 'rate' of packets is delayed by 1 to 'depth' positions.
+
+    This generalises the swapped shuffle of rfc6479(), with a configurable
+    reorder depth and rate.
+    """
+    rng = np.random.default_rng(seed)
+    delay = np.zeros(packets)
+    if depth and rate:
+        late = rng.random(packets) < rate
+        delay[late] = rng.integers(1, depth + 1, np.count_nonzero(late)) + 0.5
+    return np.argsort(np.arange(packets) + delay, kind='stable').astype(np.uint64)
+
+
+def point_key(point):
+    raw = json.dumps(dict(point, version=SWEEP_VERSION), sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def run_point(point):
+    window = ReplayWindow(point['n'], point['m'])
+    drops = int(window.validate_batch(reordered(point['packets'], point['depth'], point['rate'], point['seed'])).sum())
+    return dict(point, window=window.window_size, bits_per_session=window.m * window.n + window.counter_width,
+                drops=drops, false_drop_rate=drops / point['packets'])
+
+
+def sweep(ns, ms, profiles, packets=1000000, seed=123, cache_dir='.rfc6479_sweep', log=None):
+    """Yield the result of every grid point, computing only points missing from the cache."""
+    os.makedirs(cache_dir, exist_ok=True)
+    for n, m, (depth, rate) in itertools.product(ns, ms, profiles):
+        point = dict(n=n, m=m, depth=depth, rate=rate, packets=packets, seed=seed)
+        path = os.path.join(cache_dir, point_key(point) + '.json')
+        if os.path.exists(path):
+            with open(path) as f:
+                yield json.load(f)
+            continue
+        if log:
+            log("computing N=%d M=%d depth=%d rate=%g" % (n, m, depth, rate))
+        result = run_point(point)
+        # write and rename, so an interrupted sweep never leaves a partial point
+        with open(path + '.tmp', 'w') as f:
+            json.dump(result, f)
+        os.replace(path + '.tmp', path)
+        yield result
+
+
+def profile(text):
+    depth, rate = text.split(':')
+    return int(depth), float(rate)
+
+
+def rfc6479_sweep(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep false drop rate and memory over window sizes and reorder profiles.")
+    parser.add_argument("-n", type=int, nargs="+", default=[8, 16, 32, 64], help="bits per block N")
+    parser.add_argument("-m", type=int, nargs="+", default=[2, 4, 8], help="number of blocks M")
+    parser.add_argument("-p", "--profile", type=profile, nargs="+",
+                        default=[(0, 0.0), (16, 0.01), (64, 0.01), (256, 0.05), (1024, 0.1)],
+                        help="reorder profiles as DEPTH:RATE")
+    parser.add_argument("--packets", type=int, default=1000000, help="packets per point (default 1000000)")
+    parser.add_argument("--seed", type=int, default=123)
+    parser.add_argument("--cache", default=".rfc6479_sweep", help="cache directory (default .rfc6479_sweep)")
+    parser.add_argument("-o", "--output", help="CSV output file (default stdout)")
+    args = parser.parse_args(argv)
+
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        writer = csv.DictWriter(out, fieldnames=FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        log = lambda text: print(text, file=sys.stderr)
+        for result in sweep(args.n, args.m, args.profile, args.packets, args.seed, args.cache, log):
+            writer.writerow(result)
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(rfc6479_sweep())
@@ -0,0 +1,184 @@
+import argparse
+import collections
+import os
+import struct
+import sys
+
+import numpy as np
+
+from RFC6479 import ReplayWindow
+from RFC6479_NO_M_N import SlidingWindow, read_chunks, parse_lines
+from RFC6479_Sessions import ReplaySessionTable
+
+# Binary replay trace, shared between the Python models and PreventReplayMNTraceSim.
+#
+# All fields are little-endian. The 64-byte header is followed by fixed-width
+# 16-byte records, the number of records follows from the file size.
+#
+# header: magic "RFC6479T", u16 version, u16 header size, u16 record size,
+#         u16 kind (0 = M blocks of N bits, 1 = W-bit sliding window),
+#         u32 W, u32 N, u32 M, u16 counter width, u16 reserved,
+#         u32 number of sessions (highest session + 1), reserved up to 64 bytes
+# record: u64 counter, u32 session, u8 expected drop, 3 bytes padding
+
+MAGIC = b'RFC6479T'
+VERSION = 1
+HEADER = struct.Struct('<8sHHHHIIIHHI')
+HEADER_SIZE = 64
+KIND_BLOCK = 0
+KIND_SLIDING = 1
+
+RECORD = np.dtype([('counter', '<u8'), ('session', '<u4'), ('drop', 'u1'), ('pad', 'V3')])
+assert RECORD.itemsize == 16
+
+TraceHeader = collections.namedtuple('TraceHeader', 'kind w n m counter_width num_sessions')
+
+
+def trace_header(window, num_sessions=0):
+    kind = KIND_SLIDING if isinstance(window, SlidingWindow) else KIND_BLOCK
+    return TraceHeader(kind, window.window_size, window.n, window.m, window.counter_width, num_sessions)
+
+
+def trace_window(header):
+    """Return a fresh window model with the semantics recorded in the header."""
+    if header.kind == KIND_SLIDING:
+        return SlidingWindow(header.w, header.counter_width)
+    return ReplayWindow(header.n, header.m, header.counter_width)
+
+
+class TraceWriter:
+    """Append (session, counter, drop) records to a binary replay trace."""
+
+    def __init__(self, path, window):
+        self.file = open(path, 'wb')
+        self.header = trace_header(window)
+        self.num_sessions = 0
+        self._write_header()
+
+    def _write_header(self):
+        h = self.header._replace(num_sessions=self.num_sessions)
+        raw = HEADER.pack(MAGIC, VERSION, HEADER_SIZE, RECORD.itemsize, h.kind,
+                          h.w, h.n, h.m, h.counter_width, 0, h.num_sessions)
+        self.file.seek(0)
+        self.file.write(raw.ljust(HEADER_SIZE, b'\0'))
+
+    def write(self, sessions, counters, drops):
+        records = np.zeros(len(counters), dtype=RECORD)
+        records['session'] = sessions
+        records['counter'] = counters
+        records['drop'] = drops
+        if len(records):
+            self.num_sessions = max(self.num_sessions, int(records['session'].max()) + 1)
+        records.tofile(self.file)
+
+    def close(self):
+        if not self.file.closed:
+            self._write_header()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_trace(path):
+    """Return the header and a read-only memmap of the records, without copying."""
+    with open(path, 'rb') as f:
+        raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER.size:
+        raise ValueError("%s: truncated replay trace header" % path)
+    magic, version, header_size, record_size, *fields = HEADER.unpack_from(raw)
+    if magic != MAGIC:
+        raise ValueError("%s: not a replay trace" % path)
+    if version != VERSION or record_size != RECORD.itemsize:
+        raise ValueError("%s: unsupported replay trace version %d" % (path, version))
+    kind, w, n, m, counter_width, _, num_sessions = fields
+    header = TraceHeader(kind, w, n, m, counter_width, num_sessions)
+    count = (os.path.getsize(path) - header_size) // record_size
+    if count == 0:
+        return header, np.zeros(0, dtype=RECORD)
+    return header, np.memmap(path, dtype=RECORD, mode='r', offset=header_size, shape=(count,))
+
+
+def check_trace(path, chunk_size=1 << 22):
+    """Check the expected drops in a trace against the model.
+
+    Returns the index of the first mismatching record, or None if all match.
+    """
+    header, records = read_trace(path)
+    table = ReplaySessionTable(max(header.num_sessions, 1), trace_window(header))
+    for a in range(0, len(records), chunk_size):
+        chunk = records[a:a + chunk_size]
+        drops = table.validate_batch(chunk['session'], chunk['counter'])
+        mismatch = np.flatnonzero(drops != chunk['drop'].astype(bool))
+        if len(mismatch):
+            return a + int(mismatch[0])
+    return None
+
+
+def generate_trace(path, window, num_sessions, packets, seed=123, chunk_size=1 << 22):
+    """Write a random multi-session trace with the expected drops of the model.
+
+    Like PreventReplayRFC6479_MN, counters are random values below 65535, so
+    the stream mixes new, inside window, replayed and too old counters.
+    """
+    rng = np.random.default_rng(seed)
+    table = ReplaySessionTable(num_sessions, window)
+    with TraceWriter(path, window) as writer:
+        for a in range(0, packets, chunk_size):
+            size = min(chunk_size, packets - a)
+            sessions = rng.integers(0, num_sessions, size)
+            counters = rng.integers(0, 65535, size, dtype=np.uint64)
+            writer.write(sessions, counters, table.validate_batch(sessions, counters))
+
+
+def convert_csv(csv_path, path, w=128):
+    """Convert a 'counter,drop' text trace of the sliding window model, as session 0."""
+    file = sys.stdin.buffer if csv_path == '-' else open(csv_path, 'rb')
+    try:
+        with TraceWriter(path, SlidingWindow(w)) as writer:
+            for lines, counters, drops in parse_lines(read_chunks(file)):
+                writer.write(np.zeros(len(counters), dtype=np.uint32), counters, drops)
+    finally:
+        if file is not sys.stdin.buffer:
+            file.close()
+
+
+def rfc6479_trace(argv=None):
+    parser = argparse.ArgumentParser(description="Write, convert and check binary replay traces.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("generate", help="write a random trace with the expected drops of the M x N model")
+    p.add_argument("path")
+    p.add_argument("-n", type=int, default=64, help="bits per block N (default 64)")
+    p.add_argument("-m", type=int, default=4, help="number of blocks M (default 4)")
+    p.add_argument("--sessions", type=int, default=1024, help="number of sessions (default 1024)")
+    p.add_argument("--packets", type=int, default=1000000, help="number of packets (default 1000000)")
+    p.add_argument("--seed", type=int, default=123)
+    p = sub.add_parser("convert", help="convert a 'counter,drop' text trace of the W-bit sliding window model")
+    p.add_argument("csv", help="text trace, or - for stdin")
+    p.add_argument("path")
+    p.add_argument("-w", "--window", type=int, default=128, help="window size W (default 128)")
+    p = sub.add_parser("check", help="check the expected drops in a trace against the model")
+    p.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        generate_trace(args.path, ReplayWindow(args.n, args.m), args.sessions, args.packets, args.seed)
+    elif args.command == "convert":
+        convert_csv(args.csv, args.path, args.window)
+    else:
+        mismatch = check_trace(args.path)
+        header, records = read_trace(args.path)
+        if mismatch is not None:
+            r = records[mismatch]
+            print("%s: record %d session %d counter %d expected DROP = %d" %
+                  (args.path, mismatch, r['session'], r['counter'], r['drop']), file=sys.stderr)
+            return 1
+        print("%s: %d records match" % (args.path, len(records)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(rfc6479_trace())
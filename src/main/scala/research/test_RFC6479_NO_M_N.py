@@ -0,0 +1,55 @@
+import pytest
+
+from RFC6479_NO_M_N import parse_chunk, parse_lines, rfc6479
+
+
+def parse(text):
+    lines, counters, drops = parse_chunk(text.encode())
+    return lines.tolist(), counters.tolist(), drops.tolist()
+
+
+def test_parse():
+    assert parse("1,0\n\n 2 , 1 \r\n") == ([0, 2], [1, 2], [False, True])
+
+
+def test_counter_range():
+    assert parse("18446744073709551615,0\n00000000000000000001,1\n") == \
+        ([0, 1], [(1 << 64) - 1, 1], [False, True])
+
+
+@pytest.mark.parametrize("line", [
+    "abc",                      # junk without a comma is not a blank line
+    "1,0,0",
+    "1,",
+    ",0",
+    "99999999999999999999,0",   # 20 digits beyond 2**64 - 1
+    "18446744073709551616,0",
+    "123456789012345678901,0",
+    "1 2,0",                    # spaces only around a number
+    "1,0 1",
+    "2,7",                      # drop is 0 or 1
+    "1,10",
+])
+def test_parse_rejects(line):
+    with pytest.raises(ValueError) as e:
+        parse_chunk(("1,0\n%s\n2,0\n" % line).encode())
+    assert e.value.args == (1,)
+
+
+def test_parse_lines_numbers():
+    with pytest.raises(ValueError, match="line 5:"):
+        list(parse_lines([b"1,0\n2,0\n", b"3,0\n\nabc\n"]))
+
+
+def test_missing_file(tmp_path, capsys):
+    path = str(tmp_path / "missing.csv")
+    assert rfc6479([path]) == 2
+    assert capsys.readouterr().err == "%s: No such file or directory\n" % path
+
+
+def test_mismatch(tmp_path):
+    path = tmp_path / "trace.csv"
+    path.write_text("1,0\n1,0\n")
+    assert rfc6479([str(path)]) == 1
+    path.write_text("1,0\n1,1\n0,1\n")
+    assert rfc6479([str(path)]) == 0